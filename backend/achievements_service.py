@@ -1,40 +1,42 @@
-from .models import db, Achievement, WorkoutLog
+from .models import db, Achievement, PersonalRecord
 
-def check_for_new_pbs(client_id, new_performance_data):
+def check_for_new_pbs(client_id, exercise_sets):
     """
-    Checks if a new workout log contains any new Personal Bests (PBs)
-    by comparing against historical workout logs in the database.
+    Checks if a newly logged workout contains any new Personal Bests (PBs)
+    by comparing its heaviest completed sets against the client's
+    PersonalRecord index.
+
+    Must be called before update_personal_records folds the same sets
+    into the index.
     """
     newly_unlocked = []
 
-    for exercise_id, sets in new_performance_data.items():
-        # Find the exercise name from the workout log itself if possible, or query
-        # This part might need adjustment depending on how exercise names are stored/passed
-        
-        max_new_weight = 0
-        for s in sets:
-            weight = float(s.get("weight", 0))
-            if weight > max_new_weight:
-                max_new_weight = weight
-        
-        if max_new_weight == 0:
-            continue
-
-        # Query historical max weight for this exercise from WorkoutLog
-        historical_max = db.session.query(db.func.max(db.func.json_extract(WorkoutLog.performance_data, f'$.{exercise_id}[*].weight'))) \
-            .filter(WorkoutLog.client_id == client_id) \
-            .scalar()
-        
-        historical_max_weight = float(historical_max) if historical_max else 0
-                        
-        if max_new_weight > historical_max_weight:
+    max_new_weights = {}
+    for s in exercise_sets:
+        if s.completed and s.weight and s.weight > max_new_weights.get(s.exercise_id, 0):
+            max_new_weights[s.exercise_id] = s.weight
+
+    if not max_new_weights:
+        return newly_unlocked
+
+    # One primary-key lookup for every exercise in the workout
+    historical_max_weights = {
+        record.exercise_id: record.max_weight or 0
+        for record in PersonalRecord.query.filter(
+            PersonalRecord.client_id == client_id,
+            PersonalRecord.exercise_id.in_(list(max_new_weights))
+        )
+    }
+
+    for exercise_id, max_new_weight in max_new_weights.items():
+        if max_new_weight > historical_max_weights.get(exercise_id, 0):
             # This logic assumes we can get the exercise name. 
             # For now, using ID as a placeholder.
             achievement = Achievement(
                 client_id=client_id,
                 type="PB",
                 title=f"New PB for Exercise {exercise_id}",
-                description=f"You lifted {max_new_weight}kg!",
+                description=f"You lifted {max_new_weight:g}kg!",
                 icon="🏋️"
             )
             newly_unlocked.append(achievement)
@@ -51,8 +53,11 @@ def add_achievements_to_client(client_id, achievements):
     for ach in achievements:
         # To avoid duplicates, you might want to check if a similar achievement exists
         # This is simplified; a more robust check might be needed
-        existing = Achievement.query.filter_by(client_id=client_id, title=ach.title).first()
-        if not existing:
+        existing = Achievement.query.filter_by(client_id=client_id, title=ach.title)
+        if ach.type == "PB":
+            # Every new best on an exercise is its own achievement; the description carries the weight
+            existing = existing.filter_by(description=ach.description)
+        if not existing.first():
             db.session.add(ach)
     
     db.session.commit() 
\ No newline at end of file
@@ -11,6 +11,18 @@ migrate = Migrate(render_as_batch=True)
 cache = Cache()
 socketio = SocketIO()
 
+def _socketio_transports(config):
+    """
+    Transports the Socket.IO server accepts. With a message queue the
+    default is WebSocket only: a WebSocket session lives on a single
+    connection, so workers behind a plain round-robin balancer need no
+    sticky sessions, whereas long-polling spreads one session over many
+    requests that must all reach the worker holding it.
+    """
+    if config['SOCKETIO_TRANSPORTS']:
+        return [t.strip() for t in config['SOCKETIO_TRANSPORTS'].split(',') if t.strip()]
+    return ['websocket'] if config['SOCKETIO_MESSAGE_QUEUE'] else ['polling', 'websocket']
+
 def create_app():
     app = Flask(__name__, instance_relative_config=True)
 
@@ -18,7 +30,33 @@ def create_app():
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev'),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
         CACHE_TYPE='SimpleCache',
+        CLIENT_CACHE_SIZE=int(os.environ.get('CLIENT_CACHE_SIZE', 4096)),
+        CLIENT_CACHE_TTL=int(os.environ.get('CLIENT_CACHE_TTL', 300)),
+        CLIENT_CACHE_SYNC_INTERVAL=float(os.environ.get('CLIENT_CACHE_SYNC_INTERVAL', 2)),
+        JOB_WORKERS=int(os.environ.get('JOB_WORKERS', 2)),
+        WORKOUT_SESSION_BACKEND=os.environ.get('WORKOUT_SESSION_BACKEND', 'sql'),  # sql | memory | redis
+        WORKOUT_SESSION_TTL=int(os.environ.get('WORKOUT_SESSION_TTL', 24 * 60 * 60)),
+        WORKOUT_SESSION_REDIS_URL=os.environ.get('WORKOUT_SESSION_REDIS_URL', 'redis://localhost:6379/0'),
+        AUTOSAVE_FLUSH_DELAY=float(os.environ.get('AUTOSAVE_FLUSH_DELAY', 5)),  # seconds idle before writing
+        AUTOSAVE_MAX_UNFLUSHED_AGE=float(os.environ.get('AUTOSAVE_MAX_UNFLUSHED_AGE', 30)),
+        # Disable once `flask migrate-legacy-assignments` has run to skip the JSON fallback entirely
+        LEGACY_JSON_FALLBACK=os.environ.get('LEGACY_JSON_FALLBACK', '1').lower() not in ('0', 'false', 'no'),
+        MESSAGE_WRITE_INTERVAL=float(os.environ.get('MESSAGE_WRITE_INTERVAL', 0.005)),  # seconds to gather a batch
+        MESSAGE_WRITE_BATCH=int(os.environ.get('MESSAGE_WRITE_BATCH', 500)),
+        MESSAGE_ACK_TIMEOUT=float(os.environ.get('MESSAGE_ACK_TIMEOUT', 5)),  # seconds to wait for the commit
+        WORKOUT_FEED_INTERVAL=float(os.environ.get('WORKOUT_FEED_INTERVAL', 0.25)),  # seconds to coalesce pushes
+        WORKOUT_FEED_BATCH=int(os.environ.get('WORKOUT_FEED_BATCH', 200)),
+        PRESENCE_BACKEND=os.environ.get('PRESENCE_BACKEND', 'memory'),  # memory | redis (shared by all workers)
+        PRESENCE_TTL=int(os.environ.get('PRESENCE_TTL', 60)),  # seconds without a heartbeat before going offline
+        # Fan emits out across worker processes through a pub/sub broker, e.g. redis://localhost:6379/0
+        # (any Redis-protocol server), kafka://... or a kombu URL. Unset keeps emits in-process.
+        SOCKETIO_MESSAGE_QUEUE=os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None,
+        SOCKETIO_CHANNEL=os.environ.get('SOCKETIO_CHANNEL', 'ducks-socketio'),
+        SOCKETIO_ASYNC_MODE=os.environ.get('SOCKETIO_ASYNC_MODE', 'eventlet'),
+        SOCKETIO_TRANSPORTS=os.environ.get('SOCKETIO_TRANSPORTS'),  # comma-separated, see _socketio_transports
     )
+    # Presence shares the Socket.IO message queue's Redis unless pointed elsewhere
+    app.config['PRESENCE_REDIS_URL'] = os.environ.get('PRESENCE_REDIS_URL') or app.config['SOCKETIO_MESSAGE_QUEUE']
 
     basedir = os.path.abspath(os.path.dirname(__file__))
     instance_dir = os.path.join(basedir, 'instance')
@@ -36,13 +74,20 @@ def create_app():
          resources={r"/api/*": {
              "origins": allowed_origins,
              "allow_headers": ["Content-Type", "Authorization"],
-             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
+             "methods": ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+             "expose_headers": ["Link", "X-Next-Cursor"]
          }})
-    socketio.init_app(app, cors_allowed_origins=allowed_origins, async_mode='eventlet')
+    socketio.init_app(app,
+                      cors_allowed_origins=allowed_origins,
+                      async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+                      message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'],
+                      channel=app.config['SOCKETIO_CHANNEL'],
+                      transports=_socketio_transports(app.config))
 
     with app.app_context():
         from . import routes
         from . import models
+        from . import commands
 
         return app
 
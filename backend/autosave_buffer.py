@@ -0,0 +1,253 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+
+from .models import db
+from .session_store import merge_patch, session_to_dict
+
+TICK_INTERVAL = 1.0  # seconds between flush checks
+IDLE_EVICT_AFTER = 10 * 60  # seconds a fully flushed entry is kept for version checks
+
+
+def compose_merge_patches(first, second):
+    """
+    Returns one merge patch equivalent to applying `first` then `second`,
+    or None when that cannot be expressed as a single patch (an object
+    patched onto a value that `first` replaced with a non-object).
+    """
+    result = dict(first)
+    for key, value in second.items():
+        previous = result.get(key)
+        if isinstance(value, dict) and key in result:
+            if not isinstance(previous, dict):
+                return None
+            composed = compose_merge_patches(previous, value)
+            if composed is None:
+                return None
+            result[key] = composed
+        else:
+            result[key] = value
+    return result
+
+
+class _Entry:
+    __slots__ = ('version', 'mode', 'payload', 'versioned', 'updated_at', 'first_unflushed', 'last_saved',
+                 'flush_lock')
+
+    def __init__(self, version):
+        self.version = version      # newest accepted version
+        self.mode = None            # None (clean) | 'replace' | 'patch'
+        self.payload = None         # full workout data or a pending merge patch
+        self.versioned = True       # False once a save without a client version is pending
+        self.updated_at = None
+        self.first_unflushed = None  # monotonic time of the oldest unflushed save
+        self.last_saved = time.monotonic()
+        self.flush_lock = threading.Lock()
+
+
+class AutosaveBuffer:
+    """
+    Coalesces workout-session autosaves in memory and writes them to the
+    session store in the background.
+
+    A client's pending state is flushed once it has been idle for
+    `flush_delay` seconds, or once its oldest unflushed save is
+    `max_unflushed_age` seconds old, whichever comes first; `flush()`
+    writes immediately (used when a workout is logged).
+
+    A save that carries a client version is rejected unless it is newer
+    than both the last one accepted here and the one in the store, and the
+    store repeats the check when it is written, so late or reordered
+    requests never overwrite newer progress. A save without a version is
+    written unconditionally: versions handed out by one worker mean
+    nothing to another, so guarding on them would drop acknowledged saves
+    whenever requests alternate between workers. Such saves are ordered by
+    when they are flushed, and the version returned for them is only this
+    worker's latest.
+
+    The buffer is per process, so a crash loses at most the unflushed
+    window.
+    """
+
+    def __init__(self, store, flush_delay=5, max_unflushed_age=30, logger=None):
+        self.store = store
+        self.flush_delay = flush_delay
+        self.max_unflushed_age = max_unflushed_age
+        self.logger = logger
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _entry(self, client_id):
+        with self._lock:
+            entry = self._entries.get(client_id)
+        if entry is None:
+            stored = self.store.get(client_id)
+            with self._lock:
+                entry = self._entries.setdefault(client_id, _Entry(stored['version'] if stored else 0))
+        return entry
+
+    def save(self, client_id, workout_data=None, patch=None, version=None):
+        """
+        Buffers a full replacement (`workout_data`) or a merge `patch`.
+        Returns (accepted, version) where version is the newest accepted one.
+        """
+        entry = self._entry(client_id)
+        if version is not None:
+            # Another worker may have stored a newer version since this entry was loaded
+            stored = self.store.get(client_id)
+            if stored and stored['version'] >= version:
+                with self._lock:
+                    entry.version = max(entry.version, stored['version'])
+                return False, entry.version
+        client_version = version
+        flush_first = False
+        with self._lock:
+            if version is None:
+                version = entry.version + 1
+            elif version <= entry.version:
+                return False, entry.version
+
+            if patch is None:
+                entry.mode, entry.payload = 'replace', workout_data
+            elif entry.mode == 'replace':
+                entry.payload = merge_patch(entry.payload, patch)
+            elif entry.mode == 'patch':
+                composed = compose_merge_patches(entry.payload, patch)
+                if composed is None:
+                    flush_first = True
+                else:
+                    entry.payload = composed
+            else:
+                entry.mode, entry.payload = 'patch', patch
+
+            if not flush_first:
+                now = time.monotonic()
+                entry.version = version
+                entry.versioned = entry.versioned and client_version is not None
+                entry.updated_at = datetime.utcnow()
+                entry.last_saved = now
+                entry.first_unflushed = entry.first_unflushed or now
+
+        if flush_first:
+            # Rare: the pending patch cannot absorb this one, so write it out and start over
+            self.flush(client_id)
+            return self.save(client_id, patch=patch, version=client_version)
+        return True, version
+
+    def get(self, client_id):
+        """Returns the session including any unflushed saves."""
+        with self._lock:
+            entry = self._entries.get(client_id)
+            mode, payload = (entry.mode, entry.payload) if entry else (None, None)
+            if mode:
+                version, updated_at = entry.version, entry.updated_at
+        if mode == 'replace':
+            return session_to_dict(client_id, payload, version, updated_at)
+        stored = self.store.get(client_id)
+        if mode == 'patch':
+            return session_to_dict(client_id, merge_patch(stored['workout_data'] if stored else {}, payload),
+                                   version, updated_at)
+        return stored
+
+    def discard(self, client_id):
+        """Drops unflushed saves for a client (the session is being cleared)."""
+        with self._lock:
+            entry = self._entries.pop(client_id, None)
+        if entry:
+            with entry.flush_lock:
+                pass  # Let an in-flight flush finish so it cannot recreate the session afterwards
+
+    def _take(self, client_id, entry):
+        with self._lock:
+            mode, payload = entry.mode, entry.payload
+            version = entry.version if entry.versioned else None
+            entry.mode = entry.payload = entry.first_unflushed = None
+            entry.versioned = True
+        return mode, payload, version
+
+    def _restore(self, entry, mode, payload, version):
+        """Puts a failed write back in front of anything buffered since."""
+        with self._lock:
+            entry.versioned = entry.versioned and version is not None
+            if entry.mode is None:
+                entry.mode, entry.payload = mode, payload
+            elif entry.mode == 'patch':
+                if mode == 'replace':
+                    entry.mode, entry.payload = 'replace', merge_patch(payload, entry.payload)
+                else:
+                    composed = compose_merge_patches(payload, entry.payload)
+                    if composed is None:
+                        return False
+                    entry.payload = composed
+            entry.first_unflushed = entry.first_unflushed or time.monotonic()
+        return True
+
+    def _flush_entry(self, client_id, entry):
+        with entry.flush_lock:
+            mode, payload, version = self._take(client_id, entry)
+            if mode is None:
+                return False
+            try:
+                if mode == 'replace':
+                    session = self.store.put(client_id, payload, version=version)
+                else:
+                    session = self.store.patch(client_id, payload, version=version)
+                with self._lock:
+                    entry.version = max(entry.version, session['version'])
+                return True
+            except Exception as e:
+                restored = self._restore(entry, mode, payload, version)
+                if self.logger:
+                    self.logger.error(f"Failed to flush workout session for {client_id}: {e}"
+                                      + ("" if restored else " (pending changes dropped)"))
+                raise
+
+    def flush(self, client_id=None):
+        """Writes pending saves now, for one client or for everyone. Returns the number written."""
+        with self._lock:
+            targets = [(client_id, self._entries.get(client_id))] if client_id else list(self._entries.items())
+        return sum(1 for cid, entry in targets if entry and self._flush_entry(cid, entry))
+
+    def flush_due(self):
+        """Flushes idle or too-old entries and evicts long-clean ones; called by the background thread."""
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for client_id, entry in list(self._entries.items()):
+                if entry.mode is None:
+                    if now - entry.last_saved > IDLE_EVICT_AFTER:
+                        del self._entries[client_id]
+                elif (now - entry.last_saved >= self.flush_delay
+                      or now - entry.first_unflushed >= self.max_unflushed_age):
+                    due.append((client_id, entry))
+        flushed = 0
+        for client_id, entry in due:
+            try:
+                flushed += self._flush_entry(client_id, entry)
+            except Exception:
+                pass  # Logged and requeued; retried on the next tick
+        return flushed
+
+    def start(self, app):
+        """Starts the background flusher and flushes everything at interpreter exit."""
+        if self._thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(TICK_INTERVAL)
+                with app.app_context():
+                    try:
+                        self.flush_due()
+                    finally:
+                        db.session.remove()
+
+        def flush_all():
+            with app.app_context():
+                self.flush()
+
+        self._thread = threading.Thread(target=run, name='autosave-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(flush_all)
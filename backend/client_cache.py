@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Lightweight stand-in for a Client row when a route only needs its identity
+ClientRef = namedtuple('ClientRef', ['id', 'unique_url'])
+
+
+class ClientResolutionCache:
+    """
+    Bounded, thread-safe LRU mapping both a client's id and unique_url to
+    its ClientRef. Entries expire after `ttl` seconds.
+
+    `generation` is an optional callable returning a shared counter that
+    writers bump whenever a client is deleted or changed. It is re-read at
+    most every `sync_interval` seconds, and the whole cache is dropped when
+    it moves, so an invalidation in one worker process reaches the others
+    within that interval instead of waiting out the TTL.
+    """
+
+    def __init__(self, maxsize=2048, ttl=300, generation=None, sync_interval=2):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = generation
+        self.sync_interval = sync_interval
+        self._seen_generation = None
+        self._synced_at = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        now = time.monotonic()
+        if self.generation is None or now - self._synced_at < self.sync_interval:
+            return
+        current = self.generation()
+        with self._lock:
+            if current != self._seen_generation:
+                self._entries.clear()
+                self._seen_generation = current
+            self._synced_at = now
+
+    def get(self, identifier):
+        self._sync()
+        with self._lock:
+            entry = self._entries.get(identifier)
+            if entry is None:
+                return None
+            ref, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[identifier]
+                return None
+            self._entries.move_to_end(identifier)
+            return ref
+
+    def put(self, client_id, unique_url):
+        ref = ClientRef(client_id, unique_url)
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key in (client_id, unique_url):
+                self._entries[key] = (ref, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return ref
+
+    def invalidate(self, client_id):
+        """Drops every identifier that resolves to the given client id."""
+        with self._lock:
+            stale = [key for key, (ref, _) in self._entries.items() if ref.id == client_id]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
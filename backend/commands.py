@@ -0,0 +1,198 @@
+from flask import current_app as app
+from datetime import date, datetime
+import json
+import sys
+
+import click
+
+from .models import db, ProgramAssignment, WorkoutTemplate
+from .pagination import PageRequest, DEFAULT_PAGE_SIZE, page_query
+from .performance_service import backfill_exercise_sets, rebuild_personal_records
+from .nutrition_service import backfill_nutrition_totals, daily_totals_query
+from .import_exercises import import_exercises_from_json, DEFAULT_JSON_PATH
+from .exercise_library import invalidate_exercise_library
+from .legacy_json import legacy_template_days
+from .routes import (workout_sessions, resolve_client, legacy_assignments, legacy_templates, client_lookup_query,
+                     workout_history_query, nutrition_logs_query, body_stats_query, messages_query,
+                     progress_photos_query, latest_meal_plan_query, active_assignment_query,
+                     recent_achievements_query, BODY_STAT_KEYS, MESSAGE_HISTORY_KEYS, MESSAGE_SYNC_KEYS,
+                     PROGRESS_PHOTO_KEYS)
+
+
+# --- Maintenance Commands (run with `flask <command>`) ---
+@app.cli.command("backfill-exercise-sets")
+def backfill_exercise_sets_command():
+    """Rebuilds the per-set performance and exercise history tables from existing workout logs."""
+    log_count, set_count = backfill_exercise_sets()
+    print(f"Backfilled {set_count} sets from {log_count} workout logs.")
+
+
+@app.cli.command("rebuild-personal-records")
+def rebuild_personal_records_command():
+    """Recomputes the personal-record index from the per-set performance table."""
+    record_count = rebuild_personal_records()
+    print(f"Rebuilt {record_count} personal records.")
+
+
+@app.cli.command("backfill-nutrition-totals")
+def backfill_nutrition_totals_command():
+    """Rebuilds the daily nutrition rollups from existing nutrition logs."""
+    print(f"Rolled up {backfill_nutrition_totals()} client-days of nutrition logs.")
+
+
+@app.cli.command("import-exercises")
+@click.argument("json_file", required=False, default=DEFAULT_JSON_PATH)
+@click.option("--chunk-size", default=500, show_default=True, help="Rows written per transaction.")
+def import_exercises_command(json_file, chunk_size):
+    """Streams an exercises JSON export into the database (safe to re-run)."""
+    import_exercises_from_json(json_file, chunk_size=chunk_size)
+    invalidate_exercise_library()
+
+
+@app.cli.command("sweep-workout-sessions")
+def sweep_workout_sessions_command():
+    """Deletes expired in-progress workout sessions."""
+    print(f"Removed {workout_sessions.sweep()} expired workout sessions.")
+
+
+def migrate_legacy_assignments(dry_run=False):
+    """
+    Copies legacy JSON templates and assignments into WorkoutTemplate and
+    ProgramAssignment. Legacy templates get the same `exercises` -> `days`
+    normalization the fallback applies at read time. Each client gets the
+    assignment the fallback would have served (the first one in the file),
+    unless it already has an active assignment in the database. Safe to
+    re-run. Returns (template count, assignment count, skipped list).
+    """
+    template_ids = {template_id for (template_id,) in db.session.query(WorkoutTemplate.id)}
+    new_templates = 0
+    for template_data in legacy_templates.records():
+        template_id = template_data.get('id')
+        if not template_id or template_id in template_ids:
+            continue
+        template_ids.add(template_id)
+        db.session.add(WorkoutTemplate(
+            id=template_id,
+            name=template_data.get('name') or 'Legacy Workout',
+            days=json.dumps(legacy_template_days(template_data))
+        ))
+        new_templates += 1
+
+    assignment_ids = {assignment_id for (assignment_id,) in db.session.query(ProgramAssignment.id)}
+    assigned_clients = {client_id for (client_id,) in
+                        db.session.query(ProgramAssignment.client_id).filter(ProgramAssignment.active == True)}
+    new_assignments, skipped = 0, []
+    for legacy in legacy_assignments.records():
+        raw_client_id = legacy.get('client_id') or ''
+        client = resolve_client(raw_client_id) or resolve_client(raw_client_id.replace('/client/', ''))
+        if client is None:
+            skipped.append((legacy.get('id'), "client not found"))
+            continue
+        if client.id in assigned_clients:
+            skipped.append((legacy.get('id'), "client already has an active assignment"))
+            continue
+        if legacy.get('template_id') not in template_ids:
+            skipped.append((legacy.get('id'), "template not found"))
+            continue
+        try:
+            start_date = date.fromisoformat(legacy['date']) if legacy.get('date') else date.today()
+        except ValueError:
+            start_date = date.today()
+        assignment = ProgramAssignment(
+            client_id=client.id,
+            template_id=legacy['template_id'],
+            start_date=start_date,
+            current_day_index=0,
+            active=True
+        )
+        if legacy.get('id') and legacy['id'] not in assignment_ids:
+            assignment.id = legacy['id']
+        db.session.add(assignment)
+        assigned_clients.add(client.id)
+        new_assignments += 1
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    return new_templates, new_assignments, skipped
+
+
+@app.cli.command("migrate-legacy-assignments")
+@click.option("--dry-run", is_flag=True, help="Report what would be migrated without writing anything.")
+def migrate_legacy_assignments_command(dry_run):
+    """Moves workout_assignments.json and workout_templates.json into the database."""
+    template_count, assignment_count, skipped = migrate_legacy_assignments(dry_run=dry_run)
+    for assignment_id, reason in skipped:
+        print(f"Skipped legacy assignment {assignment_id}: {reason}")
+    prefix = "Would migrate" if dry_run else "Migrated"
+    print(f"{prefix} {template_count} templates and {assignment_count} assignments ({len(skipped)} skipped).")
+    if not dry_run:
+        print("Set LEGACY_JSON_FALLBACK=0 to stop consulting the legacy JSON files.")
+
+
+def _sample_page(keys):
+    """A page request past a cursor on `keys`, so the plan includes the keyset range predicate."""
+    samples = {date: date.today().isoformat(), datetime: datetime(2000, 1, 1).isoformat(), int: 0, str: ""}
+    cursor = [samples.get(column.type.python_type) for column, _ in keys]
+    return PageRequest(None, None, cursor, DEFAULT_PAGE_SIZE)
+
+
+def _hot_queries(client_id="__plan__"):
+    """(label, query, expected index) for each client-scoped query, built by the same helpers the routes use."""
+    today = date.today()
+
+    def paged(query, keys):
+        return page_query(query, _sample_page(keys), keys)
+
+    return [
+        ("find_client", client_lookup_query(client_id), None),
+        ("get_workout_history", workout_history_query(client_id), "ix_workout_log_client_id_actual_date"),
+        ("get_nutrition_logs", nutrition_logs_query(client_id, today), "ix_nutrition_log_client_id_log_date"),
+        ("get_nutrition_totals", daily_totals_query(client_id, today, today), None),
+        ("get_body_stats", paged(body_stats_query(client_id), BODY_STAT_KEYS), "ix_body_stat_client_id_date"),
+        ("get_messages", paged(messages_query(client_id), MESSAGE_HISTORY_KEYS), "ix_message_client_id_timestamp"),
+        ("get_messages (after)", paged(messages_query(client_id), MESSAGE_SYNC_KEYS), "ix_message_client_id_position"),
+        ("get_progress_photos", paged(progress_photos_query(client_id), PROGRESS_PHOTO_KEYS),
+         "ix_progress_photo_client_id_timestamp"),
+        ("get_client_meal_plan", latest_meal_plan_query(client_id), "ix_meal_plan_client_id_assigned_date"),
+        ("get_active_program", active_assignment_query(client_id), None),
+        ("get_today (achievements)", recent_achievements_query(client_id, datetime.utcnow()),
+         "ix_achievement_client_id_unlocked_at"),
+    ]
+
+
+def explain_query_plan(query):
+    """Returns SQLite's EXPLAIN QUERY PLAN detail lines for an ORM query."""
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = tuple(compiled.params[name] for name in (compiled.positiontup or []))
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params).fetchall()
+    return [row[-1] for row in rows]
+
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """
+    Fails if a hot client-scoped query stops using its index or needs a
+    temp B-tree to sort: every one of them, keyset pages above all, must
+    come back in index order (SQLite only).
+    """
+    if db.engine.dialect.name != "sqlite":
+        print("Query plan checks only run against SQLite.")
+        return
+
+    failures = 0
+    for label, query, expected_index in _hot_queries():
+        plan = explain_query_plan(query)
+        full_scan = any(line.startswith("SCAN") and "INDEX" not in line for line in plan)
+        missing_index = expected_index and not any(expected_index in line for line in plan)
+        sorted_in_memory = any(line.startswith("USE TEMP B-TREE") for line in plan)
+        status = "FAIL" if full_scan or missing_index or sorted_in_memory else "ok"
+        if status == "FAIL":
+            failures += 1
+        print(f"[{status}] {label}: {' | '.join(plan)}")
+
+    if failures:
+        print(f"{failures} query plan(s) regressed.")
+        sys.exit(1)
@@ -0,0 +1,30 @@
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, SequenceCounter
+
+
+def read_counter(name):
+    """Current value of a named counter, 0 if it was never incremented."""
+    return db.session.query(SequenceCounter.value).filter_by(name=name).scalar() or 0
+
+
+def increment_counter(name, count=1, start=None):
+    """
+    Adds `count` to a named counter inside the current transaction and
+    returns the new value. The row stays write-locked until the caller
+    commits, so values follow commit order. A missing counter is created
+    at `start()` (or 0) plus `count`.
+    """
+    counter = SequenceCounter.__table__
+    bump = counter.update().where(counter.c.name == name).values(value=counter.c.value + count)
+    if db.session.execute(bump).rowcount:
+        return read_counter(name)
+    value = (start() if start else 0) + count
+    try:
+        with db.session.begin_nested():
+            db.session.execute(counter.insert().values(name=name, value=value))
+        return value
+    except IntegrityError:
+        # Another transaction created the counter first
+        db.session.execute(bump)
+        return read_counter(name)
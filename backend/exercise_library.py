@@ -0,0 +1,199 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+from flask import current_app, request
+
+from .app import cache
+from .models import db, Exercise
+from .counters import read_counter, increment_counter
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+VERSION_COUNTER = 'exercise_library'
+VERSION_CHECK_INTERVAL = 5  # seconds a worker trusts its last read of the shared version
+SNAPSHOT_KEY = 'exercise_library_snapshot:{version}'
+
+# Per-process copy of the current snapshot so hot requests skip the cache backend round-trip
+_local_snapshot = {'version': None, 'snapshot': None}
+_version_state = {'version': None, 'checked_at': 0.0}
+_build_lock = threading.Lock()
+
+
+def parse_secondary_muscles(raw):
+    """Secondary muscles are stored as a JSON list, a JSON string or a comma-separated string."""
+    if not raw:
+        return []
+    try:
+        parsed = json.loads(raw)
+        if isinstance(parsed, list):
+            return parsed
+        elif isinstance(parsed, str):
+            return [parsed]
+        return []
+    except json.JSONDecodeError:
+        return [m.strip() for m in raw.split(',') if m.strip()]
+
+
+def exercise_to_dict(exercise):
+    # Determine URL for media - prefer local file if available
+    gif_url = exercise.media_url
+    if exercise.local_media_path:
+        filename = os.path.basename(exercise.local_media_path)
+        gif_url = f"/media/exercises/{urllib.parse.quote(filename)}"
+    
+    instructions_raw = exercise.instructions
+    instructions = []
+    if isinstance(instructions_raw, str):
+        # First replace literal "\\n" with real newlines then attempt JSON parse
+        cleaned = instructions_raw.replace("\\n", "\n")
+        try:
+            parsed = json.loads(cleaned)
+            if isinstance(parsed, list):
+                instructions = [str(step).strip() for step in parsed if str(step).strip()]
+            else:
+                instructions = [str(parsed).strip()]
+        except json.JSONDecodeError:
+            instructions = [step.strip() for step in cleaned.split("\n") if step.strip()]
+    elif isinstance(instructions_raw, list):
+        instructions = [str(step).strip() for step in instructions_raw if str(step).strip()]
+
+    # Parse muscle information
+    muscles = parse_secondary_muscles(exercise.secondaryMuscles)
+
+    # Include target muscle if not already present
+    if exercise.target and exercise.target not in muscles:
+        muscles.append(exercise.target)
+
+    return {
+        "id": exercise.id,
+        "name": exercise.name,
+        "instructions": instructions,
+        "mediaUrl": gif_url,
+        "gifUrl": gif_url,
+        "category": exercise.bodyPart,
+        "equipment": exercise.equipment,
+        "muscles": muscles,
+        "bodyPart": exercise.bodyPart
+    }
+
+
+def _encode(payload):
+    """Serializes a payload once and precomputes every encoding we serve."""
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    representation = {
+        'etag': digest,
+        'identity': body,
+        'gzip': gzip.compress(body, compresslevel=9),
+    }
+    if brotli is not None:
+        representation['br'] = brotli.compress(body, quality=11)
+    return representation
+
+
+def build_exercise_library_snapshot():
+    """Serializes the full exercise library for /api/exercises and /api/exercises/enhanced."""
+    exercises = Exercise.query.order_by(Exercise.name, Exercise.id).all()
+    data = [exercise_to_dict(ex) for ex in exercises]
+
+    muscles_set = set()
+    for ex in data:
+        muscles_set.update(ex["muscles"])
+
+    enhanced = {
+        "exercises": data,
+        "categories": sorted({ex.bodyPart for ex in exercises if ex.bodyPart}),
+        "muscles": sorted(muscles_set),
+        "equipment": sorted({ex.equipment for ex in exercises if ex.equipment})
+    }
+    return {
+        'exercises': _encode(data),
+        'enhanced': _encode(enhanced),
+    }
+
+
+def get_exercise_library_version():
+    """
+    Current library version; anything derived from the library is keyed on
+    it. The version is a counter row in the database, so an invalidation
+    in one worker reaches all of them; each worker re-reads it at most
+    every VERSION_CHECK_INTERVAL seconds.
+    """
+    now = time.monotonic()
+    if _version_state['version'] is None or now - _version_state['checked_at'] >= VERSION_CHECK_INTERVAL:
+        _version_state['version'] = str(read_counter(VERSION_COUNTER))
+        _version_state['checked_at'] = now
+    return _version_state['version']
+
+
+def get_exercise_library_snapshot():
+    """
+    Returns the current snapshot, rebuilding it only when the library
+    version has been bumped by invalidate_exercise_library().
+    """
+    version = get_exercise_library_version()
+    if _local_snapshot['version'] == version:
+        return _local_snapshot['snapshot']
+
+    with _build_lock:
+        version = get_exercise_library_version()
+        if _local_snapshot['version'] == version:
+            return _local_snapshot['snapshot']
+
+        snapshot = cache.get(SNAPSHOT_KEY.format(version=version))
+        if snapshot is None:
+            snapshot = build_exercise_library_snapshot()
+            cache.set(SNAPSHOT_KEY.format(version=version), snapshot, timeout=0)
+        if _local_snapshot['version'] is not None:
+            cache.delete(SNAPSHOT_KEY.format(version=_local_snapshot['version']))
+        _local_snapshot['version'] = version
+        _local_snapshot['snapshot'] = snapshot
+        return snapshot
+
+
+def invalidate_exercise_library():
+    """
+    Marks the library as changed for every worker: this one rebuilds on its
+    next request, the others within VERSION_CHECK_INTERVAL seconds. Call it
+    after the change is committed; it commits the version bump itself.
+    """
+    increment_counter(VERSION_COUNTER)
+    db.session.commit()
+    _version_state['checked_at'] = 0.0
+
+
+def exercise_library_response(name):
+    """
+    Serves one precomputed snapshot representation with a strong ETag,
+    304 revalidation and a pre-compressed body matching Accept-Encoding.
+    """
+    representation = get_exercise_library_snapshot()[name]
+    etag = representation['etag']
+
+    encoding = 'identity'
+    if 'br' in representation and request.accept_encodings['br']:
+        encoding = 'br'
+    elif request.accept_encodings['gzip']:
+        encoding = 'gzip'
+    # Strong validators must differ between encodings of the same content
+    response_etag = etag if encoding == 'identity' else f"{etag}-{encoding}"
+
+    if any(request.if_none_match.contains(tag) for tag in (etag, f"{etag}-gzip", f"{etag}-br")):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(representation[encoding], mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(response_etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,153 @@
+import base64
+import bisect
+import json
+import re
+import threading
+
+from .exercise_library import exercise_to_dict, parse_secondary_muscles, get_exercise_library_version
+from .models import Exercise
+
+FACETS = ('bodyPart', 'equipment', 'target', 'secondaryMuscles')
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def encode_cursor(sort_key):
+    return base64.urlsafe_b64encode(json.dumps(sort_key).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        sort_key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    # Must compare with the (name, id) string sort keys, or bisect raises on a tampered cursor
+    if isinstance(sort_key, list) and len(sort_key) == 2 and all(isinstance(part, str) for part in sort_key):
+        return tuple(sort_key)
+    return None
+
+
+class ExerciseSearchIndex:
+    """
+    In-memory inverted index over the exercise library.
+
+    Documents are stored sorted by (lower-cased name, id), so a document's
+    position doubles as its rank and posting sets can be ordered cheaply.
+    Name tokens support exact and prefix matching; each facet maps a value
+    to the set of positions carrying it.
+    """
+
+    def __init__(self, exercises):
+        rows = sorted(exercises, key=lambda ex: ((ex.name or '').lower(), ex.id))
+        self.docs = [exercise_to_dict(ex) for ex in rows]
+        self.sort_keys = [((ex.name or '').lower(), ex.id) for ex in rows]
+        self.postings = {}
+        self.facets = {facet: {} for facet in FACETS}
+
+        for position, ex in enumerate(rows):
+            for token in set(tokenize(ex.name)):
+                self.postings.setdefault(token, set()).add(position)
+            values = {
+                'bodyPart': [ex.bodyPart],
+                'equipment': [ex.equipment],
+                'target': [ex.target],
+                'secondaryMuscles': parse_secondary_muscles(ex.secondaryMuscles),
+            }
+            for facet, facet_values in values.items():
+                for value in facet_values:
+                    if value:
+                        self.facets[facet].setdefault(value, set()).add(position)
+
+        self.tokens = sorted(self.postings)
+        self.all_positions = frozenset(range(len(self.docs)))
+
+    def _match_term(self, term, prefix):
+        if not prefix:
+            return self.postings.get(term, set())
+        matched = set()
+        start = bisect.bisect_left(self.tokens, term)
+        for token in self.tokens[start:]:
+            if not token.startswith(term):
+                break
+            matched |= self.postings[token]
+        return matched
+
+    def _match_query(self, query, prefix=True):
+        terms = tokenize(query)
+        if not terms:
+            return self.all_positions
+        matched = None
+        for term in terms:
+            positions = self._match_term(term, prefix)
+            matched = positions if matched is None else matched & positions
+            if not matched:
+                return set()
+        return matched
+
+    def _facet_filter(self, facet, selected):
+        positions = set()
+        for value in selected:
+            positions |= self.facets[facet].get(value, set())
+        return positions
+
+    def search(self, query='', filters=None, cursor=None, limit=DEFAULT_PAGE_SIZE, prefix=True):
+        """
+        Returns one page of matches plus disjunctive facet counts: each
+        facet is counted against the query and every *other* facet filter,
+        so selecting a value does not hide its siblings.
+        """
+        filters = {facet: values for facet, values in (filters or {}).items() if facet in FACETS and values}
+        base = self._match_query(query, prefix)
+        facet_sets = {facet: self._facet_filter(facet, values) for facet, values in filters.items()}
+
+        matched = set(base)
+        for positions in facet_sets.values():
+            matched &= positions
+
+        facet_counts = {}
+        for facet in FACETS:
+            scope = set(base)
+            for other, positions in facet_sets.items():
+                if other != facet:
+                    scope &= positions
+            facet_counts[facet] = {
+                value: len(positions & scope)
+                for value, positions in sorted(self.facets[facet].items())
+                if not positions.isdisjoint(scope)
+            }
+
+        ordered = sorted(matched)
+        if cursor is not None:
+            start = bisect.bisect_right(self.sort_keys, cursor)
+            ordered = ordered[bisect.bisect_left(ordered, start):]
+
+        page = ordered[:limit]
+        next_cursor = encode_cursor(self.sort_keys[page[-1]]) if len(ordered) > limit else None
+        return {
+            "items": [self.docs[position] for position in page],
+            "total": len(matched),
+            "next_cursor": next_cursor,
+            "facets": facet_counts
+        }
+
+
+_index_state = {'version': None, 'index': None}
+_index_lock = threading.Lock()
+
+
+def get_exercise_search_index():
+    """Returns the index for the current library version, rebuilding it after a sync or edit."""
+    version = get_exercise_library_version()
+    if _index_state['version'] == version:
+        return _index_state['index']
+    with _index_lock:
+        if _index_state['version'] != version:
+            _index_state['index'] = ExerciseSearchIndex(Exercise.query.all())
+            _index_state['version'] = version
+        return _index_state['index']
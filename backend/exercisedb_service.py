@@ -1,195 +1,306 @@
 import requests
+import hashlib
 import json
-from datetime import datetime, timezone
 import os
-from .models import db, Exercise, Category, Muscle, Equipment
 import pathlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .models import db, Exercise, Category, Muscle, Equipment, ExerciseSyncState, ExerciseSyncRecord
+
 # TODO: For production, store this securely (e.g., environment variable)
-EXERCISEDB_API_KEY = "d609e59cdemshf0bba6158527178p1f3dd5jsn2048dd3f9fa0"
-EXERCISEDB_BASE_URL = "https://exercisedb.p.rapidapi.com"
+EXERCISEDB_API_KEY = os.environ.get("EXERCISEDB_API_KEY", "d609e59cdemshf0bba6158527178p1f3dd5jsn2048dd3f9fa0")
+EXERCISEDB_BASE_URL = os.environ.get("EXERCISEDB_BASE_URL", "https://exercisedb.p.rapidapi.com")
+EXERCISEDB_PAGE_SIZE = 100
+MEDIA_DOWNLOAD_WORKERS = int(os.environ.get("EXERCISEDB_MEDIA_WORKERS", 8))
+MEDIA_DOWNLOAD_TIMEOUT = 20
+SYNC_SOURCE = "exercisedb"
+
+BACKEND_DIR = pathlib.Path(__file__).parent
+MEDIA_ROOT = BACKEND_DIR / 'uploads' / 'exercise_media'
+
 
-def sync_exercises_from_exercisedb():
+def create_http_session(pool_size=MEDIA_DOWNLOAD_WORKERS):
     """
-    Fetches all exercises from the ExerciseDB API, transforms them,
-    and saves them into the database efficiently.
+    Pooled session shared by the page fetcher and the media workers.
+    Idempotent GETs are retried with exponential backoff on connection
+    errors, 429 and 5xx responses.
     """
-    # --- Step 1: Fetch all data from API ---
-    all_exercises_data = []
-    offset = 0
-    limit = 100
+    retry = Retry(
+        total=4,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
+
+def fetch_page(session, offset, page_size=EXERCISEDB_PAGE_SIZE):
+    """Fetches one page of exercises from the ExerciseDB API."""
     headers = {
-        "x-rapidapi-host": "exercisedb.p.rapidapi.com",
+        "x-rapidapi-host": urlparse(EXERCISEDB_BASE_URL).netloc,
         "x-rapidapi-key": EXERCISEDB_API_KEY
     }
-    url = f"{EXERCISEDB_BASE_URL}/exercises"
+    print(f"Fetching exercises with offset: {offset}...")
+    response = session.get(f"{EXERCISEDB_BASE_URL}/exercises", headers=headers,
+                           params={"limit": page_size, "offset": offset}, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
 
-    print("Starting exercise fetch from ExerciseDB API...")
-    while True:
-        params = {"limit": limit, "offset": offset}
+def media_file_path(exercise_id, gif_url):
+    file_ext = pathlib.Path(urlparse(gif_url).path).suffix or '.gif'
+    return MEDIA_ROOT / f"{exercise_id}{file_ext}"
+
+
+def download_media(session, exercise_id, gif_url, force=False):
+    """
+    Downloads one media file unless it is already on disk (or `force` is
+    set because the upstream URL changed). Writes to a temporary file first
+    so an interrupted download never leaves a partial file behind.
+    Returns the path relative to the backend directory, or None.
+    """
+    file_path = media_file_path(exercise_id, gif_url)
+    if force or not file_path.exists():
+        tmp_path = file_path.with_suffix(file_path.suffix + '.part')
         try:
-            print(f"Fetching exercises with offset: {offset}...")
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            batch = response.json()
-
-            if not batch:
-                print("No more exercises to fetch.")
-                break
-            
-            all_exercises_data.extend(batch)
-            offset += len(batch)
-
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching data from ExerciseDB API: {e}")
-            return {"status": "error", "message": f"Failed to fetch data: {e}"}
-
-    print(f"Successfully fetched {len(all_exercises_data)} exercises from API. Processing...")
-
-    # --- Step 2: Process and save data in a single transaction ---
-    
-    # Caches to hold newly created related items (category, muscle, etc.)
-    # to avoid redundant database queries within the loop.
-    category_cache = {}
-    equipment_cache = {}
-    muscle_cache = {}
-
-    media_root = pathlib.Path(__file__).parent / 'uploads' / 'exercise_media'
-    media_root.mkdir(parents=True, exist_ok=True)
-
-    def get_or_create_local(session, model, name, cache):
-        """
-        Local helper to get an object from cache or DB, 
-        or create it without committing.
-        """
+            with session.get(gif_url, stream=True, timeout=MEDIA_DOWNLOAD_TIMEOUT) as resp:
+                resp.raise_for_status()
+                with open(tmp_path, 'wb') as fd:
+                    for chunk in resp.iter_content(chunk_size=65536):
+                        if chunk:
+                            fd.write(chunk)
+            os.replace(tmp_path, file_path)
+        except Exception as dl_e:
+            print(f"Failed to download {gif_url}: {dl_e}")
+            tmp_path.unlink(missing_ok=True)
+            return None
+    return str(file_path.relative_to(BACKEND_DIR))
+
+
+def download_all_media(pool, session, downloads):
+    """
+    Downloads media on a bounded worker pool.
+    `downloads` maps exercise id -> (gif url, force); returns exercise id ->
+    local path, or None where the download failed.
+    """
+    if not downloads:
+        return {}
+    print(f"Downloading media for {len(downloads)} exercises...")
+    MEDIA_ROOT.mkdir(parents=True, exist_ok=True)
+    futures = {
+        exercise_id: pool.submit(download_media, session, exercise_id, gif_url, force)
+        for exercise_id, (gif_url, force) in downloads.items()
+    }
+    return {exercise_id: future.result() for exercise_id, future in futures.items()}
+
+
+def content_hash(ex_data):
+    """Stable hash of an upstream payload, used to skip unchanged exercises."""
+    return hashlib.sha256(json.dumps(ex_data, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def _instructions_json(ex_data):
+    """Instructions are stored as a JSON array of strings."""
+    instructions_data = ex_data.get("instructions", [])
+    if isinstance(instructions_data, str):
+        instructions_data = [instructions_data]
+    return json.dumps([str(step).strip() for step in instructions_data if str(step).strip()])
+
+
+def _media_needs_download(record, gif_url):
+    if not gif_url:
+        return False, False
+    url_changed = record is None or record.media_url != gif_url
+    if url_changed or record.media_status != 'ok':
+        return True, url_changed
+    # Recorded as downloaded, but the file may have been removed from disk
+    return not media_file_path(record.exercise_id, gif_url).exists(), False
+
+
+def sync_page(page, pool, session, lookup_caches):
+    """
+    Diffs one API page against the stored content hashes, downloads only
+    missing or changed media and stages the changed rows in the session.
+    Returns (new_count, updated_count, media_count).
+    """
+    def get_or_create_local(model, name):
         if not name:
             return None
-        if name in cache:
-            return cache[name]
-        
-        instance = session.query(model).filter_by(name=name).first()
-        if instance:
-            cache[name] = instance
-            return instance
-        else:
-            instance = model(name=name)
-            session.add(instance)
-            cache[name] = instance
-            return instance
-
-    synced_count = 0
-    updated_any = False
+        cache = lookup_caches[model]
+        if name not in cache:
+            cache[name] = model(name=name)
+            db.session.add(cache[name])
+        return cache[name]
+
+    by_id = {}
+    for ex_data in page:
+        by_id[f"exr_exercisedb_{ex_data['id']}"] = ex_data  # later duplicates win
+    ids = list(by_id)
+    records = {r.exercise_id: r for r in ExerciseSyncRecord.query.filter(ExerciseSyncRecord.exercise_id.in_(ids))}
+    exercises = {e.id: e for e in Exercise.query.filter(Exercise.id.in_(ids))}
+
+    # --- Media: only what is missing or whose upstream URL changed ---
+    downloads = {}
+    for exercise_id, ex_data in by_id.items():
+        gif_url = (ex_data.get("gifUrl") or "").strip()
+        needed, force = _media_needs_download(records.get(exercise_id), gif_url)
+        if needed:
+            downloads[exercise_id] = (gif_url, force)
+    media_paths = download_all_media(pool, session, downloads)
+
+    new_count = updated_count = 0
+    for exercise_id, ex_data in by_id.items():
+        digest = content_hash(ex_data)
+        gif_url = (ex_data.get("gifUrl") or "").strip()
+        record = records.get(exercise_id)
+        exercise = exercises.get(exercise_id)
+        content_changed = record is None or record.content_hash != digest or exercise is None
+
+        if exercise_id not in downloads and not content_changed:
+            continue
+
+        if record is None:
+            record = ExerciseSyncRecord(exercise_id=exercise_id)
+            db.session.add(record)
+        record.content_hash = digest
+        record.media_url = gif_url
+        record.synced_at = datetime.utcnow()
+        if exercise_id in downloads:
+            record.media_status = 'ok' if media_paths.get(exercise_id) else 'failed'
+        elif not gif_url:
+            record.media_status = 'none'
+
+        if exercise is None:
+            exercise = Exercise(id=exercise_id)
+            db.session.add(exercise)
+            new_count += 1
+        elif content_changed:
+            updated_count += 1
+
+        if content_changed:
+            get_or_create_local(Category, ex_data.get("bodyPart"))
+            get_or_create_local(Equipment, ex_data.get("equipment"))
+            get_or_create_local(Muscle, ex_data.get("target"))
+            for m_name in ex_data.get("secondaryMuscles", []):
+                get_or_create_local(Muscle, m_name)
+
+            exercise.name = ex_data.get("name", "Unknown Exercise")
+            exercise.instructions = _instructions_json(ex_data)
+            exercise.media_url = gif_url
+            exercise.bodyPart = ex_data.get("bodyPart")
+            exercise.target = ex_data.get("target")
+            exercise.equipment = ex_data.get("equipment")
+            exercise.secondaryMuscles = json.dumps(ex_data.get("secondaryMuscles", []))
+        if media_paths.get(exercise_id):
+            exercise.local_media_path = media_paths[exercise_id]
+
+    return new_count, updated_count, len([p for p in media_paths.values() if p])
+
+
+def get_sync_state():
+    state = db.session.get(ExerciseSyncState, SYNC_SOURCE)
+    if state is None:
+        state = ExerciseSyncState(source=SYNC_SOURCE, status='idle', last_offset=0)
+        db.session.add(state)
+    return state
+
+
+def sync_exercises_from_exercisedb(restart=False, progress=None):
+    """
+    Fetches all exercises from the ExerciseDB API, transforms them,
+    and saves them into the database efficiently.
+
+    Each API page is processed as its own short transaction: unchanged
+    exercises are skipped by content hash, only missing or changed media
+    is downloaded (concurrently, on a bounded worker pool), and the page's
+    rows are committed together with the sync checkpoint. A sync that
+    fails part-way resumes from the last committed offset on the next run
+    unless `restart` is set. `progress(fraction, message)` is called after
+    every committed page.
+    """
+    state = get_sync_state()
+    if restart or state.status in ('idle', 'complete'):
+        state.last_offset = 0
+        state.started_at = datetime.utcnow()
+    else:
+        print(f"Resuming interrupted sync from offset {state.last_offset}...")
+    state.status = 'running'
+    state.last_error = None
+    db.session.commit()
+
+    offset = state.last_offset
+    totals = {"new": 0, "updated": 0, "media": 0}
+    lookup_caches = {
+        model: {row.name: row for row in model.query.all()}
+        for model in (Category, Equipment, Muscle)
+    }
+
+    session = create_http_session()
     try:
-        for ex_data in all_exercises_data:
-            exercise_id = f"exr_exercisedb_{ex_data['id']}"
-            
-            # Skip if exercise already exists
-            if existing := db.session.query(Exercise).get(exercise_id):
-                # Update media path if missing
-                if existing.local_media_path is None:
-                    # Attempt to download
-                    gif_url = ex_data.get("gifUrl", "").strip()
-                    local_path = None
-                    if gif_url:
-                        file_ext = pathlib.Path(urlparse(gif_url).path).suffix or '.gif'
-                        filename = f"{exercise_id}{file_ext}"
-                        file_path = media_root / filename
-                        if not file_path.exists():
-                            try:
-                                resp = requests.get(gif_url, stream=True, timeout=20)
-                                resp.raise_for_status()
-                                with open(file_path, 'wb') as fd:
-                                    for chunk in resp.iter_content(chunk_size=8192):
-                                        if chunk:
-                                            fd.write(chunk)
-                            except Exception as dl_e:
-                                print(f"Failed to download {gif_url}: {dl_e}")
-                        if file_path.exists():
-                            local_path = str(file_path.relative_to(pathlib.Path(__file__).parent))
-                    if local_path:
-                        existing.local_media_path = local_path
-                        updated_any = True
-                # Update instructions if they are not stored as JSON array yet
+        with ThreadPoolExecutor(max_workers=MEDIA_DOWNLOAD_WORKERS) as pool:
+            print("Starting exercise fetch from ExerciseDB API...")
+            while True:
+                try:
+                    page = fetch_page(session, offset)
+                except requests.exceptions.RequestException as e:
+                    print(f"Error fetching data from ExerciseDB API: {e}")
+                    return _fail_sync(f"Failed to fetch data: {e}")
+
+                if not page:
+                    print("No more exercises to fetch.")
+                    break
+
                 try:
-                    json.loads(existing.instructions)
-                except Exception:
-                    # Reformat instructions
-                    instructions_data = ex_data.get("instructions", [])
-                    if isinstance(instructions_data, str):
-                        instructions_data = [instructions_data]
-                    existing.instructions = json.dumps([str(step).strip() for step in instructions_data if str(step).strip()])
-                    updated_any = True
-
-                continue
-
-            # Get or create related objects using the local helper
-            category = get_or_create_local(db.session, Category, ex_data.get("bodyPart"), category_cache)
-            equipment = get_or_create_local(db.session, Equipment, ex_data.get("equipment"), equipment_cache)
-            
-            target_muscle = get_or_create_local(db.session, Muscle, ex_data.get("target"), muscle_cache)
-            
-            secondary_muscles = [
-                get_or_create_local(db.session, Muscle, m_name, muscle_cache) 
-                for m_name in ex_data.get("secondaryMuscles", [])
-            ]
-
-            all_muscles = {m for m in [target_muscle] + secondary_muscles if m}
-
-            # Download media
-            local_path = None
-            gif_url = ex_data.get("gifUrl", "").strip()
-            if gif_url:
-                file_ext = pathlib.Path(urlparse(gif_url).path).suffix or '.gif'
-                filename = f"{exercise_id}{file_ext}"
-                file_path = media_root / filename
-                if not file_path.exists():
-                    try:
-                        resp = requests.get(gif_url, stream=True, timeout=20)
-                        resp.raise_for_status()
-                        with open(file_path, 'wb') as fd:
-                            for chunk in resp.iter_content(chunk_size=8192):
-                                if chunk:
-                                    fd.write(chunk)
-                    except Exception as dl_e:
-                        print(f"Failed to download {gif_url}: {dl_e}")
-                if file_path.exists():
-                    local_path = str(file_path.relative_to(pathlib.Path(__file__).parent))
-
-            # Ensure instructions are stored as a JSON array of strings
-            instructions_data = ex_data.get("instructions", [])
-            if isinstance(instructions_data, str):
-                instructions_data = [instructions_data]
-            instructions_str = json.dumps([str(step).strip() for step in instructions_data if str(step).strip()])
-
-            new_exercise = Exercise(
-                id=exercise_id,
-                name=ex_data.get("name", "Unknown Exercise"),
-                instructions=instructions_str,
-                media_url=gif_url,
-                local_media_path=local_path,
-                category=category,
-                equipment=equipment,
-                muscles=list(all_muscles)
-            )
-            db.session.add(new_exercise)
-            synced_count += 1
-        
-        # --- Step 3: Commit the entire transaction ---
-        if synced_count > 0 or updated_any:
-            print(f"Committing changes to the database (new: {synced_count}, updated: {updated_any})...")
-            db.session.commit()
-            print(f"Successfully synced and saved {synced_count} new exercises.")
-            return {"status": "success", "message": f"Synced {synced_count} new exercises. Updated media for existing exercises."}
-        else:
-            print("No new exercises to add or media to update. Database is already up-to-date.")
-            return {"status": "success", "message": "Database is already up-to-date."}
-
-    except Exception as e:
-        db.session.rollback()
-        print(f"An unexpected error occurred during database processing: {e}")
-        return {"status": "error", "message": f"Database processing failed: {e}"}
+                    new_count, updated_count, media_count = sync_page(page, pool, session, lookup_caches)
+                    offset += len(page)
+                    state = get_sync_state()
+                    state.last_offset = offset
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"An unexpected error occurred during database processing: {e}")
+                    return _fail_sync(f"Database processing failed: {e}")
+
+                totals["new"] += new_count
+                totals["updated"] += updated_count
+                totals["media"] += media_count
+                if progress:
+                    # The API does not report a total, so only the offset is known
+                    progress(None, f"Synced {offset} exercises ({totals['new']} new, {totals['updated']} updated)")
+    finally:
+        session.close()
+
+    state = get_sync_state()
+    state.status = 'complete'
+    state.last_offset = 0
+    state.completed_at = datetime.utcnow()
+    db.session.commit()
+
+    if any(totals.values()):
+        print(f"Sync complete (new: {totals['new']}, updated: {totals['updated']}, media: {totals['media']}).")
+        return {"status": "success",
+                "message": f"Synced {totals['new']} new exercises. Updated {totals['updated']} existing exercises "
+                           f"and downloaded {totals['media']} media files."}
+    print("No new exercises to add or media to update. Database is already up-to-date.")
+    return {"status": "success", "message": "Database is already up-to-date."}
+
+
+def _fail_sync(message):
+    state = get_sync_state()
+    state.status = 'failed'
+    state.last_error = message
+    db.session.commit()
+    return {"status": "error", "message": message}
 
 
 if __name__ == '__main__':
@@ -197,4 +308,4 @@ if __name__ == '__main__':
     # from app import app
     # with app.app_context():
     #     sync_exercises_from_exercisedb()
-    print("This script must be run within a Flask application context.") 
\ No newline at end of file
+    print("This script must be run within a Flask application context.")
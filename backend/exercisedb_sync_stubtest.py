@@ -0,0 +1,182 @@
+"""
+Checks the ExerciseDB sync pipeline against a local stub HTTP server.
+
+Serves a fake paged /exercises API and GIF files from this process,
+points the sync at it with a scratch database and a media directory that
+does not exist yet, and checks that:
+
+  - every exercise is stored and every reachable GIF lands on disk;
+  - downloads run concurrently but never above the worker pool size;
+  - transient 503s on pages and media are retried, and a permanent 404
+    marks only that exercise's media as failed;
+  - a second sync downloads nothing, and changing one upstream gifUrl
+    downloads just that file again.
+
+Prints a line per check and exits non-zero if any fails.
+
+    python backend/exercisedb_sync_stubtest.py --exercises 250 --workers 8
+"""
+import argparse
+import http.server
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+BACKEND_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BACKEND_DIR.parent
+GIF_BYTES = b'GIF89a' + b'\x00' * 64
+MISSING_ID = '0003'  # served as a permanent 404
+
+
+class StubExerciseDB(http.server.ThreadingHTTPServer):
+    """Paged exercise list plus media files; the first request for each path answers 503."""
+    daemon_threads = True
+
+    def __init__(self, exercise_count, media_delay=0.02):
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+        self.exercises = [{
+            'id': f"{n:04d}",
+            'name': f"stub exercise {n}",
+            'bodyPart': ('chest', 'back', 'legs')[n % 3],
+            'equipment': ('barbell', 'dumbbell')[n % 2],
+            'target': ('pectorals', 'lats', 'quads')[n % 3],
+            'secondaryMuscles': ['triceps'] if n % 2 else [],
+            'instructions': [f"Step one of {n}", f"Step two of {n}"],
+            'gifUrl': f"{self.url}/media/{n:04d}.gif",
+        } for n in range(exercise_count)]
+        self.media_delay = media_delay
+        self.lock = threading.Lock()
+        self.seen = set()
+        self.media_hits = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.retried = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def first_visit(self, key):
+        with self.lock:
+            if key in self.seen:
+                return False
+            self.seen.add(key)
+            self.retried += 1
+            return True
+
+
+class _StubHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        stub = self.server
+        parsed = urlparse(self.path)
+        if parsed.path == '/exercises':
+            query = parse_qs(parsed.query)
+            offset, limit = int(query['offset'][0]), int(query['limit'][0])
+            if offset == 0 and stub.first_visit(self.path):
+                return self.send_body(503, b'{}', 'application/json')
+            page = stub.exercises[offset:offset + limit]
+            return self.send_body(200, json.dumps(page).encode(), 'application/json')
+        if parsed.path.startswith('/media/'):
+            exercise_id = Path(parsed.path).stem
+            if exercise_id == MISSING_ID:
+                return self.send_body(404, b'', 'text/plain')
+            if int(exercise_id) % 10 == 1 and stub.first_visit(self.path):
+                return self.send_body(503, b'', 'text/plain')
+            with stub.lock:
+                stub.media_hits += 1
+                stub.in_flight += 1
+                stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+            try:
+                time.sleep(stub.media_delay)
+                return self.send_body(200, GIF_BYTES, 'image/gif')
+            finally:
+                with stub.lock:
+                    stub.in_flight -= 1
+        self.send_body(404, b'', 'text/plain')
+
+
+def run(exercises=250, workers=8):
+    stub = StubExerciseDB(exercises)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+    work_dir = tempfile.mkdtemp(prefix='exercisedb-stub-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(work_dir, 'stubtest.db')
+    sys.path.insert(0, str(ROOT_DIR))
+    from backend.app import create_app
+    from backend.models import db, Exercise, ExerciseSyncRecord
+    from backend import exercisedb_service as service
+
+    # A directory that does not exist yet, as on a fresh checkout; it has to sit
+    # under the backend directory because stored media paths are relative to it
+    media_root = BACKEND_DIR / 'uploads' / f"stubtest-{uuid.uuid4().hex[:8]}"
+    service.EXERCISEDB_BASE_URL = stub.url
+    service.MEDIA_ROOT = media_root
+    service.MEDIA_DOWNLOAD_WORKERS = workers
+
+    results = []
+
+    def check(name, ok, detail=''):
+        results.append(ok)
+        print(f"{'ok  ' if ok else 'FAIL'} {name}" + (f" ({detail})" if detail else ''))
+
+    try:
+        with create_app().app_context():
+            db.create_all()
+            started = time.monotonic()
+            outcome = service.sync_exercises_from_exercisedb(restart=True)
+            elapsed = time.monotonic() - started
+            statuses = dict(db.session.query(ExerciseSyncRecord.media_status, db.func.count())
+                            .group_by(ExerciseSyncRecord.media_status).all())
+            files = list(media_root.glob('*.gif')) if media_root.exists() else []
+
+            check('first sync succeeds', outcome['status'] == 'success', outcome['message'])
+            check('every exercise stored', Exercise.query.count() == exercises, f"{Exercise.query.count()}")
+            check('reachable media downloaded', len(files) == exercises - 1 and statuses.get('ok') == exercises - 1,
+                  f"{len(files)} files, statuses {statuses}")
+            check('permanent 404 marked failed', statuses.get('failed') == 1)
+            check('no partial files left', not list(media_root.glob('*.part')))
+            check('downloads ran concurrently within the pool',
+                  1 < stub.max_in_flight <= workers, f"peak {stub.max_in_flight} of {workers}, {elapsed:.2f}s")
+            check('transient 503s retried', stub.retried > 1, f"{stub.retried} retried")
+
+            hits = stub.media_hits
+            outcome = service.sync_exercises_from_exercisedb(restart=True)
+            check('second sync downloads nothing', stub.media_hits == hits, outcome['message'])
+
+            changed = stub.exercises[5]
+            changed['gifUrl'] = changed['gifUrl'].replace('.gif', '.gif?v=2')
+            hits = stub.media_hits
+            service.sync_exercises_from_exercisedb(restart=True)
+            check('changed gifUrl re-downloads only that file', stub.media_hits == hits + 1,
+                  f"{stub.media_hits - hits} downloads")
+    finally:
+        stub.shutdown()
+        shutil.rmtree(media_root, ignore_errors=True)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return all(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--exercises', type=int, default=250)
+    parser.add_argument('--workers', type=int, default=8, help='media download pool size')
+    args = parser.parse_args()
+    sys.exit(0 if run(args.exercises, args.workers) else 1)
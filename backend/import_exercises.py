@@ -1,61 +1,166 @@
 import json
 import os
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.exc import IntegrityError
-
-# Use the app and db from the main application
-from app import app, db, Exercise
-
-def import_exercises_from_json():
-    json_file_path = os.path.join(os.path.dirname(__file__), 'database', 'exercises.json')
-    
-    with app.app_context():
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        exercises_to_add = data.get('exercises', [])
-        print(f"Found {len(exercises_to_add)} exercises in the JSON file.")
-
-        imported_count = 0
-        skipped_count = 0
-
-        for ex_data in exercises_to_add:
-            exercise_id = ex_data.get('id')
-            if not exercise_id:
-                skipped_count += 1
+import sys
+import time
+from pathlib import Path
+
+if __package__ in (None, ''):
+    # Allow running as `python backend/import_exercises.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    __package__ = 'backend'
+
+from .models import db, Exercise
+
+DEFAULT_JSON_PATH = os.path.join(os.path.dirname(__file__), 'database', 'exercises.json')
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(fp, key='exercises', read_size=READ_CHUNK_SIZE):
+    """
+    Incrementally yields the items of a JSON array without loading the whole
+    document. Accepts either a top-level array or an object whose `key`
+    holds the array (the object form assumes `key` appears before any other
+    field containing the same text, which holds for our export files).
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = fp.read(read_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    # --- Locate the opening bracket of the array ---
+    skip_whitespace()
+    if pos < len(buffer) and buffer[pos] == '{':
+        marker = f'"{key}"'
+        while True:
+            found = buffer.find(marker, pos)
+            if found != -1:
+                pos = found + len(marker)
+                break
+            if eof:
+                return
+            pos = max(pos, len(buffer) - len(marker))
+            fill()
+        skip_whitespace()
+        if buffer[pos:pos + 1] != ':':
+            raise ValueError(f"Expected ':' after {marker}")
+        pos += 1
+        skip_whitespace()
+    if buffer[pos:pos + 1] != '[':
+        raise ValueError("Expected a JSON array")
+    pos += 1
+
+    # --- Decode one item at a time ---
+    while True:
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise ValueError("Unexpected end of JSON array")
+        if buffer[pos] == ']':
+            return
+        if buffer[pos] == ',':
+            pos += 1
+            skip_whitespace()
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+        pos = end
+        yield item
+
+
+def exercise_row(ex_data):
+    """Maps one export record onto Exercise columns."""
+    instructions = ex_data.get('instructions')
+    if isinstance(instructions, str):
+        instructions = [step.strip() for step in instructions.replace('\\n', '\n').split('\n') if step.strip()]
+    return {
+        'id': ex_data['id'],
+        'name': ex_data.get('name') or 'Unknown Exercise',
+        'instructions': json.dumps(instructions or []),
+        'media_url': ex_data.get('gifUrl') or None,
+        'bodyPart': ex_data.get('bodyPart'),
+        'target': ex_data.get('target'),
+        'equipment': ex_data.get('equipment'),
+        'secondaryMuscles': json.dumps(ex_data.get('secondaryMuscles') or [])
+    }
+
+
+def import_exercises_from_json(json_file_path=DEFAULT_JSON_PATH, chunk_size=500, progress=None):
+    """
+    Streams exercises from a JSON export into the database with upsert
+    semantics, so it can be re-run safely.
+
+    Existing ids are loaded with a single query; each chunk is then written
+    as one executemany INSERT for new rows and one for updates, inside its
+    own transaction. Returns a summary with counts and throughput.
+    """
+    started = time.perf_counter()
+    existing_ids = {exercise_id for (exercise_id,) in db.session.query(Exercise.id)}
+    total_bytes = os.path.getsize(json_file_path)
+
+    counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    seen_ids = set()
+
+    def flush(inserts, updates):
+        if inserts:
+            db.session.bulk_insert_mappings(Exercise, inserts)
+        if updates:
+            db.session.bulk_update_mappings(Exercise, updates)
+        db.session.commit()
+        counts['inserted'] += len(inserts)
+        counts['updated'] += len(updates)
+
+    with open(json_file_path, 'r', encoding='utf-8') as f:
+        inserts, updates = [], []
+        for ex_data in iter_json_array(f):
+            if not isinstance(ex_data, dict) or not ex_data.get('id') or ex_data['id'] in seen_ids:
+                counts['skipped'] += 1
                 continue
+            seen_ids.add(ex_data['id'])
+            row = exercise_row(ex_data)
+            (updates if row['id'] in existing_ids else inserts).append(row)
 
-            existing_exercise = db.session.get(Exercise, exercise_id)
-            if existing_exercise:
-                # Update existing record
-                existing_exercise.name = ex_data.get('name')
-                existing_exercise.instructions = ex_data.get('instructions')
-                existing_exercise.media_url = ex_data.get('gifUrl')
-            else:
-                # Create new record
-                new_exercise = Exercise(
-                    id=exercise_id,
-                    name=ex_data.get('name'),
-                    instructions=ex_data.get('instructions'),
-                    media_url=ex_data.get('gifUrl')
-                )
-                db.session.add(new_exercise)
-            
-            imported_count += 1
-
-        try:
-            db.session.commit()
-            print(f"Successfully imported/updated {imported_count} exercises.")
-            if skipped_count > 0:
-                print(f"Skipped {skipped_count} entries due to missing ID.")
-        except IntegrityError as e:
-            db.session.rollback()
-            print(f"An error occurred during import: {e}")
-        except Exception as e:
-            db.session.rollback()
-            print(f"An unexpected error occurred: {e}")
+            if len(inserts) + len(updates) >= chunk_size:
+                flush(inserts, updates)
+                inserts, updates = [], []
+                if progress:
+                    progress(min(f.tell() / total_bytes, 1.0) if total_bytes else None,
+                             f"Imported {counts['inserted'] + counts['updated']} exercises")
+        flush(inserts, updates)
+
+    elapsed = time.perf_counter() - started
+    processed = counts['inserted'] + counts['updated']
+    counts['seconds'] = round(elapsed, 3)
+    counts['rows_per_second'] = round(processed / elapsed, 1) if elapsed > 0 else None
+    print(f"Imported {processed} exercises ({counts['inserted']} new, {counts['updated']} updated, "
+          f"{counts['skipped']} skipped) in {elapsed:.2f}s ({counts['rows_per_second']} rows/sec).")
+    return counts
 
 
 if __name__ == '__main__':
-    import_exercises_from_json() 
\ No newline at end of file
+    from .app import create_app
+    from .exercise_library import invalidate_exercise_library
+
+    with create_app().app_context():
+        import_exercises_from_json(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_JSON_PATH)
+        invalidate_exercise_library()
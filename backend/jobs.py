@@ -0,0 +1,225 @@
+import inspect
+import json
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from .app import socketio
+from .models import db, Job
+from .exercisedb_service import sync_exercises_from_exercisedb
+from .exercise_library import invalidate_exercise_library
+from .import_exercises import import_exercises_from_json
+from .performance_service import backfill_exercise_sets, rebuild_personal_records
+from .nutrition_service import backfill_nutrition_totals
+
+TRAINER_ROOM = "trainer"
+ACTIVE_STATUSES = ('queued', 'running')
+HEARTBEAT_INTERVAL = 30  # seconds between updated_at refreshes of the jobs this process owns
+# An active job without a heartbeat for this long is assumed to have died with its process
+STALE_JOB_AFTER = timedelta(minutes=5)
+PROGRESS_EMIT_INTERVAL = 0.5  # seconds
+
+JOB_HANDLERS = {}
+_executor = None
+_heartbeat_thread = None
+_live_jobs = set()  # ids of jobs queued or running in this process
+_live_jobs_lock = threading.Lock()
+
+
+def job_handler(job_type):
+    """Registers `fn(progress, **params)` as the handler for a job type."""
+    def register(fn):
+        JOB_HANDLERS[job_type] = fn
+        return fn
+    return register
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'type': job.type,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'params': json.loads(job.params) if job.params else {},
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        # Bounds how many jobs run at once. Under eventlet (run.py monkey-patches) these are green
+        # threads: network and file I/O yield to the Socket.IO loop, but CPU-bound stretches do not
+        _executor = ThreadPoolExecutor(max_workers=app.config.get('JOB_WORKERS', 2), thread_name_prefix='job')
+    return _executor
+
+
+def _start_heartbeat(app):
+    """
+    Refreshes `updated_at` of every job this process owns every
+    HEARTBEAT_INTERVAL seconds, from enqueue until the handler returns, so
+    a long job that reports no progress is never taken for a dead one.
+    """
+    global _heartbeat_thread
+    if _heartbeat_thread is not None:
+        return
+
+    def run():
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with _live_jobs_lock:
+                job_ids = list(_live_jobs)
+            if not job_ids:
+                continue
+            try:
+                # Its own connection, so the beat never waits on a handler's session
+                with app.app_context(), db.engine.begin() as conn:
+                    conn.execute(Job.__table__.update().where(Job.id.in_(job_ids))
+                                 .values(updated_at=datetime.utcnow()))
+            except Exception as e:
+                app.logger.warning(f"Job heartbeat failed for {len(job_ids)} jobs: {e}")
+
+    _heartbeat_thread = threading.Thread(target=run, name='job-heartbeat', daemon=True)
+    _heartbeat_thread.start()
+
+
+def _emit(job):
+    socketio.emit('job_progress', job_to_dict(job), room=TRAINER_ROOM)
+
+
+def find_active_job(job_type):
+    """Returns the queued/running job of this type, failing any that went stale."""
+    job = Job.query.filter(Job.type == job_type, Job.status.in_(ACTIVE_STATUSES)) \
+        .order_by(Job.created_at.desc()).first()
+    if job and job.updated_at and datetime.utcnow() - job.updated_at > STALE_JOB_AFTER:
+        job.status = 'failed'
+        job.error = 'Job stopped sending heartbeats (worker restarted?)'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        return None
+    return job
+
+
+def enqueue_job(job_type, **params):
+    """
+    Persists a job record and schedules it on the worker pool.
+    Only one job per type runs at a time; enqueueing a type that is already
+    queued or running returns the existing job. Returns (job, created).
+    """
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job type: {job_type}")
+    # Reject bad params now rather than failing later on the worker
+    inspect.signature(JOB_HANDLERS[job_type]).bind(None, **params)
+
+    existing = find_active_job(job_type)
+    if existing:
+        return existing, False
+
+    job = Job(type=job_type, status='queued', params=json.dumps(params))
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request enqueued this type between the check and the insert (uq_job_active_type)
+        db.session.rollback()
+        existing = find_active_job(job_type)
+        if existing:
+            return existing, False
+        raise
+
+    app = current_app._get_current_object()
+    with _live_jobs_lock:
+        _live_jobs.add(job.id)
+    _start_heartbeat(app)
+    _get_executor(app).submit(_run_job, app, job.id)
+    _emit(job)
+    return job, True
+
+
+def _run_job(app, job_id):
+    try:
+        with app.app_context():
+            job = db.session.get(Job, job_id)
+            job.status = 'running'
+            job.started_at = datetime.utcnow()
+            db.session.commit()
+            _emit(job)
+
+            last_emit = [0.0]
+
+            def progress(fraction=None, message=None):
+                """Handlers call this to report progress; it is persisted and pushed to trainers."""
+                job = db.session.get(Job, job_id)
+                job.progress = fraction
+                job.message = message
+                db.session.commit()
+                now = time.monotonic()
+                if now - last_emit[0] >= PROGRESS_EMIT_INTERVAL:
+                    last_emit[0] = now
+                    _emit(job)
+
+            try:
+                params = json.loads(job.params) if job.params else {}
+                result = JOB_HANDLERS[job.type](progress, **params)
+                job = db.session.get(Job, job_id)
+                job.status = 'succeeded'
+                job.progress = 1.0
+                job.result = json.dumps(result)
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Job {job_id} failed: {e}\n{traceback.format_exc()}")
+                job = db.session.get(Job, job_id)
+                job.status = 'failed'
+                job.error = str(e)
+            finally:
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+                _emit(job)
+                db.session.remove()
+    finally:
+        with _live_jobs_lock:
+            _live_jobs.discard(job_id)
+
+
+# --- Job Handlers ---
+@job_handler('exercise_sync')
+def run_exercise_sync(progress, restart=False):
+    result = sync_exercises_from_exercisedb(restart=restart, progress=progress)
+    invalidate_exercise_library()
+    if result.get("status") == "error":
+        raise RuntimeError(result["message"])
+    return result
+
+
+@job_handler('backfill_exercise_sets')
+def run_backfill_exercise_sets(progress):
+    log_count, set_count = backfill_exercise_sets(progress=progress)
+    return {"logs": log_count, "sets": set_count}
+
+
+@job_handler('rebuild_personal_records')
+def run_rebuild_personal_records(progress):
+    return {"records": rebuild_personal_records()}
+
+
+@job_handler('backfill_nutrition_totals')
+def run_backfill_nutrition_totals(progress):
+    return {"days": backfill_nutrition_totals()}
+
+
+@job_handler('import_exercises')
+def run_import_exercises(progress):
+    # Always the bundled export: the path is deliberately not a request parameter
+    result = import_exercises_from_json(progress=progress)
+    invalidate_exercise_library()
+    return result
@@ -0,0 +1,98 @@
+import json
+import os
+import tempfile
+import threading
+
+
+class LegacyJSONIndex:
+    """
+    A legacy JSON list file held in memory and indexed by one field.
+
+    The file is parsed once and re-read only when its mtime or size
+    changes, so lookups on the request path are a stat plus a dict access.
+    When several records share a key the first one wins, matching the
+    linear scans this replaces. Writes go to a temporary file that is
+    renamed over the original, so readers never see a partial file.
+    """
+
+    def __init__(self, path, key, logger=None):
+        self.path = path
+        self.key = key
+        self.logger = logger
+        self._signature = None
+        self._records = []
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def _build(self, records):
+        index = {}
+        for record in records:
+            if isinstance(record, dict) and record.get(self.key) is not None:
+                index.setdefault(record[self.key], record)
+        self._records, self._index = records, index
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._signature = None
+            self._build([])
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            if self.logger:
+                self.logger.error(f"Error reading legacy JSON {self.path}: {e}")
+            data = []
+        self._build(data if isinstance(data, list) else [])
+        self._signature = signature
+
+    def records(self):
+        with self._lock:
+            self._refresh()
+            return list(self._records)
+
+    def get(self, key_value):
+        with self._lock:
+            self._refresh()
+            return self._index.get(key_value)
+
+    def remove(self, key_value):
+        """Drops every record with this key and rewrites the file. Returns how many were removed."""
+        with self._lock:
+            self._refresh()
+            kept = [r for r in self._records if not (isinstance(r, dict) and r.get(self.key) == key_value)]
+            removed = len(self._records) - len(kept)
+            if removed:
+                self._write(kept)
+            return removed
+
+    def _write(self, records):
+        directory = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(records, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        stat = os.stat(self.path)
+        self._signature = (stat.st_mtime_ns, stat.st_size)
+        self._build(records)
+
+
+def legacy_template_days(template):
+    """Days of a legacy template; the old flat `exercises` list of groups becomes a single day."""
+    if template.get('days'):
+        return template['days']
+    if template.get('exercises'):
+        return [{"name": "Day 1", "groups": template['exercises']}]
+    return []
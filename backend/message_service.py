@@ -0,0 +1,103 @@
+from .models import db, Client, Message, MessageReadState
+from .counters import increment_counter
+
+READERS = ('client', 'trainer')
+POSITION_COUNTER = 'message_position'
+
+
+def allocate_positions(count):
+    """
+    Reserves `count` consecutive message positions in the current
+    transaction and returns the first. The counter row stays write-locked
+    until the caller commits, so positions follow commit order: once a
+    reader has seen position P, no message below P can still appear. That
+    makes positions safe sync cursors and read pointers, unlike timestamps
+    assigned before a write-behind insert.
+    """
+    # The migration seeds the counter; a schema built with create_all starts it from the stored messages
+    stored = lambda: db.session.query(db.func.coalesce(db.func.max(Message.position), 0)).scalar()
+    last = increment_counter(POSITION_COUNTER, count, start=stored)
+    return last - count + 1
+
+
+def _incoming(reader):
+    """Messages that count as unread for `reader`: the ones the other side sent."""
+    return Message.sender_type == 'client' if reader == 'trainer' else Message.sender_type != 'client'
+
+
+def unread_counts_subquery(reader):
+    """
+    Unread messages per client for `reader`, as a subquery of (client_id,
+    unread) with a row for every client. Each count is a correlated range
+    scan of the (client_id, position) index past that client's read
+    pointer, so the cost is O(clients + new messages), not O(history).
+    """
+    pointer = db.aliased(MessageReadState)
+    unread = db.select(db.func.count(Message.id)) \
+        .where(Message.client_id == Client.id, _incoming(reader),
+               Message.position > db.func.coalesce(pointer.last_read_position, 0)) \
+        .correlate(Client, pointer).scalar_subquery()
+    return db.session.query(Client.id.label('client_id'), unread.label('unread')) \
+        .outerjoin(pointer, db.and_(pointer.client_id == Client.id, pointer.reader == reader)).subquery()
+
+
+def unread_count(client_id, reader):
+    """Unread messages in one client's conversation for `reader`."""
+    return Message.query.filter(Message.client_id == client_id, _incoming(reader),
+                                Message.position > read_position(client_id, reader)).count()
+
+
+def read_position(client_id, reader=None):
+    """
+    Position of `reader`'s read pointer (0 if they have not read anything);
+    without a reader, the lower of the two, so nobody's unread messages
+    are skipped.
+    """
+    query = db.session.query(MessageReadState.reader, MessageReadState.last_read_position) \
+        .filter(MessageReadState.client_id == client_id)
+    positions = dict(query.filter(MessageReadState.reader == reader) if reader else query)
+    return min(positions.get(r, 0) for r in ([reader] if reader else READERS))
+
+
+def unread_counts(reader='trainer'):
+    """Unread counts for every active client with at least one unread message, as {client_id: count}."""
+    unread = unread_counts_subquery(reader)
+    rows = db.session.query(unread.c.client_id, unread.c.unread) \
+        .join(Client, Client.id == unread.c.client_id) \
+        .filter(Client.deleted == False, Client.archived == False, unread.c.unread > 0).all()
+    return {client_id: count for client_id, count in rows}
+
+
+def mark_read(client_id, reader, message):
+    """
+    Moves `reader`'s pointer up to `message` (the newest message when
+    None). The pointer is the message's position, so it covers every
+    message stored before it, and never moves backwards, so receipts
+    arriving out of order are harmless. Commits and returns the read
+    state, or None when there is nothing to read yet.
+    """
+    if message is None:
+        message = Message.query.filter_by(client_id=client_id).order_by(Message.position.desc()).first()
+        if message is None:
+            return None
+    state = db.session.get(MessageReadState, (client_id, reader))
+    if state is None:
+        state = MessageReadState(client_id=client_id, reader=reader, last_read_at=message.timestamp,
+                                 last_read_message_id=message.id, last_read_position=message.position)
+        db.session.add(state)
+    elif message.position > state.last_read_position:
+        state.last_read_at = message.timestamp
+        state.last_read_message_id = message.id
+        state.last_read_position = message.position
+    db.session.commit()
+    return state
+
+
+def read_state_to_dict(state):
+    return {
+        'client_id': state.client_id,
+        'reader': state.reader,
+        'last_read_at': state.last_read_at.isoformat(),
+        'last_read_message_id': state.last_read_message_id,
+        'last_read_position': state.last_read_position,
+    }
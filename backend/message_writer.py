@@ -0,0 +1,242 @@
+import atexit
+import json
+import threading
+import time
+from collections import deque
+
+from .models import db, Message
+from .message_service import allocate_positions
+
+MAX_RETRY_DELAY = 5.0  # seconds between attempts while the database keeps failing
+MAX_ROW_ATTEMPTS = 5  # failed inserts of one row, with the database up, before it is dead-lettered
+DEAD_LETTER_LIMIT = 1000
+
+
+class SequenceClock:
+    """
+    Hands out message sequence numbers: microseconds since the epoch,
+    bumped when needed so they strictly increase within a process. Values
+    from different workers interleave in wall-clock order, which is what
+    clients sort a conversation by.
+    """
+
+    def __init__(self, clock=time.time_ns):
+        self.clock = clock
+        self._last = 0
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            self._last = max(self._last + 1, self.clock() // 1000)
+            return self._last
+
+
+class PendingMessage:
+    """A submitted row; `wait()` blocks until it is stored or dead-lettered."""
+
+    def __init__(self, row):
+        self.row = row
+        self.attempts = 0
+        self.stored = None
+        self.error = None
+        self.seq = row.get('seq')
+        self._done = threading.Event()
+
+    def resolve(self, stored, seq=None, error=None):
+        self.stored = stored
+        self.error = error
+        if seq is not None:
+            self.seq = seq
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """True once stored, False if dead-lettered, None if still pending after `timeout` seconds."""
+        return self.stored if self._done.wait(timeout) else None
+
+
+def _same_message(a, b):
+    """Whether two message rows are the same message sent twice, as opposed to an id collision."""
+    return all(a[key] == b[key] for key in ('client_id', 'sender_type', 'text'))
+
+
+class MessageWriter:
+    """
+    Write-behind queue for chat messages.
+
+    `submit()` only appends the row, so the socket handler can broadcast
+    without waiting for the database, and returns a PendingMessage the
+    handler waits on before acknowledging the sender. A background thread
+    wakes when rows arrive, waits `flush_interval` seconds so a burst
+    shares one transaction, and inserts up to `max_batch` rows per commit.
+    A row whose id is already stored is skipped when it is the same
+    message (conversation, sender and text), so a sender that resends an
+    unacknowledged message under the same id cannot duplicate it: delivery
+    is at least once, and an acknowledged message is on disk. An id taken
+    by any other message fails that sender's ack instead.
+    Each batch takes its message positions in the insert transaction (see
+    allocate_positions), so readers syncing by position never skip a row
+    that was queued a while before it was written.
+
+    A batch that fails is retried row by row. If every row fails and the
+    database does not answer, the batch goes back to the head of the queue
+    and is retried with backoff. A row that keeps failing while the
+    database is up is dead-lettered after MAX_ROW_ATTEMPTS: logged with
+    its contents, kept in `dead_letters` and reported to its sender, so it
+    cannot hold up the rows behind it. Pending rows are flushed at
+    interpreter exit.
+    """
+
+    def __init__(self, flush_interval=0.005, max_batch=500, logger=None):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.logger = logger
+        self.sequence = SequenceClock()
+        self._queue = deque()
+        self.dead_letters = deque(maxlen=DEAD_LETTER_LIMIT)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def next_seq(self):
+        return self.sequence.next()
+
+    def submit(self, row):
+        """Queues one message row (a dict of Message columns) for insertion. Returns its PendingMessage."""
+        pending = PendingMessage(row)
+        with self._lock:
+            self._queue.append(pending)
+        self._wakeup.set()
+        return pending
+
+    def pending(self):
+        with self._lock:
+            return len(self._queue)
+
+    def _take(self):
+        with self._lock:
+            return [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+
+    def _requeue(self, batch):
+        """Puts failed rows back in front of anything submitted since."""
+        with self._lock:
+            self._queue.extendleft(reversed(batch))
+
+    def _write(self, batch):
+        # Message ids are unique across conversations, so look them up everywhere
+        stored = db.session.query(Message.id, Message.client_id, Message.sender_type, Message.text, Message.seq) \
+            .filter(Message.id.in_({pending.row['id'] for pending in batch}))
+        known = {message.id: message._asdict() for message in stored}
+        fresh = []
+        for pending in batch:
+            if pending.row['id'] not in known:  # the first of several rows sharing an id is the one stored
+                known[pending.row['id']] = pending.row
+                fresh.append(pending.row)
+        fresh.sort(key=lambda row: row['seq'])
+        if fresh:
+            first = allocate_positions(len(fresh))
+            for offset, row in enumerate(fresh):
+                row['position'] = first + offset
+            db.session.execute(db.insert(Message), fresh)
+        db.session.commit()
+        for pending in batch:
+            match = known[pending.row['id']]
+            if match is pending.row or _same_message(match, pending.row):
+                pending.resolve(True, match['seq'])
+                continue
+            pending.resolve(False, error="Message id is already used by another message")
+            if self.logger:
+                self.logger.warning(f"Rejected message {pending.row['id']} for client {pending.row['client_id']}: "
+                                    f"id already used by a different message")
+        return len(fresh)
+
+    def _database_available(self):
+        try:
+            db.session.execute(db.text('SELECT 1'))
+            return True
+        except Exception:
+            return False
+        finally:
+            db.session.rollback()
+
+    def _dead_letter(self, pending, error):
+        self.dead_letters.append(pending.row)
+        pending.resolve(False)
+        if self.logger:
+            self.logger.error(f"Dead-lettered message after {pending.attempts} failed inserts: {error}; "
+                              f"row: {json.dumps(pending.row, default=str)}")
+
+    def _write_rows_singly(self, batch, error):
+        """Retries a failed batch one row at a time so a bad row cannot hold up the rest."""
+        written = 0
+        failed = []
+        for pending in batch:
+            try:
+                written += self._write([pending])
+            except Exception as e:
+                db.session.rollback()
+                failed.append((pending, e))
+        if not failed:
+            return written
+        if len(failed) == len(batch) and not self._database_available():
+            self._requeue(batch)
+            if self.logger:
+                self.logger.error(f"Failed to write {len(batch)} queued messages, will retry: {error}")
+            raise error
+        retry = []
+        for pending, e in failed:
+            pending.attempts += 1
+            if pending.attempts >= MAX_ROW_ATTEMPTS:
+                self._dead_letter(pending, e)
+            else:
+                retry.append(pending)
+        if retry:
+            self._requeue(retry)
+            if self.logger:
+                self.logger.warning(f"{len(retry)} queued messages failed to insert, will retry: {failed[0][1]}")
+            raise failed[0][1]
+        return written
+
+    def flush(self):
+        """Writes everything queued so far in batches. Returns the number of rows inserted."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take()
+                if not batch:
+                    return written
+                try:
+                    written += self._write(batch)
+                except Exception as e:
+                    db.session.rollback()
+                    written += self._write_rows_singly(batch, e)
+
+    def start(self, app):
+        """Starts the background writer and flushes the queue at interpreter exit."""
+        if self._thread is not None:
+            return
+
+        def run():
+            retry_delay = self.flush_interval
+            while True:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                time.sleep(self.flush_interval)  # Let the rest of a burst arrive
+                with app.app_context():
+                    try:
+                        self.flush()
+                        retry_delay = self.flush_interval
+                    except Exception:
+                        retry_delay = min(max(retry_delay * 2, 0.1), MAX_RETRY_DELAY)
+                        time.sleep(retry_delay)
+                        self._wakeup.set()
+                    finally:
+                        db.session.remove()
+
+        def flush_all():
+            with app.app_context():
+                self.flush()
+
+        self._thread = threading.Thread(target=run, name='message-writer', daemon=True)
+        self._thread.start()
+        atexit.register(flush_all)
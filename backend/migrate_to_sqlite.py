@@ -1,121 +1,112 @@
 import json
 import os
+import sys
+import time
 import uuid
-from app import app, db, Client, WorkoutTemplate, ProgramAssignment, WorkoutLog, Exercise
+from pathlib import Path
+
+if __package__ in (None, ''):
+    # Allow running as `python backend/migrate_to_sqlite.py`
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    __package__ = 'backend'
+
+from .models import db, Client, WorkoutTemplate
+from .import_exercises import iter_json_array, import_exercises_from_json
+from .legacy_json import legacy_template_days
 
 # --- Configuration ---
-CLIENTS_FILE = os.path.join("database", "clients.json")
-EXERCISES_FILE = os.path.join("database", "exercises.json")
-WORKOUT_TEMPLATES_FILE = os.path.join("database", "workout_templates.json")
+DATABASE_DIR = os.path.join(os.path.dirname(__file__), "database")
+CLIENTS_FILE = os.path.join(DATABASE_DIR, "clients.json")
+EXERCISES_FILE = os.path.join(DATABASE_DIR, "exercises.json")
+WORKOUT_TEMPLATES_FILE = os.path.join(DATABASE_DIR, "workout_templates.json")
+CHUNK_SIZE = 500
 
-def read_json_file(file_path):
+
+def iter_json_file(file_path):
+    """Streams the records of a legacy JSON file; missing, empty or invalid files yield nothing."""
     if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-        return []
-    with open(file_path, "r") as f:
+        return
+    with open(file_path, "r", encoding="utf-8") as f:
         try:
-            data = json.load(f)
-            # Handle cases where the JSON might be an object with a key, e.g., {"exercises": [...]}
-            if isinstance(data, dict) and "exercises" in data:
-                return data["exercises"]
-            return data # Assume it's a list directly if not an object with "exercises"
-        except json.JSONDecodeError:
-            return [] # Return empty list if JSON is invalid
+            for record in iter_json_array(f):
+                if isinstance(record, dict):  # Skip anything that is not an object
+                    yield record
+        except ValueError as e:
+            print(f"Stopped reading {file_path}: {e}")
 
-def migrate_data():
-    with app.app_context():
-        db.create_all()
-
-        # Migrate clients
-        clients_data = read_json_file(CLIENTS_FILE)
-        for client_data in clients_data:
-            if not isinstance(client_data, dict): # Skip if not a dictionary
-                continue
-            
-            # Check if client with this email already exists
-            existing_client = Client.query.filter_by(email=client_data.get('email')).first()
-            if existing_client:
-                print(f"Skipping client {client_data.get('name')} due to duplicate email: {client_data.get('email')}")
-                continue
-
-            client = Client(
-                id=client_data.get('id', str(uuid.uuid4())),
-                name=client_data.get('name'),
-                email=client_data.get('email'),
-                unique_url=f"http://localhost:3000/client/{str(uuid.uuid4())}", # Generate new unique URL
-                features=json.dumps(client_data.get('features', {})),
-                points=client_data.get('points', 0),
-                daily_metrics=json.dumps(client_data.get('daily_metrics', {})),
-                archived=client_data.get('archived', False)
-            )
-            db.session.add(client)
-
-        # Migrate workout templates
-        templates_data = read_json_file(WORKOUT_TEMPLATES_FILE)
-        for template_data in templates_data:
-            if not isinstance(template_data, dict): # Skip if not a dictionary
-                continue
-            
-            # Check if template with this ID already exists
-            existing_template = WorkoutTemplate.query.get(template_data.get('id'))
-            if existing_template:
-                print(f"Skipping workout template {template_data.get('name')} due to duplicate ID: {template_data.get('id')}")
-                continue
-
-            # Prepare days field – support legacy 'exercises' key by wrapping into a single-day structure
-            if 'days' in template_data:
-                days_json = json.dumps(template_data['days'])
-            elif 'exercises' in template_data:
-                # Legacy flat exercises list -> wrap into a single day with one group
-                legacy_exercises = template_data['exercises']
-                days_json = json.dumps([
-                    {
-                        "dayName": "Day 1",
-                        "groups": [
-                            {
-                                "groupName": "Exercises",
-                                "exercises": legacy_exercises
-                            }
-                        ]
-                    }
-                ])
-            else:
-                days_json = json.dumps([])
-
-            template = WorkoutTemplate(
-                id=template_data.get('id', f"wt_{uuid.uuid4()}"),
-                name=template_data.get('name'),
-                description=template_data.get('description'),
-                days=days_json,
-                tags=json.dumps(template_data.get('tags', []))
-            )
-            db.session.add(template)
-
-        # Migrate exercises
-        exercises_data = read_json_file(EXERCISES_FILE)
-        for exercise_data in exercises_data:
-            if not isinstance(exercise_data, dict): # Skip if not a dictionary
-                continue
-            
-            # Check if exercise with this ID already exists
-            existing_exercise = Exercise.query.get(exercise_data.get('id'))
-            if existing_exercise:
-                print(f"Skipping exercise {exercise_data.get('name')} due to duplicate ID: {exercise_data.get('id')}")
-                continue
-
-            exercise = Exercise(
-                id=exercise_data.get('id', f"exr_{uuid.uuid4()}"),
-                name=exercise_data.get('name'),
-                instructions=exercise_data.get('instructions'),
-                media_url=exercise_data.get('gifUrl'), # Corrected key from gifUrl
-                body_part=exercise_data.get('bodyPart'),
-                equipment=exercise_data.get('equipment'),
-                category=exercise_data.get('target'), # Using target as category for now
-                muscles=json.dumps(exercise_data.get('secondaryMuscles', [])) # Corrected key from secondaryMuscles
-            )
-            db.session.add(exercise)
 
+def bulk_insert(model, rows):
+    """Inserts `rows` with executemany in chunked transactions; returns the row count."""
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.bulk_insert_mappings(model, rows[start:start + CHUNK_SIZE])
         db.session.commit()
-        print("Data migration completed successfully!")
+    return len(rows)
+
+
+def migrate_clients():
+    existing_emails = {email for (email,) in db.session.query(Client.email)}
+    existing_ids = {client_id for (client_id,) in db.session.query(Client.id)}
+    rows = []
+    for client_data in iter_json_file(CLIENTS_FILE):
+        email = client_data.get('email')
+        client_id = client_data.get('id') or str(uuid.uuid4())
+        if not email or email in existing_emails or client_id in existing_ids:
+            print(f"Skipping client {client_data.get('name')} (missing or duplicate email/id: {email})")
+            continue
+        existing_emails.add(email)
+        existing_ids.add(client_id)
+        rows.append({
+            'id': client_id,
+            'name': client_data.get('name') or email,
+            'email': email,
+            'unique_url': f"http://localhost:3000/client/{uuid.uuid4()}",  # Generate new unique URL
+            'features': json.dumps(client_data.get('features', {})),
+            'points': client_data.get('points', 0),
+            'daily_metrics': json.dumps(client_data.get('daily_metrics', {})),
+            'archived': client_data.get('archived', False),
+            'deleted': False
+        })
+    return bulk_insert(Client, rows)
+
+
+def migrate_workout_templates():
+    existing_ids = {template_id for (template_id,) in db.session.query(WorkoutTemplate.id)}
+    rows = []
+    for template_data in iter_json_file(WORKOUT_TEMPLATES_FILE):
+        template_id = template_data.get('id') or f"wt_{uuid.uuid4()}"
+        if template_id in existing_ids:
+            print(f"Skipping workout template {template_data.get('name')} due to duplicate ID: {template_id}")
+            continue
+        existing_ids.add(template_id)
+        rows.append({
+            'id': template_id,
+            'name': template_data.get('name') or 'Untitled Template',
+            'days': json.dumps(legacy_template_days(template_data))
+        })
+    return bulk_insert(WorkoutTemplate, rows)
+
+
+def migrate_data():
+    """
+    Copies the legacy JSON files into the database. Ids and emails already
+    present are loaded up front and skipped, so the migration can be re-run;
+    exercises are upserted by the streaming importer.
+    """
+    db.create_all()
+    started = time.perf_counter()
+
+    client_count = migrate_clients()
+    template_count = migrate_workout_templates()
+    exercise_counts = import_exercises_from_json(EXERCISES_FILE, chunk_size=CHUNK_SIZE)
+
+    elapsed = time.perf_counter() - started
+    total = client_count + template_count + exercise_counts['inserted'] + exercise_counts['updated']
+    print(f"Data migration completed successfully! {client_count} clients, {template_count} templates, "
+          f"{total} rows in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.1f} rows/sec).")
+
 
 if __name__ == '__main__':
-    migrate_data()
\ No newline at end of file
+    from .app import create_app
+
+    with create_app().app_context():
+        migrate_data()
@@ -0,0 +1,37 @@
+"""add unique index on active job type
+
+Revision ID: 2a9d5c7e1b43
+Revises: 7f3b9d2e5a61
+Create Date: 2026-10-18 15:42:17.204819
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2a9d5c7e1b43'
+down_revision = '7f3b9d2e5a61'
+branch_labels = None
+depends_on = None
+
+ACTIVE = "status IN ('queued', 'running')"
+
+
+def upgrade():
+    # Racing enqueues may already have left two active jobs of a type; keep the newest
+    op.execute(f"""
+        UPDATE job SET status = 'failed', error = 'Superseded by a newer job of the same type'
+        WHERE {ACTIVE} AND EXISTS (
+            SELECT 1 FROM job AS newer
+            WHERE newer.type = job.type AND newer.status IN ('queued', 'running')
+              AND (newer.created_at > job.created_at OR (newer.created_at = job.created_at AND newer.id > job.id)))
+    """)
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.create_index('uq_job_active_type', ['type'], unique=True,
+                              sqlite_where=sa.text(ACTIVE), postgresql_where=sa.text(ACTIVE))
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index('uq_job_active_type')
@@ -0,0 +1,37 @@
+"""add personal_record table
+
+Revision ID: 3d7a90c4e512
+Revises: 8c1f2e7a9b34
+Create Date: 2026-10-17 10:03:27.551904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d7a90c4e512'
+down_revision = '8c1f2e7a9b34'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('personal_record',
+    sa.Column('client_id', sa.String(), nullable=False),
+    sa.Column('exercise_id', sa.String(), nullable=False),
+    sa.Column('weight', sa.Float(), nullable=True),
+    sa.Column('reps', sa.Integer(), nullable=True),
+    sa.Column('one_rm', sa.Float(), nullable=True),
+    sa.Column('achieved_on', sa.Date(), nullable=True),
+    sa.Column('max_weight', sa.Float(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['client.id'], name=op.f('fk_personal_record_client_id_client')),
+    sa.PrimaryKeyConstraint('client_id', 'exercise_id', name=op.f('pk_personal_record'))
+    )
+
+    # Existing data is indexed with `flask rebuild-personal-records`
+
+
+def downgrade():
+    op.drop_table('personal_record')
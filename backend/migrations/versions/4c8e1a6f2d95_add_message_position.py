@@ -0,0 +1,72 @@
+"""add message position
+
+Revision ID: 4c8e1a6f2d95
+Revises: 9e5c2a7d4b18
+Create Date: 2026-10-18 10:21:37.114902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c8e1a6f2d95'
+down_revision = '9e5c2a7d4b18'
+branch_labels = None
+depends_on = None
+
+message = sa.table('message',
+    sa.column('id', sa.String()),
+    sa.column('client_id', sa.String()),
+    sa.column('timestamp', sa.DateTime()),
+    sa.column('position', sa.BigInteger())
+)
+
+read_state = sa.table('message_read_state',
+    sa.column('client_id', sa.String()),
+    sa.column('last_read_at', sa.DateTime()),
+    sa.column('last_read_position', sa.BigInteger())
+)
+
+
+def upgrade():
+    counter = op.create_table('sequence_counter',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name', name=op.f('pk_sequence_counter'))
+    )
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('position', sa.BigInteger(), nullable=True))
+        batch_op.create_index('ix_message_client_id_position', ['client_id', 'position'], unique=False)
+    with op.batch_alter_table('message_read_state', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_read_position', sa.BigInteger(), nullable=False,
+                                      server_default='0'))
+
+    # Existing messages are numbered in conversation order
+    conn = op.get_bind()
+    rows = [
+        {'b_id': message_id, 'position': position}
+        for position, (message_id,) in enumerate(conn.execute(
+            sa.select(message.c.id).order_by(message.c.timestamp, message.c.id)), start=1)
+    ]
+    if rows:
+        conn.execute(
+            message.update().where(message.c.id == sa.bindparam('b_id')).values(position=sa.bindparam('position')),
+            rows
+        )
+    op.bulk_insert(counter, [{'name': 'message_position', 'value': len(rows)}])
+
+    # Read pointers move from timestamps to the position of the newest message read
+    last_read = sa.select(sa.func.coalesce(sa.func.max(message.c.position), 0)) \
+        .where(message.c.client_id == read_state.c.client_id, message.c.timestamp <= read_state.c.last_read_at) \
+        .scalar_subquery()
+    op.execute(read_state.update().values(last_read_position=last_read))
+
+
+def downgrade():
+    with op.batch_alter_table('message_read_state', schema=None) as batch_op:
+        batch_op.drop_column('last_read_position')
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_client_id_position')
+        batch_op.drop_column('position')
+    op.drop_table('sequence_counter')
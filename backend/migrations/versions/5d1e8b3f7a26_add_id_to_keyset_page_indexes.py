@@ -0,0 +1,37 @@
+"""add id to keyset page indexes
+
+Revision ID: 5d1e8b3f7a26
+Revises: 2a9d5c7e1b43
+Create Date: 2026-10-19 09:37:45.518203
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1e8b3f7a26'
+down_revision = '2a9d5c7e1b43'
+branch_labels = None
+depends_on = None
+
+# (table, index name, sort column). Keyset pages order by (sort column, id), so the
+# id tie-breaker has to be in the index too or every page sorts the whole partition.
+INDEXES = [
+    ('message', 'ix_message_client_id_timestamp', 'timestamp'),
+    ('body_stat', 'ix_body_stat_client_id_date', 'date'),
+    ('progress_photo', 'ix_progress_photo_client_id_timestamp', 'timestamp'),
+]
+
+
+def upgrade():
+    for table, name, column in INDEXES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(name)
+            batch_op.create_index(name, ['client_id', column, 'id'], unique=False)
+
+
+def downgrade():
+    for table, name, column in reversed(INDEXES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(name)
+            batch_op.create_index(name, ['client_id', column], unique=False)
@@ -0,0 +1,49 @@
+"""add message seq
+
+Revision ID: 6b2d9e4f1c73
+Revises: f1b7d3a9c285
+Create Date: 2026-10-17 19:12:47.508316
+
+"""
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b2d9e4f1c73'
+down_revision = 'f1b7d3a9c285'
+branch_labels = None
+depends_on = None
+
+EPOCH = datetime(1970, 1, 1)
+
+message = sa.table('message',
+    sa.column('id', sa.String()),
+    sa.column('timestamp', sa.DateTime()),
+    sa.column('seq', sa.BigInteger())
+)
+
+
+def upgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('seq', sa.BigInteger(), nullable=True))
+
+    # Existing messages get the microsecond timestamp the sequence clock would have given them
+    conn = op.get_bind()
+    rows = [
+        {'b_id': message_id, 'seq': (timestamp - EPOCH) // timedelta(microseconds=1)}
+        for message_id, timestamp in conn.execute(
+            sa.select(message.c.id, message.c.timestamp).where(message.c.timestamp.isnot(None)))
+    ]
+    if rows:
+        conn.execute(
+            message.update().where(message.c.id == sa.bindparam('b_id')).values(seq=sa.bindparam('seq')),
+            rows
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_column('seq')
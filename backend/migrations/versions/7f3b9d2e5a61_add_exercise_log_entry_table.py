@@ -0,0 +1,41 @@
+"""add exercise_log_entry table
+
+Revision ID: 7f3b9d2e5a61
+Revises: 4c8e1a6f2d95
+Create Date: 2026-10-18 11:04:52.630417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f3b9d2e5a61'
+down_revision = '4c8e1a6f2d95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('exercise_log_entry',
+    sa.Column('workout_log_id', sa.String(), nullable=False),
+    sa.Column('exercise_id', sa.String(), nullable=False),
+    sa.Column('client_id', sa.String(), nullable=False),
+    sa.Column('performed_on', sa.Date(), nullable=False),
+    sa.Column('day_index', sa.Integer(), nullable=True),
+    sa.Column('sets', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['client_id'], ['client.id'], name=op.f('fk_exercise_log_entry_client_id_client')),
+    sa.ForeignKeyConstraint(['workout_log_id'], ['workout_log.id'], name=op.f('fk_exercise_log_entry_workout_log_id_workout_log')),
+    sa.PrimaryKeyConstraint('workout_log_id', 'exercise_id', name=op.f('pk_exercise_log_entry'))
+    )
+    with op.batch_alter_table('exercise_log_entry', schema=None) as batch_op:
+        batch_op.create_index('ix_exercise_log_entry_client_exercise_date', ['client_id', 'exercise_id', 'performed_on'], unique=False)
+
+    # Existing logs are materialized with `flask backfill-exercise-sets`
+
+
+def downgrade():
+    with op.batch_alter_table('exercise_log_entry', schema=None) as batch_op:
+        batch_op.drop_index('ix_exercise_log_entry_client_exercise_date')
+
+    op.drop_table('exercise_log_entry')
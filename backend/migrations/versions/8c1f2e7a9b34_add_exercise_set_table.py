@@ -0,0 +1,48 @@
+"""add exercise_set table
+
+Revision ID: 8c1f2e7a9b34
+Revises: 575c7d526100
+Create Date: 2026-10-17 09:12:41.118302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1f2e7a9b34'
+down_revision = '575c7d526100'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('exercise_set',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('workout_log_id', sa.String(), nullable=False),
+    sa.Column('client_id', sa.String(), nullable=False),
+    sa.Column('exercise_id', sa.String(), nullable=False),
+    sa.Column('performed_on', sa.Date(), nullable=False),
+    sa.Column('day_index', sa.Integer(), nullable=True),
+    sa.Column('set_index', sa.Integer(), nullable=False),
+    sa.Column('reps', sa.Integer(), nullable=True),
+    sa.Column('weight', sa.Float(), nullable=True),
+    sa.Column('completed', sa.Boolean(), nullable=True),
+    sa.Column('one_rm', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['client.id'], name=op.f('fk_exercise_set_client_id_client')),
+    sa.ForeignKeyConstraint(['workout_log_id'], ['workout_log.id'], name=op.f('fk_exercise_set_workout_log_id_workout_log')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_exercise_set'))
+    )
+    with op.batch_alter_table('exercise_set', schema=None) as batch_op:
+        batch_op.create_index('ix_exercise_set_client_exercise_date', ['client_id', 'exercise_id', 'performed_on'], unique=False)
+        batch_op.create_index(batch_op.f('ix_exercise_set_workout_log_id'), ['workout_log_id'], unique=False)
+
+    # Existing logs are materialized with `flask backfill-exercise-sets`
+
+
+def downgrade():
+    with op.batch_alter_table('exercise_set', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_exercise_set_workout_log_id'))
+        batch_op.drop_index('ix_exercise_set_client_exercise_date')
+
+    op.drop_table('exercise_set')
@@ -0,0 +1,45 @@
+"""add message read state table
+
+Revision ID: 9e5c2a7d4b18
+Revises: 6b2d9e4f1c73
+Create Date: 2026-10-17 19:48:09.771254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e5c2a7d4b18'
+down_revision = '6b2d9e4f1c73'
+branch_labels = None
+depends_on = None
+
+message = sa.table('message',
+    sa.column('id', sa.String()),
+    sa.column('client_id', sa.String()),
+    sa.column('timestamp', sa.DateTime())
+)
+
+
+def upgrade():
+    read_state = op.create_table('message_read_state',
+    sa.Column('client_id', sa.String(), nullable=False),
+    sa.Column('reader', sa.String(length=20), nullable=False),
+    sa.Column('last_read_at', sa.DateTime(), nullable=False),
+    sa.Column('last_read_message_id', sa.String(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['client.id'], name=op.f('fk_message_read_state_client_id_client')),
+    sa.PrimaryKeyConstraint('client_id', 'reader', name=op.f('pk_message_read_state'))
+    )
+
+    # Treat existing history as read by both sides instead of flooding every inbox
+    for reader in ('client', 'trainer'):
+        latest = sa.select(message.c.client_id, sa.literal(reader), sa.func.max(message.c.timestamp)) \
+            .where(message.c.timestamp.isnot(None)) \
+            .group_by(message.c.client_id)
+        op.execute(read_state.insert().from_select(['client_id', 'reader', 'last_read_at'], latest))
+
+
+def downgrade():
+    op.drop_table('message_read_state')
@@ -0,0 +1,37 @@
+"""add workout session table
+
+Revision ID: a7c3e9f1b254
+Revises: 0f4d8a2b6c19
+Create Date: 2026-10-17 16:02:41.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9f1b254'
+down_revision = '0f4d8a2b6c19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('workout_session',
+    sa.Column('client_id', sa.String(), nullable=False),
+    sa.Column('data', sa.Text(), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['client_id'], ['client.id'], name=op.f('fk_workout_session_client_id_client')),
+    sa.PrimaryKeyConstraint('client_id', name=op.f('pk_workout_session'))
+    )
+    with op.batch_alter_table('workout_session', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_workout_session_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('workout_session', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_workout_session_expires_at'))
+
+    op.drop_table('workout_session')
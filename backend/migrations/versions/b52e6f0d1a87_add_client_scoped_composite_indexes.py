@@ -0,0 +1,40 @@
+"""add client-scoped composite indexes
+
+Revision ID: b52e6f0d1a87
+Revises: 3d7a90c4e512
+Create Date: 2026-10-17 11:26:08.402715
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b52e6f0d1a87'
+down_revision = '3d7a90c4e512'
+branch_labels = None
+depends_on = None
+
+# (table, index name, columns). ProgramAssignment lookups by (client_id, active)
+# are already served by the _client_active_uc unique constraint's index.
+INDEXES = [
+    ('client', 'ix_client_unique_url_deleted', ['unique_url', 'deleted']),
+    ('workout_log', 'ix_workout_log_client_id_actual_date', ['client_id', 'actual_date']),
+    ('meal_plan', 'ix_meal_plan_client_id_assigned_date', ['client_id', 'assigned_date']),
+    ('nutrition_log', 'ix_nutrition_log_client_id_log_date', ['client_id', 'log_date']),
+    ('message', 'ix_message_client_id_timestamp', ['client_id', 'timestamp']),
+    ('achievement', 'ix_achievement_client_id_unlocked_at', ['client_id', 'unlocked_at']),
+    ('body_stat', 'ix_body_stat_client_id_date', ['client_id', 'date']),
+    ('progress_photo', 'ix_progress_photo_client_id_timestamp', ['client_id', 'timestamp']),
+]
+
+
+def upgrade():
+    for table, name, columns in INDEXES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index(name, columns, unique=False)
+
+
+def downgrade():
+    for table, name, columns in reversed(INDEXES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(name)
@@ -0,0 +1,39 @@
+"""add nutrition daily total table
+
+Revision ID: c4e8b1d9f3a6
+Revises: a7c3e9f1b254
+Create Date: 2026-10-17 16:47:12.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8b1d9f3a6'
+down_revision = 'a7c3e9f1b254'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('nutrition_daily_total',
+    sa.Column('client_id', sa.String(), nullable=False),
+    sa.Column('log_date', sa.Date(), nullable=False),
+    sa.Column('calories', sa.Float(), nullable=False),
+    sa.Column('protein', sa.Float(), nullable=False),
+    sa.Column('carbs', sa.Float(), nullable=False),
+    sa.Column('fat', sa.Float(), nullable=False),
+    sa.Column('fiber', sa.Float(), nullable=False),
+    sa.Column('sugar', sa.Float(), nullable=False),
+    sa.Column('sodium', sa.Float(), nullable=False),
+    sa.Column('entry_count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['client.id'], name=op.f('fk_nutrition_daily_total_client_id_client')),
+    sa.PrimaryKeyConstraint('client_id', 'log_date', name=op.f('pk_nutrition_daily_total'))
+    )
+    # Existing logs are rolled up with `flask backfill-nutrition-totals`
+
+
+def downgrade():
+    op.drop_table('nutrition_daily_total')
@@ -0,0 +1,96 @@
+"""promote nutrition log macros to columns
+
+Revision ID: d2a6f8c0e417
+Revises: c4e8b1d9f3a6
+Create Date: 2026-10-17 17:21:05.662930
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a6f8c0e417'
+down_revision = 'c4e8b1d9f3a6'
+branch_labels = None
+depends_on = None
+
+MACRO_FIELDS = ('calories', 'protein', 'carbs', 'fat', 'fiber', 'sugar', 'sodium')
+
+nutrition_log = sa.table('nutrition_log',
+    sa.column('id', sa.String()),
+    sa.column('macros', sa.Text()),
+    sa.column('serving_size', sa.String()),
+    sa.column('meal_type', sa.String()),
+    *[sa.column(field, sa.Float()) for field in MACRO_FIELDS]
+)
+
+
+def _number(value):
+    try:
+        return float(value) if value not in (None, "") else 0.0
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def upgrade():
+    with op.batch_alter_table('nutrition_log', schema=None) as batch_op:
+        for field in MACRO_FIELDS:
+            batch_op.add_column(sa.Column(field, sa.Float(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('serving_size', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('meal_type', sa.String(length=50), nullable=True))
+
+    conn = op.get_bind()
+    rows = []
+    for log_id, raw in conn.execute(sa.select(nutrition_log.c.id, nutrition_log.c.macros)):
+        try:
+            macros = json.loads(raw) if raw else {}
+        except ValueError:
+            macros = {}
+        if not isinstance(macros, dict):
+            macros = {}
+        row = {field: _number(macros.get(field)) for field in MACRO_FIELDS}
+        row.update(b_id=log_id,
+                   serving_size=str(macros.get('serving_size') or ''),
+                   meal_type=macros.get('meal_type') or 'other')
+        rows.append(row)
+    if rows:
+        conn.execute(
+            nutrition_log.update().where(nutrition_log.c.id == sa.bindparam('b_id')).values(
+                serving_size=sa.bindparam('serving_size'),
+                meal_type=sa.bindparam('meal_type'),
+                **{field: sa.bindparam(field) for field in MACRO_FIELDS}
+            ),
+            rows
+        )
+
+    with op.batch_alter_table('nutrition_log', schema=None) as batch_op:
+        batch_op.drop_column('macros')
+
+
+def downgrade():
+    with op.batch_alter_table('nutrition_log', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('macros', sa.Text(), nullable=True))
+
+    conn = op.get_bind()
+    columns = [nutrition_log.c.id, nutrition_log.c.serving_size, nutrition_log.c.meal_type] \
+        + [nutrition_log.c[field] for field in MACRO_FIELDS]
+    rows = []
+    for row in conn.execute(sa.select(*columns)).mappings():
+        macros = {field: row[field] for field in MACRO_FIELDS}
+        macros.update(serving_size=row['serving_size'] or '', meal_type=row['meal_type'] or 'other')
+        rows.append({'b_id': row['id'], 'macros': json.dumps(macros)})
+    if rows:
+        conn.execute(
+            nutrition_log.update().where(nutrition_log.c.id == sa.bindparam('b_id'))
+            .values(macros=sa.bindparam('macros')),
+            rows
+        )
+
+    with op.batch_alter_table('nutrition_log', schema=None) as batch_op:
+        batch_op.drop_column('meal_type')
+        batch_op.drop_column('serving_size')
+        for field in reversed(MACRO_FIELDS):
+            batch_op.drop_column(field)
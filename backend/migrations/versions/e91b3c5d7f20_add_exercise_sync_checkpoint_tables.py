@@ -0,0 +1,43 @@
+"""add exercise sync checkpoint tables
+
+Revision ID: e91b3c5d7f20
+Revises: b52e6f0d1a87
+Create Date: 2026-10-17 13:47:55.630192
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e91b3c5d7f20'
+down_revision = 'b52e6f0d1a87'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('exercise_sync_state',
+    sa.Column('source', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('last_offset', sa.Integer(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('source', name=op.f('pk_exercise_sync_state'))
+    )
+    op.create_table('exercise_sync_record',
+    sa.Column('exercise_id', sa.String(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('media_url', sa.String(length=255), nullable=True),
+    sa.Column('media_status', sa.String(length=20), nullable=True),
+    sa.Column('synced_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['exercise_id'], ['exercise.id'], name=op.f('fk_exercise_sync_record_exercise_id_exercise')),
+    sa.PrimaryKeyConstraint('exercise_id', name=op.f('pk_exercise_sync_record'))
+    )
+
+
+def downgrade():
+    op.drop_table('exercise_sync_record')
+    op.drop_table('exercise_sync_state')
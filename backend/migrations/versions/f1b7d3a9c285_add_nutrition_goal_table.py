@@ -0,0 +1,37 @@
+"""add nutrition goal table
+
+Revision ID: f1b7d3a9c285
+Revises: d2a6f8c0e417
+Create Date: 2026-10-17 17:58:33.140276
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b7d3a9c285'
+down_revision = 'd2a6f8c0e417'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('nutrition_goal',
+    sa.Column('client_id', sa.String(), nullable=False),
+    sa.Column('calories', sa.Float(), nullable=True),
+    sa.Column('protein', sa.Float(), nullable=True),
+    sa.Column('carbs', sa.Float(), nullable=True),
+    sa.Column('fat', sa.Float(), nullable=True),
+    sa.Column('fiber', sa.Float(), nullable=True),
+    sa.Column('water', sa.Float(), nullable=True),
+    sa.Column('activity_level', sa.String(length=20), nullable=True),
+    sa.Column('goal_type', sa.String(length=20), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['client.id'], name=op.f('fk_nutrition_goal_client_id_client')),
+    sa.PrimaryKeyConstraint('client_id', name=op.f('pk_nutrition_goal'))
+    )
+
+
+def downgrade():
+    op.drop_table('nutrition_goal')
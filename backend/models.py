@@ -13,6 +13,7 @@ convention = {
 }
 
 class Client(db.Model):
+    __table_args__ = (db.Index('ix_client_unique_url_deleted', 'unique_url', 'deleted'),)
     id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
@@ -71,6 +72,24 @@ class Exercise(db.Model):
     equipment = db.Column(db.String(100), nullable=True)
     secondaryMuscles = db.Column(db.Text, nullable=True)
 
+class ExerciseSyncState(db.Model):
+    """Checkpoint of an upstream exercise sync so an interrupted run can resume."""
+    source = db.Column(db.String(50), primary_key=True)
+    status = db.Column(db.String(20), default='idle')  # idle | running | failed | complete
+    last_offset = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ExerciseSyncRecord(db.Model):
+    """Last synced upstream content hash and media state for one exercise."""
+    exercise_id = db.Column(db.String, db.ForeignKey('exercise.id'), primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    media_url = db.Column(db.String(255))
+    media_status = db.Column(db.String(20), default='pending')  # pending | ok | failed | none
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class WorkoutTemplate(db.Model):
     id = db.Column(db.String, primary_key=True, default=lambda: f"wkt_{uuid.uuid4()}")
     name = db.Column(db.String(100), nullable=False)
@@ -112,6 +131,7 @@ class ProgramAssignment(db.Model):
         }
 
 class WorkoutLog(db.Model):
+    __table_args__ = (db.Index('ix_workout_log_client_id_actual_date', 'client_id', 'actual_date'),)
     id = db.Column(db.String, primary_key=True, default=lambda: f"log_{uuid.uuid4()}")
     client_id = db.Column(db.String, db.ForeignKey('client.id'), nullable=False)
     assignment_id = db.Column(db.String, db.ForeignKey('program_assignment.id'), nullable=False)
@@ -121,6 +141,52 @@ class WorkoutLog(db.Model):
     client = db.relationship('Client', backref=db.backref('workout_logs', lazy=True))
     assignment = db.relationship('ProgramAssignment', backref=db.backref('workout_logs', lazy=True))
 
+class ExerciseSet(db.Model):
+    """One performed set, materialized from WorkoutLog.performance_data when the log is written."""
+    __table_args__ = (db.Index('ix_exercise_set_client_exercise_date', 'client_id', 'exercise_id', 'performed_on'),)
+    id = db.Column(db.Integer, primary_key=True)
+    workout_log_id = db.Column(db.String, db.ForeignKey('workout_log.id'), nullable=False, index=True)
+    client_id = db.Column(db.String, db.ForeignKey('client.id'), nullable=False)
+    exercise_id = db.Column(db.String, nullable=False)
+    performed_on = db.Column(db.Date, nullable=False)
+    day_index = db.Column(db.Integer)
+    set_index = db.Column(db.Integer, nullable=False)
+    reps = db.Column(db.Integer)
+    weight = db.Column(db.Float)
+    completed = db.Column(db.Boolean, default=False)
+    one_rm = db.Column(db.Float)  # Epley estimate, NULL when weight or reps is missing
+    workout_log = db.relationship('WorkoutLog', backref=db.backref('exercise_sets', lazy=True, cascade='all, delete-orphan'))
+
+class ExerciseLogEntry(db.Model):
+    """One exercise's set list from a WorkoutLog, kept verbatim so history shows exactly what was logged."""
+    __table_args__ = (db.Index('ix_exercise_log_entry_client_exercise_date', 'client_id', 'exercise_id', 'performed_on'),)
+    workout_log_id = db.Column(db.String, db.ForeignKey('workout_log.id'), primary_key=True)
+    exercise_id = db.Column(db.String, primary_key=True)
+    client_id = db.Column(db.String, db.ForeignKey('client.id'), nullable=False)
+    performed_on = db.Column(db.Date, nullable=False)
+    day_index = db.Column(db.Integer)
+    sets = db.Column(db.Text, nullable=False, default='[]')  # the log's performanceLog entry as JSON
+    workout_log = db.relationship('WorkoutLog', backref=db.backref('exercise_log_entries', lazy=True, cascade='all, delete-orphan'))
+
+class PersonalRecord(db.Model):
+    """Best lift per client and exercise, kept up to date as workouts are logged."""
+    client_id = db.Column(db.String, db.ForeignKey('client.id'), primary_key=True)
+    exercise_id = db.Column(db.String, primary_key=True)
+    weight = db.Column(db.Float)        # set with the best estimated 1RM
+    reps = db.Column(db.Integer)
+    one_rm = db.Column(db.Float)
+    achieved_on = db.Column(db.Date)
+    max_weight = db.Column(db.Float, default=0)  # heaviest completed set, used for PB achievements
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class WorkoutSession(db.Model):
+    """In-progress workout autosave, one per client; removed by the expiry sweep."""
+    client_id = db.Column(db.String, db.ForeignKey('client.id'), primary_key=True)
+    data = db.Column(db.Text, default='{}')  # workout_data as JSON
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
 class Recipe(db.Model):
     id = db.Column(db.String, primary_key=True, default=lambda: f"rec_{uuid.uuid4()}")
     name = db.Column(db.String(100), nullable=False)
@@ -129,6 +195,7 @@ class Recipe(db.Model):
     macros = db.Column(db.Text, default='{}')
 
 class MealPlan(db.Model):
+    __table_args__ = (db.Index('ix_meal_plan_client_id_assigned_date', 'client_id', 'assigned_date'),)
     id = db.Column(db.String, primary_key=True, default=lambda: f"mp_{uuid.uuid4()}")
     client_id = db.Column(db.String, db.ForeignKey('client.id'), nullable=False)
     recipe_id = db.Column(db.String, db.ForeignKey('recipe.id'), nullable=False)
@@ -137,13 +204,50 @@ class MealPlan(db.Model):
     recipe = db.relationship('Recipe', backref=db.backref('meal_plans', lazy=True))
 
 class NutritionLog(db.Model):
+    __table_args__ = (db.Index('ix_nutrition_log_client_id_log_date', 'client_id', 'log_date'),)
     id = db.Column(db.String, primary_key=True, default=lambda: f"nl_{uuid.uuid4()}")
     client_id = db.Column(db.String, db.ForeignKey('client.id'), nullable=False)
     log_date = db.Column(db.Date, nullable=False)
     food_item = db.Column(db.String(200), nullable=False)
-    macros = db.Column(db.Text, default='{}')
+    calories = db.Column(db.Float, default=0, nullable=False)
+    protein = db.Column(db.Float, default=0, nullable=False)
+    carbs = db.Column(db.Float, default=0, nullable=False)
+    fat = db.Column(db.Float, default=0, nullable=False)
+    fiber = db.Column(db.Float, default=0, nullable=False)
+    sugar = db.Column(db.Float, default=0, nullable=False)
+    sodium = db.Column(db.Float, default=0, nullable=False)
+    serving_size = db.Column(db.String(100), default='')
+    meal_type = db.Column(db.String(50), default='other')
     client = db.relationship('Client', backref=db.backref('nutrition_logs', lazy=True))
 
+class NutritionDailyTotal(db.Model):
+    """Per-client, per-day macro totals, recomputed whenever that day's NutritionLog rows change."""
+    client_id = db.Column(db.String, db.ForeignKey('client.id'), primary_key=True)
+    log_date = db.Column(db.Date, primary_key=True)
+    calories = db.Column(db.Float, default=0, nullable=False)
+    protein = db.Column(db.Float, default=0, nullable=False)
+    carbs = db.Column(db.Float, default=0, nullable=False)
+    fat = db.Column(db.Float, default=0, nullable=False)
+    fiber = db.Column(db.Float, default=0, nullable=False)
+    sugar = db.Column(db.Float, default=0, nullable=False)
+    sodium = db.Column(db.Float, default=0, nullable=False)
+    entry_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class NutritionGoal(db.Model):
+    """A client's nutrition targets; NULL targets fall back to values derived from the client profile."""
+    client_id = db.Column(db.String, db.ForeignKey('client.id'), primary_key=True)
+    calories = db.Column(db.Float)
+    protein = db.Column(db.Float)
+    carbs = db.Column(db.Float)
+    fat = db.Column(db.Float)
+    fiber = db.Column(db.Float)
+    water = db.Column(db.Float)  # glasses
+    activity_level = db.Column(db.String(20), default='moderate')  # sedentary | light | moderate | active | very_active
+    goal_type = db.Column(db.String(20), default='maintain')  # lose | maintain | gain
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    client = db.relationship('Client', backref=db.backref('nutrition_goal', uselist=False, lazy=True))
+
 class License(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
@@ -163,14 +267,33 @@ class Resource(db.Model):
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Message(db.Model):
+    __table_args__ = (db.Index('ix_message_client_id_timestamp', 'client_id', 'timestamp', 'id'),
+                      db.Index('ix_message_client_id_position', 'client_id', 'position'))
     id = db.Column(db.String, primary_key=True, default=lambda: f"msg_{uuid.uuid4()}")
     client_id = db.Column(db.String, db.ForeignKey('client.id'), nullable=False)
     sender_type = db.Column(db.String(50), nullable=False)
     text = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    seq = db.Column(db.BigInteger)  # server-assigned ordering key, see message_writer.SequenceClock
+    position = db.Column(db.BigInteger)  # assigned at insert in commit order, see message_service.allocate_positions
     client = db.relationship('Client', backref=db.backref('messages', lazy=True))
 
+class SequenceCounter(db.Model):
+    """Named counters incremented inside the caller's transaction."""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+class MessageReadState(db.Model):
+    """How far each participant of a client's conversation has read."""
+    client_id = db.Column(db.String, db.ForeignKey('client.id'), primary_key=True)
+    reader = db.Column(db.String(20), primary_key=True)  # client | trainer
+    last_read_at = db.Column(db.DateTime, nullable=False)  # timestamp of the newest message read
+    last_read_message_id = db.Column(db.String)
+    last_read_position = db.Column(db.BigInteger, nullable=False, default=0)  # position of that message
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class Achievement(db.Model):
+    __table_args__ = (db.Index('ix_achievement_client_id_unlocked_at', 'client_id', 'unlocked_at'),)
     id = db.Column(db.String, primary_key=True, default=lambda: f"ach_{uuid.uuid4()}")
     client_id = db.Column(db.String, db.ForeignKey('client.id'), nullable=False)
     type = db.Column(db.String(50), nullable=False)
@@ -181,6 +304,7 @@ class Achievement(db.Model):
     client = db.relationship('Client', backref=db.backref('achievements', lazy=True))
 
 class BodyStat(db.Model):
+    __table_args__ = (db.Index('ix_body_stat_client_id_date', 'client_id', 'date', 'id'),)
     id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
     client_id = db.Column(db.String, db.ForeignKey('client.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
@@ -189,6 +313,7 @@ class BodyStat(db.Model):
     client = db.relationship('Client', backref=db.backref('body_stats', lazy=True))
 
 class ProgressPhoto(db.Model):
+    __table_args__ = (db.Index('ix_progress_photo_client_id_timestamp', 'client_id', 'timestamp', 'id'),)
     id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
     client_id = db.Column(db.String, db.ForeignKey('client.id'), nullable=False)
     filename = db.Column(db.String(200), nullable=False)
@@ -221,4 +346,26 @@ class Program(db.Model):
     id = db.Column(db.String, primary_key=True, default=lambda: f"prg_{uuid.uuid4()}")
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    weeks = db.Column(db.Text, default='[]') 
\ No newline at end of file
+    weeks = db.Column(db.Text, default='[]')
+
+class Job(db.Model):
+    """A long-running operation executed by the in-process job runner."""
+    __table_args__ = (
+        db.Index('ix_job_type_status', 'type', 'status'),
+        # At most one queued/running job per type, so concurrent enqueues cannot both insert
+        db.Index('uq_job_active_type', 'type', unique=True,
+                 sqlite_where=db.text("status IN ('queued', 'running')"),
+                 postgresql_where=db.text("status IN ('queued', 'running')")),
+    )
+    id = db.Column(db.String, primary_key=True, default=lambda: f"job_{uuid.uuid4()}")
+    type = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default='queued')  # queued | running | succeeded | failed
+    progress = db.Column(db.Float)                       # 0..1, NULL when the total is unknown
+    message = db.Column(db.Text)
+    params = db.Column(db.Text, default='{}')
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
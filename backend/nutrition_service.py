@@ -0,0 +1,210 @@
+from datetime import timedelta
+from functools import lru_cache
+
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, Client, NutritionLog, NutritionDailyTotal, NutritionGoal
+
+MACRO_FIELDS = ('calories', 'protein', 'carbs', 'fat', 'fiber', 'sugar', 'sodium')
+GRANULARITIES = ('day', 'week', 'month')
+
+GOAL_FIELDS = ('calories', 'protein', 'carbs', 'fat', 'fiber', 'water')
+# Used when the profile lacks weight, height or age
+DEFAULT_GOALS = {'calories': 2000, 'protein': 150, 'carbs': 200, 'fat': 65, 'fiber': 25, 'water': 8}
+ACTIVITY_MULTIPLIERS = {
+    'sedentary': 1.2,
+    'light': 1.375,
+    'moderate': 1.55,
+    'active': 1.725,
+    'very_active': 1.9,
+}
+GOAL_CALORIE_ADJUSTMENT = {'lose': -500, 'maintain': 0, 'gain': 300}
+
+
+def _sum_columns():
+    return [db.func.coalesce(db.func.sum(getattr(NutritionLog, field)), 0).label(field) for field in MACRO_FIELDS] \
+        + [db.func.count(NutritionLog.id).label('entry_count')]
+
+
+def refresh_daily_total(client_id, log_date):
+    """
+    Recomputes the rollup row for one client and day from that day's logs
+    (pending session changes included) and stages it without committing,
+    so it lands in the same transaction as the log change. Days with no
+    entries left lose their row.
+
+    A missing row is created in a savepoint first and the row is then read
+    FOR UPDATE, as in update_personal_records, so two first entries for a
+    day logged at once do not collide on the primary key. The sums are read
+    after the lock, so a concurrent recompute that committed first is
+    counted rather than overwritten.
+    """
+    def locked():
+        return NutritionDailyTotal.query.filter_by(client_id=client_id, log_date=log_date) \
+            .with_for_update().populate_existing().first()
+
+    def day_sums():
+        return db.session.query(*_sum_columns()) \
+            .filter(NutritionLog.client_id == client_id, NutritionLog.log_date == log_date).one()
+
+    total = locked()
+    if total is None:
+        if not day_sums().entry_count:
+            return None
+        try:
+            with db.session.begin_nested():
+                db.session.execute(NutritionDailyTotal.__table__.insert()
+                                   .values(client_id=client_id, log_date=log_date, entry_count=0,
+                                           **{field: 0 for field in MACRO_FIELDS}))
+        except IntegrityError:
+            pass  # Created by a concurrent log for the same day; locked and recomputed below
+        total = locked()
+    sums = day_sums()
+    if not sums.entry_count:
+        db.session.delete(total)
+        return None
+    for field in MACRO_FIELDS:
+        setattr(total, field, getattr(sums, field))
+    total.entry_count = sums.entry_count
+    return total
+
+
+def get_daily_total(client_id, log_date):
+    """Totals for one day as a dict, zeros when nothing was logged."""
+    total = db.session.get(NutritionDailyTotal, (client_id, log_date))
+    result = {field: getattr(total, field) if total else 0 for field in MACRO_FIELDS}
+    result['entries'] = total.entry_count if total else 0
+    return result
+
+
+def _bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())  # ISO weeks start on Monday
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_bucket(start, granularity):
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def daily_totals_query(client_id, start, end):
+    """Daily rollup rows of a client between `start` and `end` (inclusive), oldest first."""
+    return NutritionDailyTotal.query \
+        .filter(NutritionDailyTotal.client_id == client_id,
+                NutritionDailyTotal.log_date >= start,
+                NutritionDailyTotal.log_date <= end) \
+        .order_by(NutritionDailyTotal.log_date)
+
+
+def get_nutrition_totals(client_id, start, end, granularity='day'):
+    """
+    Macro totals per day, ISO week or month between `start` and `end`
+    (inclusive), read from the daily rollups with one indexed range scan.
+    Every bucket in the range is present, zero-filled when nothing was
+    logged; `days_logged` counts the days in the bucket with entries.
+    """
+    rows = daily_totals_query(client_id, start, end).all()
+
+    buckets = {}
+    cursor = _bucket_start(start, granularity)
+    while cursor <= end:
+        buckets[cursor] = dict({field: 0 for field in MACRO_FIELDS}, entries=0, days_logged=0)
+        cursor = _next_bucket(cursor, granularity)
+
+    for row in rows:
+        bucket = buckets[_bucket_start(row.log_date, granularity)]
+        for field in MACRO_FIELDS:
+            bucket[field] += getattr(row, field)
+        bucket['entries'] += row.entry_count
+        bucket['days_logged'] += 1
+
+    return [dict(values, period_start=period.isoformat()) for period, values in buckets.items()]
+
+
+def backfill_nutrition_totals():
+    """Rebuilds every rollup row from the nutrition logs in one INSERT ... SELECT. Returns the number of daily rows."""
+    NutritionDailyTotal.query.delete(synchronize_session=False)
+    grouped = db.select(NutritionLog.client_id, NutritionLog.log_date, *_sum_columns()) \
+        .group_by(NutritionLog.client_id, NutritionLog.log_date)
+    columns = ['client_id', 'log_date', *MACRO_FIELDS, 'entry_count']
+    db.session.execute(db.insert(NutritionDailyTotal).from_select(columns, grouped))
+    db.session.commit()
+    return NutritionDailyTotal.query.count()
+
+
+@lru_cache(maxsize=4096)
+def compute_targets(weight, height, age, gender, activity_level, goal_type):
+    """
+    Derived daily targets for a profile. BMR uses Mifflin-St Jeor (weight
+    in kg, height in cm); TDEE scales it by activity level. Protein is
+    1.8 g/kg, fat 25% of calories, carbs the remainder and fiber 14 g per
+    1000 kcal. Cached on the profile tuple, so a profile change simply
+    misses the cache. Callers must not mutate the returned dict.
+    """
+    if not weight or not height or not age:
+        return dict(DEFAULT_GOALS, bmr=None, tdee=None)
+    sex_offset = {'male': 5, 'female': -161}.get((gender or '').lower(), -78)  # midpoint when unknown
+    bmr = 10 * weight + 6.25 * height - 5 * age + sex_offset
+    tdee = bmr * ACTIVITY_MULTIPLIERS.get(activity_level, ACTIVITY_MULTIPLIERS['moderate'])
+    calories = max(1200.0, tdee + GOAL_CALORIE_ADJUSTMENT.get(goal_type, 0))
+    protein = 1.8 * weight
+    fat = calories * 0.25 / 9
+    carbs = max(0.0, (calories - protein * 4 - fat * 9) / 4)
+    return {
+        'calories': round(calories),
+        'protein': round(protein),
+        'carbs': round(carbs),
+        'fat': round(fat),
+        'fiber': round(calories / 1000 * 14),
+        'water': DEFAULT_GOALS['water'],
+        'bmr': round(bmr),
+        'tdee': round(tdee),
+    }
+
+
+def resolve_goals(client, goal):
+    """Effective goals for a client: explicit targets where set, derived targets otherwise."""
+    activity_level = goal.activity_level if goal and goal.activity_level else 'moderate'
+    goal_type = goal.goal_type if goal and goal.goal_type else 'maintain'
+    derived = compute_targets(client.weight, client.height, client.age, client.gender, activity_level, goal_type)
+    custom = [field for field in GOAL_FIELDS if goal is not None and getattr(goal, field) is not None]
+    result = {field: getattr(goal, field) if field in custom else derived[field] for field in GOAL_FIELDS}
+    result.update(bmr=derived['bmr'], tdee=derived['tdee'], activity_level=activity_level, goal_type=goal_type,
+                  custom=custom)
+    return result
+
+
+def goals_vs_actual(log_date):
+    """
+    Goal and actual intake for every active client on one day, fetched in
+    a single query joining clients, their goals and that day's rollup.
+    """
+    rows = db.session.query(Client, NutritionGoal, NutritionDailyTotal) \
+        .outerjoin(NutritionGoal, NutritionGoal.client_id == Client.id) \
+        .outerjoin(NutritionDailyTotal, db.and_(NutritionDailyTotal.client_id == Client.id,
+                                                NutritionDailyTotal.log_date == log_date)) \
+        .filter(Client.deleted == False, Client.archived == False) \
+        .order_by(Client.name).all()
+
+    results = []
+    for client, goal, total in rows:
+        goals = resolve_goals(client, goal)
+        actual = {field: getattr(total, field) if total else 0 for field in MACRO_FIELDS}
+        actual['entries'] = total.entry_count if total else 0
+        results.append({
+            'client_id': client.id,
+            'name': client.name,
+            'goals': goals,
+            'actual': actual,
+            'percent': {
+                field: round(actual[field] / goals[field] * 100, 1) if goals[field] else None
+                for field in GOAL_FIELDS if field in actual
+            }
+        })
+    return results
@@ -0,0 +1,155 @@
+import base64
+import json
+from collections import namedtuple
+from datetime import date, datetime
+from urllib.parse import urlencode
+
+from flask import jsonify, request
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+PageRequest = namedtuple('PageRequest', 'field_set fields cursor limit')
+
+
+def json_field(column, empty):
+    """Field spec for a JSON text column, decoded to `empty()` when blank."""
+    return (column,), lambda obj: json.loads(getattr(obj, column)) if getattr(obj, column) else empty()
+
+
+class FieldSet:
+    """
+    The serializable fields of a model for list endpoints. Plain fields
+    map to the column of the same name (dates and datetimes as ISO
+    strings); computed fields are given as `key=(columns, fn)`. Knowing
+    which columns each field reads lets a `fields=` request load only
+    those columns as well as emit only those keys.
+    """
+
+    def __init__(self, model, *plain, **computed):
+        self.model = model
+        self.fields = {name: ((name,), None) for name in plain}
+        self.fields.update(computed)
+
+    def parse(self, raw):
+        """Parses a comma-separated `fields` value; None means every field."""
+        if not raw:
+            return None
+        names = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}. "
+                             f"Available: {', '.join(sorted(self.fields))}")
+        return names
+
+    def load_options(self, fields, extra=()):
+        """A load_only() option covering `fields` plus the `extra` column attributes."""
+        columns = {column for name in fields for column in self.fields[name][0]}
+        attributes = [getattr(self.model, column) for column in sorted(columns)]
+        return load_only(*attributes, *[attr for attr in extra if attr.key not in columns])
+
+    def serialize(self, obj, fields=None):
+        result = {}
+        for name in fields or self.fields:
+            columns, fn = self.fields[name]
+            if fn is not None:
+                result[name] = fn(obj)
+            else:
+                value = getattr(obj, columns[0])
+                result[name] = value.isoformat() if isinstance(value, (date, datetime)) else value
+        return result
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=lambda value: value.isoformat()).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def page_request(args, field_set):
+    """Reads `cursor`, `limit` and `fields` from request args; raises ValueError on bad input."""
+    cursor = None
+    if args.get('cursor'):
+        cursor = decode_cursor(args['cursor'])
+        if cursor is None:
+            raise ValueError("Invalid cursor")
+    try:
+        limit = int(args.get('limit') or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return PageRequest(field_set, field_set.parse(args.get('fields')), cursor, limit)
+
+
+def _cursor_value(column, value):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return value
+
+
+def _after(keys, cursor):
+    """Row-value comparison `keys > cursor` honouring each key's direction, spelled out for portability."""
+    values = [_cursor_value(column, value) for (column, _), value in zip(keys, cursor)]
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+        ties = [prior == values[j] for j, (prior, _) in enumerate(keys[:i])]
+        clauses.append(and_(*ties, column < values[i] if descending else column > values[i]))
+    return or_(*clauses)
+
+
+def page_query(query, page, keys):
+    """The query `paginate` runs for one page: cursor filter, key order and one row past the limit."""
+    if page.fields is not None:
+        query = query.options(page.field_set.load_options(page.fields, extra=[column for column, _ in keys]))
+    if page.cursor is not None:
+        if len(page.cursor) != len(keys):
+            raise ValueError("Invalid cursor")
+        try:
+            query = query.filter(_after(keys, page.cursor))
+        except (ValueError, TypeError):
+            raise ValueError("Invalid cursor")
+    query = query.order_by(*[column.desc() if descending else column.asc() for column, descending in keys])
+    return query.limit(page.limit + 1)
+
+
+def paginate(query, page, keys):
+    """
+    Fetches one keyset page. `keys` is a list of (column, descending)
+    pairs whose last entry must be unique (normally the primary key); the
+    cursor holds the last row's key values, so each page is an index
+    range scan however deep the client pages. Returns (items,
+    next_cursor), next_cursor being None on the last page.
+    """
+    items = page_query(query, page, keys).all()
+    if len(items) <= page.limit:
+        return items, None
+    items = items[:page.limit]
+    return items, encode_cursor([getattr(items[-1], column.key) for column, _ in keys])
+
+
+def paginated_response(items, next_cursor):
+    """
+    A JSON list response; when there is a further page its cursor is sent
+    as `X-Next-Cursor` and as a `Link: <...>; rel="next"` URL built from
+    the current query string.
+    """
+    response = jsonify(items)
+    if next_cursor:
+        args = request.args.to_dict(flat=False)
+        args['cursor'] = [next_cursor]
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args, doseq=True)}>; rel="next"'
+    return response
@@ -0,0 +1,239 @@
+import json
+
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, WorkoutLog, ExerciseSet, ExerciseLogEntry, PersonalRecord
+
+
+def epley_one_rm(weight, reps):
+    """Estimated one-rep max using the Epley formula, or None if the set has no load."""
+    if not weight or not reps:
+        return None
+    return weight * (1 + reps / 30)
+
+
+def _parse_number(value, cast):
+    try:
+        return cast(float(value)) if value not in (None, "") else None
+    except (ValueError, TypeError):
+        return None
+
+
+def get_performance_log(performance_data):
+    """
+    Returns the per-exercise `performanceLog` mapping from a stored
+    performance_data blob (JSON text) or an already-decoded dict.
+    """
+    if isinstance(performance_data, str):
+        try:
+            performance_data = json.loads(performance_data) if performance_data else {}
+        except json.JSONDecodeError:
+            return {}
+    if not isinstance(performance_data, dict):
+        return {}
+    performance_log = performance_data.get('performanceLog', {})
+    return performance_log if isinstance(performance_log, dict) else {}
+
+
+def record_workout_sets(workout_log, performance_log=None):
+    """
+    Materializes every set of a workout log into ExerciseSet rows, and
+    each exercise's set list as logged into an ExerciseLogEntry. The typed
+    set rows are for querying; history is served from the verbatim lists,
+    so extra keys, original value formats and empty lists survive.
+
+    The rows are added to the current session but not committed, so they are
+    written in the same transaction as the WorkoutLog itself. Returns the
+    ExerciseSet rows.
+    """
+    if performance_log is None:
+        performance_log = get_performance_log(workout_log.performance_data)
+    if not isinstance(performance_log, dict):
+        return []
+
+    exercise_sets = []
+    for exercise_id, sets in performance_log.items():
+        db.session.add(ExerciseLogEntry(
+            workout_log=workout_log,
+            exercise_id=str(exercise_id),
+            client_id=workout_log.client_id,
+            performed_on=workout_log.actual_date,
+            day_index=workout_log.day_index_completed,
+            sets=json.dumps(sets)
+        ))
+        if not isinstance(sets, list):
+            continue
+        for set_index, set_data in enumerate(sets):
+            if not isinstance(set_data, dict):
+                continue
+            reps = _parse_number(set_data.get('reps'), int)
+            weight = _parse_number(set_data.get('weight'), float)
+            exercise_set = ExerciseSet(
+                workout_log=workout_log,
+                client_id=workout_log.client_id,
+                exercise_id=str(exercise_id),
+                performed_on=workout_log.actual_date,
+                day_index=workout_log.day_index_completed,
+                set_index=set_index,
+                reps=reps,
+                weight=weight,
+                completed=bool(set_data.get('completed')),
+                one_rm=epley_one_rm(weight, reps)
+            )
+            db.session.add(exercise_set)
+            exercise_sets.append(exercise_set)
+    return exercise_sets
+
+
+def summarize_volume(exercise_sets):
+    """
+    Totals for one workout's sets: distinct exercises, sets logged and
+    completed, and the reps and volume (weight x reps) of completed sets.
+    """
+    completed = [s for s in exercise_sets if s.completed]
+    return {
+        'exercises': len({s.exercise_id for s in exercise_sets}),
+        'sets': len(exercise_sets),
+        'completed_sets': len(completed),
+        'reps': sum(s.reps or 0 for s in completed),
+        'volume': round(sum((s.weight or 0) * (s.reps or 0) for s in completed), 2),
+    }
+
+def backfill_exercise_sets(batch_size=500, progress=None):
+    """
+    Rebuilds the ExerciseSet and ExerciseLogEntry tables from every stored
+    WorkoutLog.
+
+    Existing rows are dropped first so the backfill can be re-run safely.
+    Logs are walked in primary-key order and committed in batches.
+    Returns the number of (logs, sets) processed.
+    """
+    db.session.query(ExerciseSet).delete(synchronize_session=False)
+    db.session.query(ExerciseLogEntry).delete(synchronize_session=False)
+    db.session.commit()
+    total_logs = WorkoutLog.query.count()
+
+    log_count = 0
+    set_count = 0
+    last_id = None
+    while True:
+        query = WorkoutLog.query.order_by(WorkoutLog.id)
+        if last_id is not None:
+            query = query.filter(WorkoutLog.id > last_id)
+        logs = query.limit(batch_size).all()
+        if not logs:
+            break
+
+        for log in logs:
+            set_count += len(record_workout_sets(log))
+        db.session.commit()
+
+        log_count += len(logs)
+        last_id = logs[-1].id
+        db.session.expunge_all()
+        if progress:
+            progress(log_count / total_logs if total_logs else None, f"Backfilled {log_count} of {total_logs} workout logs")
+
+    return log_count, set_count
+
+
+def update_personal_records(client_id, exercise_sets):
+    """
+    Folds newly recorded sets into the client's PersonalRecord index.
+
+    Only completed sets with a load count. Like record_workout_sets this does
+    not commit, so the index moves in the same transaction as the log.
+    Rows are read FOR UPDATE, and missing ones are created in a savepoint
+    first, so two workouts logged at once for the same exercise neither
+    fail on the primary key nor overwrite each other's best.
+    Returns the PersonalRecord rows that changed.
+    """
+    sets_by_exercise = {}
+    for exercise_set in exercise_sets:
+        if exercise_set.completed and exercise_set.weight and exercise_set.weight > 0:
+            sets_by_exercise.setdefault(exercise_set.exercise_id, []).append(exercise_set)
+    if not sets_by_exercise:
+        return []
+
+    def locked(exercise_ids):
+        return {
+            record.exercise_id: record
+            for record in PersonalRecord.query.filter(
+                PersonalRecord.client_id == client_id,
+                PersonalRecord.exercise_id.in_(exercise_ids)
+            ).with_for_update()
+        }
+
+    records = locked(list(sets_by_exercise))
+    missing = [exercise_id for exercise_id in sets_by_exercise if exercise_id not in records]
+    for exercise_id in missing:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(PersonalRecord.__table__.insert()
+                                   .values(client_id=client_id, exercise_id=exercise_id, max_weight=0))
+        except IntegrityError:
+            pass  # Created by a concurrent log for the same exercise; locked and updated below
+    if missing:
+        records.update(locked(missing))
+
+    changed = []
+    for exercise_id, sets in sets_by_exercise.items():
+        record = records[exercise_id]
+        updated = False
+        for exercise_set in sets:
+            if exercise_set.weight > (record.max_weight or 0):
+                record.max_weight = exercise_set.weight
+                updated = True
+            if exercise_set.one_rm and exercise_set.one_rm > (record.one_rm or 0):
+                record.weight = exercise_set.weight
+                record.reps = exercise_set.reps
+                record.one_rm = exercise_set.one_rm
+                record.achieved_on = exercise_set.performed_on
+                updated = True
+        if updated:
+            changed.append(record)
+    return changed
+
+
+def rebuild_personal_records():
+    """
+    Recomputes the PersonalRecord index from the ExerciseSet table with a
+    single windowed query. Run after backfill_exercise_sets on existing data.
+    Returns the number of records written.
+    """
+    partition = (ExerciseSet.client_id, ExerciseSet.exercise_id)
+    ranked = db.session.query(
+        ExerciseSet.client_id,
+        ExerciseSet.exercise_id,
+        ExerciseSet.weight,
+        ExerciseSet.reps,
+        ExerciseSet.one_rm,
+        ExerciseSet.performed_on,
+        db.func.max(ExerciseSet.weight).over(partition_by=partition).label('max_weight'),
+        db.func.row_number().over(
+            partition_by=partition,
+            # NULLS LAST explicitly: Postgres sorts NULLs first on DESC, which would rank a set without a 1RM top
+            order_by=(ExerciseSet.one_rm.desc().nullslast(), ExerciseSet.performed_on.asc())
+        ).label('rank')
+    ).filter(
+        ExerciseSet.completed == True,
+        ExerciseSet.weight > 0
+    ).subquery()
+
+    rows = db.session.query(ranked).filter(ranked.c.rank == 1).all()
+
+    db.session.query(PersonalRecord).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(PersonalRecord, [
+        {
+            'client_id': row.client_id,
+            'exercise_id': row.exercise_id,
+            'weight': row.weight if row.one_rm else None,
+            'reps': row.reps if row.one_rm else None,
+            'one_rm': row.one_rm,
+            'achieved_on': row.performed_on if row.one_rm else None,
+            'max_weight': row.max_weight
+        }
+        for row in rows
+    ])
+    db.session.commit()
+    return len(rows)
@@ -0,0 +1,272 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+try:  # Optional: only needed when PRESENCE_BACKEND=redis
+    import redis
+except ImportError:
+    redis = None
+
+DEFAULT_PRESENCE_TTL = 60  # seconds a connection stays online without a heartbeat
+SWEEP_INTERVAL = 15
+
+
+class PresenceRegistry(ABC):
+    """
+    Tracks which clients have a live Socket.IO connection. Every sid maps
+    to one client and every client to its set of sids, each entry expiring
+    `ttl` seconds after its last heartbeat so connections lost without a
+    disconnect (a worker crash, say) still drop out.
+
+    `join` returns True when the client just came online; `leave` and
+    `expire` return the clients that just went offline, so the caller can
+    announce transitions exactly once.
+    """
+
+    def __init__(self, ttl=DEFAULT_PRESENCE_TTL, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self._thread = None
+
+    @abstractmethod
+    def join(self, sid, client_id):
+        ...
+
+    @abstractmethod
+    def heartbeat(self, sid):
+        """Extends a connection's expiry; False when the sid is not registered (any more)."""
+
+    @abstractmethod
+    def leave(self, sid):
+        """Drops a connection. Returns the client id if that was its last one, else None."""
+
+    @abstractmethod
+    def expire(self):
+        """Drops connections past their expiry. Returns the client ids that went offline."""
+
+    @abstractmethod
+    def snapshot(self):
+        """Online clients as dicts of client_id, connections, online_since and expires_at."""
+
+    def start(self, on_offline, interval=SWEEP_INTERVAL, logger=None):
+        """Runs `expire` every `interval` seconds, passing clients that went offline to `on_offline`."""
+        if self._thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    for client_id in self.expire():
+                        on_offline(client_id)
+                except Exception as e:
+                    # Retried on the next sweep
+                    if logger:
+                        logger.error(f"Presence sweep failed: {e}")
+
+        self._thread = threading.Thread(target=run, name='presence-sweeper', daemon=True)
+        self._thread.start()
+
+
+def _presence_dict(client_id, connections, online_since, expires_at):
+    return {
+        'client_id': client_id,
+        'connections': connections,
+        'online_since': online_since,
+        'expires_at': datetime.utcfromtimestamp(expires_at).isoformat(),
+    }
+
+
+class MemoryPresenceRegistry(PresenceRegistry):
+    """Process-local registry; sees only this worker's connections."""
+
+    def __init__(self, ttl=DEFAULT_PRESENCE_TTL, clock=time.time):
+        super().__init__(ttl, clock)
+        self._sids = {}      # sid -> client_id
+        self._clients = {}   # client_id -> {sid: expires_at}
+        self._since = {}     # client_id -> ISO time it came online
+        self._lock = threading.Lock()
+
+    def _drop(self, sid):
+        client_id = self._sids.pop(sid, None)
+        if client_id is None:
+            return None
+        sids = self._clients.get(client_id, {})
+        sids.pop(sid, None)
+        if sids:
+            return None
+        self._clients.pop(client_id, None)
+        self._since.pop(client_id, None)
+        return client_id
+
+    def join(self, sid, client_id):
+        with self._lock:
+            if self._sids.get(sid) not in (None, client_id):
+                self._drop(sid)
+            came_online = client_id not in self._clients
+            self._sids[sid] = client_id
+            self._clients.setdefault(client_id, {})[sid] = self.clock() + self.ttl
+            self._since.setdefault(client_id, datetime.utcnow().isoformat())
+        return came_online
+
+    def heartbeat(self, sid):
+        with self._lock:
+            client_id = self._sids.get(sid)
+            if client_id is None:
+                return False
+            self._clients[client_id][sid] = self.clock() + self.ttl
+            return True
+
+    def leave(self, sid):
+        with self._lock:
+            return self._drop(sid)
+
+    def expire(self):
+        now = self.clock()
+        with self._lock:
+            expired = [sid for sids in self._clients.values() for sid, expires_at in sids.items()
+                       if expires_at <= now]
+            return [client_id for client_id in map(self._drop, expired) if client_id]
+
+    def snapshot(self):
+        with self._lock:
+            return [_presence_dict(client_id, len(sids), self._since.get(client_id), max(sids.values()))
+                    for client_id, sids in self._clients.items()]
+
+
+class RedisPresenceRegistry(PresenceRegistry):
+    """
+    Registry shared by all workers through Redis, normally the server that
+    already carries the Socket.IO message queue. Each client has a sorted
+    set of sids scored by expiry, and `presence:online` scores clients by
+    their newest expiry, so a snapshot is one range query. Which client a
+    sid belongs to is kept locally: a sid lives on the worker that accepted
+    it. Every check-and-update runs as one Lua script, so a join can never
+    interleave with another worker removing the same client, and only the
+    worker whose script removed a client announces it going offline.
+    """
+
+    ONLINE_KEY = "presence:online"
+    SINCE_KEY = "presence:since"
+    CLIENT_PREFIX = "presence:client:"
+
+    # KEYS: client sids, online, since. ARGV: sid, client_id, expires_at, now, online_since
+    JOIN_SCRIPT = """
+    local previous = redis.call('ZSCORE', KEYS[2], ARGV[2])
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[2])
+    if previous and tonumber(previous) > tonumber(ARGV[4]) then
+        return 0
+    end
+    redis.call('HSET', KEYS[3], ARGV[2], ARGV[5])
+    return 1
+    """
+    # KEYS: client sids, online. ARGV: sid, client_id, expires_at, now
+    HEARTBEAT_SCRIPT = """
+    local current = redis.call('ZSCORE', KEYS[1], ARGV[1])
+    if not current or tonumber(current) <= tonumber(ARGV[4]) then
+        return 0
+    end
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[2])
+    return 1
+    """
+    # KEYS: client sids, online, since. ARGV: client_id, now, sid to drop first ('' for none)
+    REMOVE_IF_EMPTY_SCRIPT = """
+    if ARGV[3] ~= '' then
+        redis.call('ZREM', KEYS[1], ARGV[3])
+    end
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+    if redis.call('ZCARD', KEYS[1]) > 0 then
+        return 0
+    end
+    if redis.call('ZREM', KEYS[2], ARGV[1]) == 0 then
+        return 0
+    end
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    return 1
+    """
+
+    def __init__(self, url, ttl=DEFAULT_PRESENCE_TTL, clock=time.time):
+        if redis is None:
+            raise RuntimeError("PRESENCE_BACKEND=redis requires the 'redis' package")
+        super().__init__(ttl, clock)
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self._join = self.client.register_script(self.JOIN_SCRIPT)
+        self._heartbeat = self.client.register_script(self.HEARTBEAT_SCRIPT)
+        self._remove_if_empty_script = self.client.register_script(self.REMOVE_IF_EMPTY_SCRIPT)
+        self._sids = {}
+        self._lock = threading.Lock()
+
+    def _key(self, client_id):
+        return f"{self.CLIENT_PREFIX}{client_id}"
+
+    def _remove_if_empty(self, client_id, sid=''):
+        """Drops `sid`, then forgets the client if no live sids remain; True for the one caller that removed it."""
+        keys = [self._key(client_id), self.ONLINE_KEY, self.SINCE_KEY]
+        return bool(self._remove_if_empty_script(keys=keys, args=[client_id, self.clock(), sid]))
+
+    def join(self, sid, client_id):
+        with self._lock:
+            previous = self._sids.get(sid)
+            self._sids[sid] = client_id
+        if previous not in (None, client_id):
+            self._remove_if_empty(previous, sid)
+        now = self.clock()
+        # An entry past its expiry but not swept yet counts as offline too
+        came_online = self._join(keys=[self._key(client_id), self.ONLINE_KEY, self.SINCE_KEY],
+                                 args=[sid, client_id, now + self.ttl, now, datetime.utcnow().isoformat()])
+        return bool(came_online)
+
+    def heartbeat(self, sid):
+        with self._lock:
+            client_id = self._sids.get(sid)
+        if client_id is None:
+            return False
+        now = self.clock()
+        if self._heartbeat(keys=[self._key(client_id), self.ONLINE_KEY], args=[sid, client_id, now + self.ttl, now]):
+            return True
+        # Expired by a sweep, possibly on another worker: the client has to join again
+        with self._lock:
+            self._sids.pop(sid, None)
+        return False
+
+    def leave(self, sid):
+        with self._lock:
+            client_id = self._sids.pop(sid, None)
+        if client_id is None:
+            return None
+        return client_id if self._remove_if_empty(client_id, sid) else None
+
+    def expire(self):
+        stale = self.client.zrangebyscore(self.ONLINE_KEY, '-inf', self.clock())
+        offline = [client_id for client_id in stale if self._remove_if_empty(client_id)]
+        with self._lock:
+            for sid in [sid for sid, client_id in self._sids.items() if client_id in stale]:
+                del self._sids[sid]
+        return offline
+
+    def snapshot(self):
+        now = self.clock()
+        online = self.client.zrangebyscore(self.ONLINE_KEY, now, '+inf', withscores=True)
+        if not online:
+            return []
+        with self.client.pipeline() as pipe:
+            for client_id, _ in online:
+                pipe.zcount(self._key(client_id), now, '+inf')
+            counts = pipe.execute()
+        since = self.client.hmget(self.SINCE_KEY, [client_id for client_id, _ in online])
+        return [_presence_dict(client_id, count, online_since, expires_at)
+                for (client_id, expires_at), count, online_since in zip(online, counts, since) if count]
+
+
+def create_presence_registry(config):
+    """Builds the registry selected by PRESENCE_BACKEND ('memory' or 'redis')."""
+    backend = config.get('PRESENCE_BACKEND', 'memory')
+    ttl = config.get('PRESENCE_TTL', DEFAULT_PRESENCE_TTL)
+    if backend == 'memory':
+        return MemoryPresenceRegistry(ttl)
+    if backend == 'redis':
+        return RedisPresenceRegistry(config['PRESENCE_REDIS_URL'], ttl)
+    raise ValueError(f"Unknown PRESENCE_BACKEND: {backend}")
@@ -0,0 +1,103 @@
+from datetime import date, timedelta
+
+from .models import db, Client, WorkoutLog, BodyStat
+from .message_service import unread_counts_subquery
+
+SUMMARY_SORT_KEYS = ('name', 'last_workout', 'workouts_7d', 'workouts_30d', 'latest_weight', 'weight_change',
+                     'unread')
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _workout_stats(today):
+    """Last workout date and 7/30 day workout counts per client, in one grouped scan of the workout log."""
+    def since(days):
+        return db.func.sum(db.case((WorkoutLog.actual_date > today - timedelta(days=days), 1), else_=0))
+
+    return db.session.query(
+        WorkoutLog.client_id.label('client_id'),
+        db.func.max(WorkoutLog.actual_date).label('last_workout'),
+        since(7).label('workouts_7d'),
+        since(30).label('workouts_30d'),
+    ).group_by(WorkoutLog.client_id).subquery()
+
+
+def _weight_stats():
+    """Latest weigh-in per client plus the change from the one before it, via ROW_NUMBER and LEAD windows."""
+    window = {'partition_by': BodyStat.client_id, 'order_by': (BodyStat.date.desc(), BodyStat.id.desc())}
+    ranked = db.session.query(
+        BodyStat.client_id.label('client_id'),
+        BodyStat.date.label('weighed_on'),
+        BodyStat.weight.label('weight'),
+        db.func.row_number().over(**window).label('position'),
+        # Ordered newest first, so LEAD is the previous weigh-in
+        db.func.lead(BodyStat.weight).over(**window).label('previous_weight'),
+    ).filter(BodyStat.weight.isnot(None)).subquery()
+
+    return db.session.query(
+        ranked.c.client_id,
+        ranked.c.weighed_on,
+        ranked.c.weight.label('latest_weight'),
+        (ranked.c.weight - ranked.c.previous_weight).label('weight_change'),
+    ).filter(ranked.c.position == 1).subquery()
+
+
+def get_client_summaries(sort='name', descending=False, limit=DEFAULT_PAGE_SIZE, offset=0, today=None):
+    """
+    Roster rows for every active client: last workout date, workouts in
+    the last 7 and 30 days, latest body weight and its change since the
+    previous weigh-in, and messages the trainer has not read yet. Each
+    metric comes from one grouped subquery joined to the client table, so
+    the cost is a fixed number of scans whatever the roster size. Clients
+    missing a metric sort after the others in either direction. Returns
+    (rows, total).
+    """
+    today = today or date.today()
+    workouts = _workout_stats(today)
+    weights = _weight_stats()
+    unread = unread_counts_subquery('trainer')
+
+    columns = {
+        'name': Client.name,
+        'last_workout': workouts.c.last_workout,
+        'workouts_7d': db.func.coalesce(workouts.c.workouts_7d, 0),
+        'workouts_30d': db.func.coalesce(workouts.c.workouts_30d, 0),
+        'latest_weight': weights.c.latest_weight,
+        'weight_change': weights.c.weight_change,
+        'unread': db.func.coalesce(unread.c.unread, 0),
+    }
+    sort_column = columns[sort]
+    query = db.session.query(
+        Client.id, Client.name, Client.email, Client.unique_url,
+        weights.c.weighed_on,
+        *[column.label(key) for key, column in columns.items() if key != 'name'],
+        db.func.count().over().label('total'),
+    ).outerjoin(workouts, workouts.c.client_id == Client.id) \
+        .outerjoin(weights, weights.c.client_id == Client.id) \
+        .outerjoin(unread, unread.c.client_id == Client.id) \
+        .filter(Client.deleted == False, Client.archived == False) \
+        .order_by(db.case((sort_column.is_(None), 1), else_=0),
+                  sort_column.desc() if descending else sort_column.asc(),
+                  Client.name, Client.id) \
+        .limit(limit).offset(offset)
+
+    rows = query.all()
+    if not rows and offset:
+        # The window total rides on the page rows, so count separately past the end
+        total = Client.query.filter_by(deleted=False, archived=False).count()
+    else:
+        total = rows[0].total if rows else 0
+
+    return [{
+        'id': row.id,
+        'name': row.name,
+        'email': row.email,
+        'unique_url': row.unique_url,
+        'last_workout': row.last_workout.isoformat() if row.last_workout else None,
+        'workouts_7d': int(row.workouts_7d),
+        'workouts_30d': int(row.workouts_30d),
+        'latest_weight': row.latest_weight,
+        'latest_weight_date': row.weighed_on.isoformat() if row.weighed_on else None,
+        'weight_change': round(row.weight_change, 2) if row.weight_change is not None else None,
+        'unread': int(row.unread),
+    } for row in rows], total
@@ -1,66 +1,74 @@
 from flask import current_app as app, jsonify, request, send_from_directory
 from functools import wraps
+import hashlib
 import json
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 import uuid
 import os
-import urllib.parse
 import pathlib
+import re
 
 from sqlalchemy import or_
 from sqlalchemy.exc import IntegrityError
 
 from .achievements_service import check_for_new_pbs, add_achievements_to_client
-from .exercisedb_service import sync_exercises_from_exercisedb
-
-from .app import db, socketio, cache
-from flask_socketio import join_room, leave_room, emit
+from .jobs import enqueue_job, job_to_dict, JOB_HANDLERS, TRAINER_ROOM
+from .performance_service import record_workout_sets, update_personal_records, summarize_volume
+from .nutrition_service import (refresh_daily_total, get_daily_total, get_nutrition_totals, resolve_goals,
+                                goals_vs_actual, MACRO_FIELDS, GRANULARITIES, GOAL_FIELDS,
+                                ACTIVITY_MULTIPLIERS, GOAL_CALORIE_ADJUSTMENT)
+from .roster_service import (get_client_summaries, SUMMARY_SORT_KEYS, DEFAULT_PAGE_SIZE as SUMMARY_PAGE_SIZE,
+                             MAX_PAGE_SIZE as SUMMARY_MAX_PAGE_SIZE)
+from .pagination import FieldSet, json_field, page_request, paginate, paginated_response
+from .client_cache import ClientResolutionCache
+from .counters import read_counter, increment_counter
+from .session_store import create_session_store
+from .autosave_buffer import AutosaveBuffer
+from .message_writer import MessageWriter
+from .presence import create_presence_registry
+from .workout_feed import WorkoutFeed
+from .message_service import (READERS, unread_count, unread_counts, mark_read, read_state_to_dict, read_position,
+                              allocate_positions)
+from .legacy_json import LegacyJSONIndex, legacy_template_days
+from .exercise_library import exercise_to_dict, exercise_library_response, invalidate_exercise_library
+from .exercise_search import (get_exercise_search_index, decode_cursor, FACETS,
+                              DEFAULT_PAGE_SIZE as SEARCH_PAGE_SIZE, MAX_PAGE_SIZE as SEARCH_MAX_PAGE_SIZE)
+
+from .app import db, socketio
+from flask_socketio import join_room, leave_room, emit, rooms
 from flask import request
 from .models import (Client, Exercise, WorkoutTemplate, ProgramAssignment, WorkoutLog,
                      Recipe, MealPlan, NutritionLog, BodyStat, ProgressPhoto, License,
                      Prospect, Resource, Message, Achievement, DailyCheckin, Group, Alert, Program,
-                     Category, Muscle, Equipment)
+                     Category, Muscle, Equipment, ExerciseLogEntry, PersonalRecord, Job, NutritionGoal,
+                     MessageReadState)
 
 
 # --- to_dict helpers ---
+# Field sets back the list endpoints' `fields=` parameter as well as the to_dict helpers
+CLIENT_FIELDS = FieldSet(
+    Client, 'id', 'name', 'email', 'unique_url', 'points', 'archived', 'deleted', 'phone', 'age', 'gender',
+    'height', 'weight', 'bodyfat', 'goals', 'medical_history', 'injuries', 'lifestyle', 'hours_sleep',
+    'stress_level', 'hydration_level', 'nutrition_habits', 'workout_history', 'workout_frequency',
+    'workout_preference', 'workout_availability',
+    features=json_field('features', dict),
+    daily_metrics=json_field('daily_metrics', dict),
+)
+PROGRAM_FIELDS = FieldSet(Program, 'id', 'name', 'description', weeks=json_field('weeks', list))
+BODY_STAT_FIELDS = FieldSet(BodyStat, 'id', 'client_id', 'date', 'weight',
+                            measurements=json_field('measurements', dict))
+PROGRESS_PHOTO_FIELDS = FieldSet(ProgressPhoto, 'id', 'client_id', 'filename', 'timestamp',
+                                 url=(('filename',), lambda photo: f'/uploads/{photo.filename}'))
+MESSAGE_FIELDS = FieldSet(Message, 'id', 'client_id', 'sender_type', 'text', 'timestamp', 'seq')
+TEMPLATE_FIELDS = FieldSet(WorkoutTemplate, 'id', 'name', 'days', 'created_at', 'updated_at', 'is_public')
+PROGRAM_ASSIGNMENT_FIELDS = FieldSet(ProgramAssignment, 'id', 'client_id', 'template_id', 'start_date',
+                                     'current_day_index', 'active')
+
 def client_to_dict(client):
-    return {
-        'id': client.id,
-        'name': client.name,
-        'email': client.email,
-        'unique_url': client.unique_url,
-        'features': json.loads(client.features) if client.features else {},
-        'points': client.points,
-        'daily_metrics': json.loads(client.daily_metrics) if client.daily_metrics else {},
-        'archived': client.archived,
-        'deleted': client.deleted,
-        'phone': client.phone,
-        'age': client.age,
-        'gender': client.gender,
-        'height': client.height,
-        'weight': client.weight,
-        'bodyfat': client.bodyfat,
-        'goals': client.goals,
-        'medical_history': client.medical_history,
-        'injuries': client.injuries,
-        'lifestyle': client.lifestyle,
-        'hours_sleep': client.hours_sleep,
-        'stress_level': client.stress_level,
-        'hydration_level': client.hydration_level,
-        'nutrition_habits': client.nutrition_habits,
-        'workout_history': client.workout_history,
-        'workout_frequency': client.workout_frequency,
-        'workout_preference': client.workout_preference,
-        'workout_availability': client.workout_availability
-    }
+    return CLIENT_FIELDS.serialize(client)
 
 def program_to_dict(program):
-    return {
-        'id': program.id,
-        'name': program.name,
-        'description': program.description,
-        'weeks': json.loads(program.weeks) if program.weeks else []
-    }
+    return PROGRAM_FIELDS.serialize(program)
 
 def recipe_to_dict(recipe):
     return {
@@ -81,32 +89,19 @@ def meal_plan_to_dict(meal_plan):
     }
 
 def nutrition_log_to_dict(log):
-    macros_data = json.loads(log.macros) if log.macros else {}
-    return {
+    macros_data = {field: float(getattr(log, field) or 0) for field in MACRO_FIELDS}
+    macros_data['serving_size'] = log.serving_size or ''
+    macros_data['meal_type'] = log.meal_type or 'other'
+    return dict(macros_data, **{
         'id': log.id,
         'client_id': log.client_id,
         'log_date': log.log_date.isoformat() if log.log_date else None,
         'food_item': log.food_item,
-        'macros': macros_data,
-        'calories': macros_data.get('calories', 0),
-        'protein': macros_data.get('protein', 0),
-        'carbs': macros_data.get('carbs', 0),
-        'fat': macros_data.get('fat', 0),
-        'fiber': macros_data.get('fiber', 0),
-        'sugar': macros_data.get('sugar', 0),
-        'sodium': macros_data.get('sodium', 0),
-        'serving_size': macros_data.get('serving_size', ''),
-        'meal_type': macros_data.get('meal_type', 'other')
-    }
+        'macros': dict(macros_data)
+    })
 
 def body_stat_to_dict(stat):
-    return {
-        'id': stat.id,
-        'client_id': stat.client_id,
-        'date': stat.date.isoformat() if stat.date else None,
-        'weight': stat.weight,
-        'measurements': json.loads(stat.measurements) if stat.measurements else {}
-    }
+    return BODY_STAT_FIELDS.serialize(stat)
 
 def license_to_dict(license):
     return {
@@ -190,13 +185,7 @@ def workout_log_to_dict(log):
     }
 
 def message_to_dict(message):
-    return {
-        'id': message.id,
-        'client_id': message.client_id,
-        'sender_type': message.sender_type,
-        'text': message.text,
-        'timestamp': message.timestamp.isoformat() if message.timestamp else None
-    }
+    return MESSAGE_FIELDS.serialize(message)
 
 def achievement_to_dict(achievement):
     return {
@@ -209,71 +198,103 @@ def achievement_to_dict(achievement):
         'icon': achievement.icon
     }
 
-def exercise_to_dict(exercise):
-    # Determine URL for media - prefer local file if available
-    gif_url = exercise.media_url
-    if exercise.local_media_path:
-        filename = os.path.basename(exercise.local_media_path)
-        gif_url = f"/media/exercises/{urllib.parse.quote(filename)}"
-    
-    instructions_raw = exercise.instructions
-    instructions = []
-    if isinstance(instructions_raw, str):
-        # First replace literal "\\n" with real newlines then attempt JSON parse
-        cleaned = instructions_raw.replace("\\n", "\n")
-        try:
-            parsed = json.loads(cleaned)
-            if isinstance(parsed, list):
-                instructions = [str(step).strip() for step in parsed if str(step).strip()]
-            else:
-                instructions = [str(parsed).strip()]
-        except json.JSONDecodeError:
-            instructions = [step.strip() for step in cleaned.split("\n") if step.strip()]
-    elif isinstance(instructions_raw, list):
-        instructions = [str(step).strip() for step in instructions_raw if str(step).strip()]
-
-    # Parse muscle information
-    muscles = []
-    if exercise.secondaryMuscles:
-        try:
-            parsed = json.loads(exercise.secondaryMuscles)
-            if isinstance(parsed, list):
-                muscles = parsed
-            elif isinstance(parsed, str):
-                muscles = [parsed]
-        except json.JSONDecodeError:
-            muscles = [m.strip() for m in exercise.secondaryMuscles.split(',') if m.strip()]
-
-    # Include target muscle if not already present
-    if exercise.target and exercise.target not in muscles:
-        muscles.append(exercise.target)
-
+def personal_record_to_dict(record):
     return {
-        "id": exercise.id,
-        "name": exercise.name,
-        "instructions": instructions,
-        "mediaUrl": gif_url,
-        "gifUrl": gif_url,
-        "category": exercise.bodyPart,
-        "equipment": exercise.equipment,
-        "muscles": muscles,
-        "bodyPart": exercise.bodyPart
+        'weight': record.weight,
+        'reps': record.reps,
+        'one_rm': round(record.one_rm, 1) if record.one_rm else None,
+        'date': record.achieved_on.isoformat() if record.achieved_on else None,
+        'exercise_id': record.exercise_id
     }
 
 def program_assignment_to_dict(assignment):
-    return {
-        'id': assignment.id,
-        'client_id': assignment.client_id,
-        'template_id': assignment.template_id,
-        'start_date': assignment.start_date.isoformat() if assignment.start_date else None,
-        'current_day_index': assignment.current_day_index,
-        'active': assignment.active
-    }
+    return PROGRAM_ASSIGNMENT_FIELDS.serialize(assignment)
+
+# --- Client-scoped queries ---
+# The routes build their hot queries here so `flask check-query-plans` explains exactly what they run
+BODY_STAT_KEYS = [(BodyStat.date, True), (BodyStat.id, True)]
+PROGRESS_PHOTO_KEYS = [(ProgressPhoto.timestamp, True), (ProgressPhoto.id, True)]
+MESSAGE_HISTORY_KEYS = [(Message.timestamp, True), (Message.id, True)]
+MESSAGE_SYNC_KEYS = [(Message.position, False)]
+
+def client_lookup_query(identifier):
+    return Client.query.filter(or_(Client.id == identifier, Client.unique_url == identifier), Client.deleted == False)
+
+def workout_history_query(client_id):
+    return WorkoutLog.query.filter_by(client_id=client_id).order_by(WorkoutLog.actual_date.desc()).limit(50)
+
+def nutrition_logs_query(client_id, log_date):
+    return NutritionLog.query.filter_by(client_id=client_id, log_date=log_date)
+
+def body_stats_query(client_id):
+    """Paged with BODY_STAT_KEYS."""
+    return BodyStat.query.filter_by(client_id=client_id)
+
+def progress_photos_query(client_id):
+    """Paged with PROGRESS_PHOTO_KEYS."""
+    return ProgressPhoto.query.filter_by(client_id=client_id)
+
+def messages_query(client_id):
+    """Paged with MESSAGE_HISTORY_KEYS, or MESSAGE_SYNC_KEYS when syncing forward."""
+    return Message.query.filter_by(client_id=client_id)
+
+def latest_meal_plan_query(client_id):
+    return MealPlan.query.filter_by(client_id=client_id).order_by(MealPlan.assigned_date.desc()).limit(1)
+
+def active_assignment_query(client_id):
+    return ProgramAssignment.query.filter_by(client_id=client_id, active=True).limit(1)
+
+def recent_achievements_query(client_id, since):
+    return Achievement.query.filter(Achievement.client_id == client_id, Achievement.unlocked_at >= since) \
+        .order_by(Achievement.unlocked_at.desc()).limit(5)
 
 # --- Helper Functions ---
+# Bumped in the same transaction as any client delete or change so every worker drops its cached refs
+CLIENT_CACHE_COUNTER = 'client_cache'
+client_cache = ClientResolutionCache(maxsize=app.config['CLIENT_CACHE_SIZE'], ttl=app.config['CLIENT_CACHE_TTL'],
+                                     generation=lambda: read_counter(CLIENT_CACHE_COUNTER),
+                                     sync_interval=app.config['CLIENT_CACHE_SYNC_INTERVAL'])
+workout_sessions = create_session_store(app.config)
+autosave_buffer = AutosaveBuffer(workout_sessions,
+                                 flush_delay=app.config['AUTOSAVE_FLUSH_DELAY'],
+                                 max_unflushed_age=app.config['AUTOSAVE_MAX_UNFLUSHED_AGE'],
+                                 logger=app.logger)
+autosave_buffer.start(app._get_current_object())
+message_writer = MessageWriter(flush_interval=app.config['MESSAGE_WRITE_INTERVAL'],
+                               max_batch=app.config['MESSAGE_WRITE_BATCH'],
+                               logger=app.logger)
+message_writer.start(app._get_current_object())
+presence = create_presence_registry(app.config)
+workout_feed = WorkoutFeed(lambda events: socketio.emit('workouts_logged', {'workouts': events}, room=TRAINER_ROOM),
+                           interval=app.config['WORKOUT_FEED_INTERVAL'],
+                           max_batch=app.config['WORKOUT_FEED_BATCH'],
+                           logger=app.logger)
+workout_feed.start()
+
 def find_client(identifier):
     """Fetch a client by primary key ID or unique_url."""
-    return Client.query.filter(or_(Client.id == identifier, Client.unique_url == identifier), Client.deleted == False).first()
+    ref = client_cache.get(identifier)
+    if ref is not None:
+        client = db.session.get(Client, ref.id)
+        if client and not client.deleted:
+            return client
+        client_cache.invalidate(ref.id)
+    client = client_lookup_query(identifier).first()
+    if client:
+        client_cache.put(client.id, client.unique_url)
+    return client
+
+def resolve_client(identifier):
+    """Resolve a client id or unique_url to a ClientRef, skipping the database on cache hits.
+    A deletion in another worker reaches this one's cache within CLIENT_CACHE_SYNC_INTERVAL seconds;
+    use find_client instead when the full Client row is needed or a deletion must be seen at once."""
+    ref = client_cache.get(identifier)
+    if ref is not None:
+        return ref
+    row = client_lookup_query(identifier).with_entities(Client.id, Client.unique_url).first()
+    if row is None:
+        return None
+    return client_cache.put(row.id, row.unique_url)
 
 # In a real application, this would be a more secure way to handle secrets
 TRAINER_PASSWORD = os.environ.get("TRAINER_PASSWORD", "duck")
@@ -281,28 +302,21 @@ TRAINER_PASSWORD = os.environ.get("TRAINER_PASSWORD", "duck")
 LEGACY_JSON_DIR = pathlib.Path(__file__).resolve().parent / 'database'
 WORKOUT_ASSIGNMENTS_PATH = LEGACY_JSON_DIR / 'workout_assignments.json'
 WORKOUT_TEMPLATES_PATH = LEGACY_JSON_DIR / 'workout_templates.json'
+MESSAGE_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,100}')
 
-def _read_legacy_workout_assignments():
-    try:
-        import json
-        if WORKOUT_ASSIGNMENTS_PATH.exists():
-            with open(WORKOUT_ASSIGNMENTS_PATH, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data if isinstance(data, list) else []
-    except Exception as e:
-        app.logger.error(f"Error reading legacy workout assignments: {e}")
-    return []
+# Loaded once and re-read only when the file changes
+legacy_assignments = LegacyJSONIndex(WORKOUT_ASSIGNMENTS_PATH, 'client_id', logger=app.logger)
+legacy_templates = LegacyJSONIndex(WORKOUT_TEMPLATES_PATH, 'id', logger=app.logger)
 
-def _read_legacy_workout_templates():
-    try:
-        import json
-        if WORKOUT_TEMPLATES_PATH.exists():
-            with open(WORKOUT_TEMPLATES_PATH, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data if isinstance(data, list) else []
-    except Exception as e:
-        app.logger.error(f"Error reading legacy workout templates: {e}")
-    return []
+def _find_legacy_assignment(client_id, match_prefixed=True):
+    """Legacy JSON assignment for a client, or None when LEGACY_JSON_FALLBACK is off.
+    Matches the exact id or, with `match_prefixed`, the id with its '/client/' prefix stripped."""
+    if not app.config['LEGACY_JSON_FALLBACK']:
+        return None
+    legacy = legacy_assignments.get(client_id)
+    if legacy is None and match_prefixed and client_id.startswith('/client/'):
+        legacy = legacy_assignments.get(client_id.replace('/client/',''))
+    return legacy
 
 def _normalize_client_id(raw_id):
     return raw_id.replace('/client/','') if raw_id.startswith('/client/') else raw_id
@@ -351,13 +365,54 @@ def login():
 @app.route('/api/exercisedb/sync', methods=['POST'])
 @protected
 def sync_exercisedb_data():
-    """Synchronizes exercises from the external exercise database."""
+    """Queues a synchronization of exercises from the external exercise database."""
+    data = request.get_json(silent=True) or {}
+    job, _ = enqueue_job('exercise_sync', restart=bool(data.get('restart', False)))
+    return _job_accepted(job)
+
+def _job_accepted(job):
+    response = jsonify(job_to_dict(job))
+    response.status_code = 202
+    response.headers['Location'] = f"/api/jobs/{job.id}"
+    return response
+
+# --- Background Jobs ---
+@app.route('/api/jobs', methods=['POST'])
+@protected
+def create_job():
+    """Queues a maintenance job, e.g. {"type": "backfill_exercise_sets"}."""
+    data = request.get_json() or {}
+    job_type = data.get('type')
+    if job_type not in JOB_HANDLERS:
+        return jsonify({"message": f"Unknown job type. Expected one of: {', '.join(sorted(JOB_HANDLERS))}"}), 400
+    params = data.get('params') or {}
+    if not isinstance(params, dict):
+        return jsonify({"message": "params must be an object"}), 400
     try:
-        sync_exercises_from_exercisedb()
-        return jsonify({"message": "Exercises synchronized successfully!"}), 200
-    except Exception as e:
-        app.logger.error(f"Error synchronizing exercises: {e}")
-        return jsonify({"message": "Failed to synchronize exercises."}), 500
+        job, _ = enqueue_job(job_type, **params)
+    except TypeError as e:
+        return jsonify({"message": f"Invalid params: {e}"}), 400
+    return _job_accepted(job)
+
+@app.route('/api/jobs', methods=['GET'])
+@protected
+def get_jobs():
+    """Lists the most recent jobs, optionally filtered by ?status= and ?type=."""
+    query = Job.query
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    if request.args.get('type'):
+        query = query.filter_by(type=request.args['type'])
+    jobs = query.order_by(Job.created_at.desc()).limit(50).all()
+    return jsonify([job_to_dict(job) for job in jobs])
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@protected
+def get_job(job_id):
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({"message": "Job not found"}), 404
+    return jsonify(job_to_dict(job))
 
 @app.route("/api/clients", methods=["POST"])
 @protected
@@ -419,7 +474,9 @@ def delete_client(client_id):
         return jsonify({"message": "Client not found!"}), 404
     
     client.deleted = True
+    increment_counter(CLIENT_CACHE_COUNTER)
     db.session.commit()
+    client_cache.invalidate(client.id)
     return jsonify({"message": "Client soft-deleted successfully!"}), 200
 
 
@@ -427,10 +484,14 @@ def delete_client(client_id):
 @protected
 def get_clients():
     """
-    Lists all managed clients.
+    Lists all managed clients, ordered by name, one keyset page at a time.
     Accepts an 'status' query parameter to filter by 'active', 'archived', or 'all'.
-    Defaults to 'active'.
+    Defaults to 'active'. Also accepts cursor, limit and fields.
     """
+    try:
+        page = page_request(request.args, CLIENT_FIELDS)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
     status = request.args.get('status', 'active')
     
     clients_query = Client.query.filter_by(deleted=False) # Exclude soft-deleted clients by default
@@ -440,8 +501,39 @@ def get_clients():
     elif status == 'archived':
         clients_query = clients_query.filter_by(archived=True)
     
-    clients = [client_to_dict(c) for c in clients_query.all()]
-    return jsonify(clients)
+    try:
+        clients, next_cursor = paginate(clients_query, page, [(Client.name, False), (Client.id, False)])
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    return paginated_response([CLIENT_FIELDS.serialize(c, page.fields) for c in clients], next_cursor)
+
+@app.route("/api/clients/summary", methods=["GET"])
+@protected
+def get_clients_summary():
+    """
+    Roster view of the active clients with last workout, 7/30 day workout
+    counts, latest weight and unread messages, computed set-based.
+    Query params: sort (one of SUMMARY_SORT_KEYS, prefix '-' for
+    descending), limit, offset.
+    """
+    sort = request.args.get('sort', 'name')
+    descending = sort.startswith('-')
+    sort = sort.lstrip('-')
+    if sort not in SUMMARY_SORT_KEYS:
+        return jsonify({"message": f"sort must be one of: {', '.join(SUMMARY_SORT_KEYS)}"}), 400
+
+    limit = _to_int(request.args.get('limit')) or SUMMARY_PAGE_SIZE
+    limit = max(1, min(limit, SUMMARY_MAX_PAGE_SIZE))
+    offset = max(0, _to_int(request.args.get('offset')) or 0)
+
+    clients, total = get_client_summaries(sort=sort, descending=descending, limit=limit, offset=offset)
+    return jsonify({
+        "clients": clients,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "sort": f"-{sort}" if descending else sort
+    })
 
 @app.route("/api/clients/<client_id>", methods=["PUT"])
 @protected
@@ -467,7 +559,9 @@ def update_client(client_id):
             elif field in ['height','weight','bodyfat','hydration_level']:
                 value = _to_float(value)
             setattr(client, field, value)
+    increment_counter(CLIENT_CACHE_COUNTER)
     db.session.commit()
+    client_cache.invalidate(client.id)
     return jsonify(client_to_dict(client))
 
 @app.route("/api/clients/<client_id>/archive", methods=["PUT"])
@@ -479,7 +573,9 @@ def archive_client(client_id):
         return jsonify({"message": "Client not found!"}), 404
 
     client.archived = not client.archived
+    increment_counter(CLIENT_CACHE_COUNTER)
     db.session.commit()
+    client_cache.invalidate(client.id)
     return jsonify(client_to_dict(client))
 
 
@@ -507,76 +603,147 @@ def get_client(client_id):
         return jsonify({"message": "Client not found!"}), 404
     return jsonify(client_to_dict(client))
 
+# Seconds each section of the today view may be reused before the client should refetch it
+TODAY_SECTION_MAX_AGE = {
+    "workout": 300,
+    "metrics": 60,
+    "macros": 30,
+    "weighIn": 300,
+    "messages": 15,
+    "achievements": 60,
+}
+TODAY_ACHIEVEMENT_WINDOW = timedelta(days=7)
+def _todays_workout(assignment, template, completed_today):
+    if assignment is None or template is None:
+        return None
+    try:
+        days = json.loads(template.days) if template.days else []
+    except json.JSONDecodeError:
+        days = []
+    day_index = assignment.current_day_index % len(days) if days else 0
+    day = days[day_index] if days else None
+    groups = day.get('groups', []) if isinstance(day, dict) else []
+    return {
+        "assigned": True,
+        "assignmentId": assignment.id,
+        "templateId": template.id,
+        "templateName": template.name,
+        "dayIndex": day_index,
+        "dayCount": len(days),
+        "day": day,
+        "exercises": sum(len(g.get('exercises', [])) for g in groups if isinstance(g, dict)),
+        "completedToday": completed_today
+    }
+
+def _section_etag(section):
+    return hashlib.sha1(json.dumps(section, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
 @app.route("/api/client/<client_id>/today", methods=["GET"])
 def get_client_today(client_id):
-    """Gets all of a client's tasks for the current day."""
-    client = find_client(client_id)
+    """
+    Gets everything the client dashboard shows for the current day in one
+    round-trip: today's workout day, check-in metrics, macro totals, the
+    latest weigh-in, unread trainer messages and recent achievements.
+    Uses a fixed number of queries regardless of how much data the client
+    has. Each section carries its own max-age and ETag under `cache`; the
+    response as a whole is cacheable for the shortest of them and supports
+    conditional requests.
+    """
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
-    
+
     today = date.today()
-    
-    # Get workout for today (simplified for now)
-    try:
-        assignment = ProgramAssignment.query.filter_by(client_id=client.id, active=True).first()
-        workout = None
-        if assignment:
-            workout = {
-                "assigned": True,
-                "templateName": "Today's Workout",
-                "exercises": 8,
-                "estimatedDuration": 45
-            }
-    except Exception:
-        workout = None
 
-    # Get today's metrics (simplified)
-    todays_metrics = { "water_glasses": 0, "steps": 0 }
-    
-    response = {
-        "workout": workout,
-        "metrics": todays_metrics,
-        "macros": {},
-        "achievements": []
+    assignment, template = db.session.query(ProgramAssignment, WorkoutTemplate) \
+        .outerjoin(WorkoutTemplate, WorkoutTemplate.id == ProgramAssignment.template_id) \
+        .filter(ProgramAssignment.client_id == client.id, ProgramAssignment.active == True) \
+        .first() or (None, None)
+    completed_today = db.session.query(
+        WorkoutLog.query.filter_by(client_id=client.id, actual_date=today).exists()).scalar()
+
+    checkin = DailyCheckin.query.filter_by(client_id=client.id, checkin_date=today).first()
+    metrics = {"water_glasses": 0, "steps": 0}
+    if checkin and checkin.metrics:
+        metrics.update(json.loads(checkin.metrics))
+
+    macros = get_daily_total(client.id, today)
+
+    weigh_in = BodyStat.query.filter(BodyStat.client_id == client.id, BodyStat.weight.isnot(None)) \
+        .order_by(BodyStat.date.desc()).first()
+
+    unread = unread_count(client.id, 'client')
+
+    achievements = recent_achievements_query(client.id, datetime.utcnow() - TODAY_ACHIEVEMENT_WINDOW).all()
+
+    sections = {
+        "workout": _todays_workout(assignment, template, completed_today),
+        "metrics": metrics,
+        "macros": macros,
+        "weighIn": {"date": weigh_in.date.isoformat(), "weight": weigh_in.weight} if weigh_in else None,
+        "messages": {"unread": unread},
+        "achievements": [achievement_to_dict(a) for a in achievements],
     }
-    return jsonify(response)
+    response = jsonify(dict(sections, date=today.isoformat(), cache={
+        name: {"maxAge": TODAY_SECTION_MAX_AGE[name], "etag": _section_etag(section)}
+        for name, section in sections.items()
+    }))
+    response.headers['Cache-Control'] = f"private, max-age={min(TODAY_SECTION_MAX_AGE.values())}"
+    response.add_etag()
+    return response.make_conditional(request)
 
 @app.route("/api/exercises", methods=["GET"])
-@cache.cached(timeout=3600, key_prefix='exercises_all')
 @protected
 def get_exercises():
-    exercises = Exercise.query.all()
-    return jsonify([exercise_to_dict(e) for e in exercises])
+    return exercise_library_response('exercises')
 
 @app.route("/api/exercises/enhanced", methods=["GET"])
 @protected
 def get_exercises_enhanced():
-    exercises = Exercise.query.all()
-    data = [exercise_to_dict(ex) for ex in exercises]
-
-    # Derive unique lists directly from exercise data
-    categories = sorted({ex.bodyPart for ex in exercises if ex.bodyPart})
-
-    muscles_set = set()
-    for ex in data:
-        muscles_set.update(ex["muscles"])
-    muscles = sorted(muscles_set)
+    return exercise_library_response('enhanced')
 
-    equipment_set = {ex.equipment for ex in exercises if ex.equipment}
-    equipment = sorted(equipment_set)
-
-    return jsonify({
-        "exercises": data,
-        "categories": categories,
-        "muscles": muscles,
-        "equipment": equipment
-    })
+@app.route("/api/exercises/search", methods=["GET"])
+@protected
+def search_exercises():
+    """
+    Searches the exercise library by name with facet filters.
+    Query params: q, bodyPart, equipment, target, secondaryMuscles (repeatable or
+    comma-separated), exact=true to disable prefix matching, cursor, limit.
+    """
+    cursor = None
+    if request.args.get('cursor'):
+        cursor = decode_cursor(request.args['cursor'])
+        if cursor is None:
+            return jsonify({"message": "Invalid cursor"}), 400
+
+    limit = _to_int(request.args.get('limit')) or SEARCH_PAGE_SIZE
+    limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+
+    filters = {}
+    for facet in FACETS:
+        values = [v.strip() for raw in request.args.getlist(facet) for v in raw.split(',') if v.strip()]
+        if values:
+            filters[facet] = values
+
+    results = get_exercise_search_index().search(
+        query=request.args.get('q', ''),
+        filters=filters,
+        cursor=cursor,
+        limit=limit,
+        prefix=request.args.get('exact', 'false').lower() != 'true'
+    )
+    return jsonify(results)
 
 @app.route("/api/templates", methods=["GET"])
 @protected
 def get_templates():
-    templates = WorkoutTemplate.query.order_by(WorkoutTemplate.name).all()
-    return jsonify([template.to_dict() for template in templates])
+    try:
+        page = page_request(request.args, TEMPLATE_FIELDS)
+        templates, next_cursor = paginate(WorkoutTemplate.query, page,
+                                          [(WorkoutTemplate.name, False), (WorkoutTemplate.id, False)])
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    return paginated_response([TEMPLATE_FIELDS.serialize(t, page.fields) for t in templates], next_cursor)
 
 @app.route("/api/templates/<template_id>", methods=["GET"])
 @protected
@@ -615,8 +782,14 @@ def update_template(template_id):
 @app.route("/api/workout-assignments", methods=["GET"])
 @protected
 def get_workout_assignments():
-    assignments = ProgramAssignment.query.all()
-    return jsonify([a.to_dict() for a in assignments])
+    try:
+        page = page_request(request.args, PROGRAM_ASSIGNMENT_FIELDS)
+        assignments, next_cursor = paginate(ProgramAssignment.query, page,
+                                            [(ProgramAssignment.start_date, True), (ProgramAssignment.id, True)])
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    return paginated_response([PROGRAM_ASSIGNMENT_FIELDS.serialize(a, page.fields) for a in assignments],
+                              next_cursor)
 
 @app.route("/api/clients/<client_id>/exercises", methods=["GET"])
 def get_client_exercises(client_id):
@@ -631,8 +804,7 @@ def get_client_exercises(client_id):
 
     if not assignment:
         # Fallback: legacy JSON assignments file
-        legacy_assignments = _read_legacy_workout_assignments()
-        legacy = next((a for a in legacy_assignments if a['client_id'] == client_id), None)
+        legacy = _find_legacy_assignment(client_id, match_prefixed=False)
         if legacy:
             template = WorkoutTemplate.query.get(legacy['template_id'])
             if template:
@@ -710,6 +882,7 @@ def add_exercise():
     )
     db.session.add(new_exercise)
     db.session.commit()
+    invalidate_exercise_library()
     return jsonify({"exercise": exercise_to_dict(new_exercise)}), 201
 
 @app.route('/media/exercises/<path:filename>')
@@ -723,42 +896,27 @@ def serve_exercise_media(filename):
 @app.route("/api/clients/<client_id>/program/active", methods=["GET"])
 def get_active_program(client_id):
     # Resolve client_id to actual internal id (handles unique_url)
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
     norm_id = client.id  # Use resolved internal id
     # Attempt to fetch active assignment; if DB not migrated, ignore error
     try:
-        assignment = ProgramAssignment.query.filter_by(client_id=norm_id, active=True).first()
+        assignment = active_assignment_query(norm_id).first()
     except Exception as e:
         app.logger.warning(f"DB access error for ProgramAssignment: {e}. Falling back to legacy assignments.")
         assignment = None
 
     if not assignment:
         # Fallback: legacy JSON assignments file
-        legacy_assignments = _read_legacy_workout_assignments()
-        # match by exact id or by stripping '/client/' prefix
-        identifier_variants = {client_id}
-        if client_id.startswith('/client/'):
-            identifier_variants.add(client_id.replace('/client/',''))
-        legacy = next((a for a in legacy_assignments if a['client_id'] in identifier_variants), None)
+        legacy = _find_legacy_assignment(client_id)
         if legacy:
             template = WorkoutTemplate.query.get(legacy['template_id'])
             if template is None:
                 # attempt to read from JSON file
-                legacy_templates = _read_legacy_workout_templates()
-                template_dict = next((t for t in legacy_templates if t['id'] == legacy['template_id']), None)
+                template_dict = legacy_templates.get(legacy['template_id'])
                 if template_dict:
-                    # Build days_data from legacy structure
-                    if 'days' in template_dict and template_dict['days']:
-                        days_data = template_dict['days']
-                    elif 'exercises' in template_dict and template_dict['exercises']:
-                        days_data = [{
-                            "name": "Day 1",
-                            "groups": template_dict['exercises']
-                        }]
-                    else:
-                        days_data = []
+                    days_data = legacy_template_days(template_dict)
                     return jsonify({
                         "assignmentId": legacy['id'],
                         "startDate": legacy.get('date'),
@@ -832,7 +990,7 @@ def get_active_program(client_id):
 @app.route("/api/clients/<client_id>/meal-plan", methods=["GET"])
 def get_client_meal_plan(client_id):
     """Returns the latest assigned meal-plan for the given client (or 204 if none)."""
-    meal_plan = MealPlan.query.filter_by(client_id=client_id).order_by(MealPlan.assigned_date.desc()).first()
+    meal_plan = latest_meal_plan_query(client_id).first()
 
     if not meal_plan:
         # 204 No Content is handled specially by the front-end helper so it resolves to `null`
@@ -844,7 +1002,7 @@ def get_client_meal_plan(client_id):
 @app.route("/api/clients/<client_id>/nutrition-logs", methods=["GET"])
 def get_nutrition_logs(client_id):
     """Get nutrition logs for a client, optionally filtered by date."""
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
     
@@ -852,20 +1010,20 @@ def get_nutrition_logs(client_id):
     if date_param:
         try:
             target_date = datetime.strptime(date_param, '%Y-%m-%d').date()
-            logs = NutritionLog.query.filter_by(client_id=client.id, log_date=target_date).all()
+            logs = nutrition_logs_query(client.id, target_date).all()
         except ValueError:
             return jsonify({"message": "Invalid date format. Use YYYY-MM-DD"}), 400
     else:
         # Default to today's logs
         today = date.today()
-        logs = NutritionLog.query.filter_by(client_id=client.id, log_date=today).all()
+        logs = nutrition_logs_query(client.id, today).all()
     
     return jsonify([nutrition_log_to_dict(log) for log in logs])
 
 @app.route("/api/clients/<client_id>/nutrition-logs", methods=["POST"])
 def add_nutrition_log(client_id):
     """Add a new nutrition log entry."""
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
     
@@ -879,20 +1037,13 @@ def add_nutrition_log(client_id):
             client_id=client.id,
             log_date=date.today() if not data.get('log_date') else datetime.strptime(data.get('log_date'), '%Y-%m-%d').date(),
             food_item=data.get('food_item', ''),
-            macros=json.dumps({
-                'calories': float(data.get('calories', 0)),
-                'protein': float(data.get('protein', 0)),
-                'carbs': float(data.get('carbs', 0)),
-                'fat': float(data.get('fat', 0)),
-                'fiber': float(data.get('fiber', 0)),
-                'sugar': float(data.get('sugar', 0)),
-                'sodium': float(data.get('sodium', 0)),
-                'serving_size': data.get('serving_size', ''),
-                'meal_type': data.get('meal_type', 'other')
-            })
+            serving_size=data.get('serving_size', ''),
+            meal_type=data.get('meal_type', 'other'),
+            **{field: float(data.get(field, 0)) for field in MACRO_FIELDS}
         )
         
         db.session.add(nutrition_log)
+        refresh_daily_total(client.id, nutrition_log.log_date)
         db.session.commit()
         
         return jsonify({
@@ -908,7 +1059,7 @@ def add_nutrition_log(client_id):
 @app.route("/api/clients/<client_id>/nutrition-logs/<log_id>", methods=["PUT"])
 def update_nutrition_log(client_id, log_id):
     """Update an existing nutrition log entry."""
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
     
@@ -925,20 +1076,15 @@ def update_nutrition_log(client_id, log_id):
         if 'food_item' in data:
             log.food_item = data['food_item']
         
-        if any(key in data for key in ['calories', 'protein', 'carbs', 'fat', 'fiber', 'sugar', 'sodium', 'serving_size', 'meal_type']):
-            current_macros = json.loads(log.macros) if log.macros else {}
-            current_macros.update({
-                'calories': float(data.get('calories', current_macros.get('calories', 0))),
-                'protein': float(data.get('protein', current_macros.get('protein', 0))),
-                'carbs': float(data.get('carbs', current_macros.get('carbs', 0))),
-                'fat': float(data.get('fat', current_macros.get('fat', 0))),
-                'fiber': float(data.get('fiber', current_macros.get('fiber', 0))),
-                'sugar': float(data.get('sugar', current_macros.get('sugar', 0))),
-                'sodium': float(data.get('sodium', current_macros.get('sodium', 0))),
-                'serving_size': data.get('serving_size', current_macros.get('serving_size', '')),
-                'meal_type': data.get('meal_type', current_macros.get('meal_type', 'other'))
-            })
-            log.macros = json.dumps(current_macros)
+        if 'serving_size' in data:
+            log.serving_size = data['serving_size']
+        if 'meal_type' in data:
+            log.meal_type = data['meal_type']
+        if any(field in data for field in MACRO_FIELDS):
+            for field in MACRO_FIELDS:
+                if field in data:
+                    setattr(log, field, float(data[field]))
+            refresh_daily_total(client.id, log.log_date)
         
         db.session.commit()
         return jsonify({
@@ -954,7 +1100,7 @@ def update_nutrition_log(client_id, log_id):
 @app.route("/api/clients/<client_id>/nutrition-logs/<log_id>", methods=["DELETE"])
 def delete_nutrition_log(client_id, log_id):
     """Delete a nutrition log entry."""
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
     
@@ -964,6 +1110,7 @@ def delete_nutrition_log(client_id, log_id):
     
     try:
         db.session.delete(log)
+        refresh_daily_total(client.id, log.log_date)
         db.session.commit()
         return jsonify({"message": "Nutrition log deleted successfully"}), 200
         
@@ -972,62 +1119,117 @@ def delete_nutrition_log(client_id, log_id):
         app.logger.error(f"Error deleting nutrition log: {e}")
         return jsonify({"message": "Failed to delete nutrition log"}), 500
 
+MAX_NUTRITION_RANGE_DAYS = 731
+
+@app.route("/api/clients/<client_id>/nutrition-totals", methods=["GET"])
+def get_nutrition_totals_range(client_id):
+    """Macro totals per day, week or month over a date range (`?from=&to=&granularity=`), defaulting to the last 7 days."""
+    client = resolve_client(client_id)
+    if not client:
+        return jsonify({"message": "Client not found!"}), 404
+
+    try:
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else date.today()
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') \
+            else end - timedelta(days=6)
+    except ValueError:
+        return jsonify({"message": "Invalid date format. Use YYYY-MM-DD"}), 400
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({"message": f"granularity must be one of: {', '.join(GRANULARITIES)}"}), 400
+    if start > end:
+        return jsonify({"message": "'from' must not be after 'to'"}), 400
+    if (end - start).days >= MAX_NUTRITION_RANGE_DAYS:
+        return jsonify({"message": f"Date range is limited to {MAX_NUTRITION_RANGE_DAYS} days"}), 400
+
+    return jsonify({
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "granularity": granularity,
+        "totals": get_nutrition_totals(client.id, start, end, granularity)
+    })
+
+def _client_with_goal(client_id):
+    return db.session.query(Client, NutritionGoal) \
+        .outerjoin(NutritionGoal, NutritionGoal.client_id == Client.id) \
+        .filter(Client.id == client_id).first() or (None, None)
+
 @app.route("/api/clients/<client_id>/nutrition-goals", methods=["GET"])
 def get_nutrition_goals(client_id):
-    """Get nutrition goals for a client."""
-    client = find_client(client_id)
+    """Get nutrition goals for a client: stored targets, or targets derived from their profile."""
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
-    
-    # For now, return default goals based on client data
-    # In a real app, these would be stored in the database
-    goals = {
-        'calories': 2000,
-        'protein': 150,
-        'carbs': 200,
-        'fat': 65,
-        'fiber': 25,
-        'water': 8  # glasses
-    }
-    
-    return jsonify(goals)
+
+    client_row, goal = _client_with_goal(client.id)
+    return jsonify(resolve_goals(client_row, goal))
 
 @app.route("/api/clients/<client_id>/nutrition-goals", methods=["PUT"])
 def update_nutrition_goals(client_id):
-    """Update nutrition goals for a client."""
-    client = find_client(client_id)
+    """Update nutrition goals for a client. A null target reverts it to the derived value."""
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
     
     data = request.get_json()
     if not data:
         return jsonify({"message": "No data provided"}), 400
-    
-    # For now, just return success
-    # In a real app, these would be stored in the database
-    return jsonify({"message": "Nutrition goals updated successfully"}), 200
+    if 'activity_level' in data and data['activity_level'] not in ACTIVITY_MULTIPLIERS:
+        return jsonify({"message": f"activity_level must be one of: {', '.join(ACTIVITY_MULTIPLIERS)}"}), 400
+    if 'goal_type' in data and data['goal_type'] not in GOAL_CALORIE_ADJUSTMENT:
+        return jsonify({"message": f"goal_type must be one of: {', '.join(GOAL_CALORIE_ADJUSTMENT)}"}), 400
+
+    try:
+        client_row, goal = _client_with_goal(client.id)
+        if goal is None:
+            goal = NutritionGoal(client_id=client.id)
+            db.session.add(goal)
+        for field in GOAL_FIELDS:
+            if field in data:
+                setattr(goal, field, float(data[field]) if data[field] not in (None, '') else None)
+        for field in ('activity_level', 'goal_type'):
+            if field in data:
+                setattr(goal, field, data[field])
+        db.session.commit()
+        return jsonify({"message": "Nutrition goals updated successfully", "goals": resolve_goals(client_row, goal)}), 200
+    except (TypeError, ValueError):
+        db.session.rollback()
+        return jsonify({"message": "Goal targets must be numbers"}), 400
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error updating nutrition goals: {e}")
+        return jsonify({"message": "Failed to update nutrition goals"}), 500
+
+@app.route("/api/nutrition/goals-vs-actual", methods=["GET"])
+@protected
+def get_goals_vs_actual():
+    """Goal vs. actual intake for every active client on one day (`?date=`, default today), in one query."""
+    try:
+        target_date = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if request.args.get('date') \
+            else date.today()
+    except ValueError:
+        return jsonify({"message": "Invalid date format. Use YYYY-MM-DD"}), 400
+    return jsonify({"date": target_date.isoformat(), "clients": goals_vs_actual(target_date)})
 
 # --- Body Stats Endpoints ---
 @app.route("/api/clients/<client_id>/body-stats", methods=["GET"])
 def get_body_stats(client_id):
-    """Get body stats for a client."""
-    client = find_client(client_id)
+    """Get body stats for a client, newest first, one keyset page at a time (cursor, limit, fields)."""
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
-    
-    stats = BodyStat.query.filter_by(client_id=client.id).order_by(BodyStat.date.desc()).all()
-    return jsonify([{
-        'id': stat.id,
-        'client_id': stat.client_id,
-        'date': stat.date.isoformat() if stat.date else None,
-        'weight': stat.weight,
-        'measurements': json.loads(stat.measurements) if stat.measurements else {}
-    } for stat in stats])
+
+    try:
+        page = page_request(request.args, BODY_STAT_FIELDS)
+        stats, next_cursor = paginate(body_stats_query(client.id), page, BODY_STAT_KEYS)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    return paginated_response([BODY_STAT_FIELDS.serialize(stat, page.fields) for stat in stats], next_cursor)
 
 @app.route("/api/clients/<client_id>/body-stats", methods=["POST"])
 def add_body_stat(client_id):
     """Add a new body stat entry."""
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
     
@@ -1075,24 +1277,23 @@ def add_body_stat(client_id):
 # --- Progress Photos Endpoints ---
 @app.route("/api/clients/<client_id>/progress-photos", methods=["GET"])
 def get_progress_photos(client_id):
-    """Get progress photos for a client."""
-    client = find_client(client_id)
+    """Get progress photos for a client, newest first, one keyset page at a time (cursor, limit, fields)."""
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
-    
-    photos = ProgressPhoto.query.filter_by(client_id=client.id).order_by(ProgressPhoto.timestamp.desc()).all()
-    return jsonify([{
-        'id': photo.id,
-        'client_id': photo.client_id,
-        'filename': photo.filename,
-        'timestamp': photo.timestamp.isoformat() if photo.timestamp else None,
-        'url': f'/uploads/{photo.filename}'  # Assuming files are served from uploads folder
-    } for photo in photos])
+
+    try:
+        page = page_request(request.args, PROGRESS_PHOTO_FIELDS)
+        photos, next_cursor = paginate(progress_photos_query(client.id), page, PROGRESS_PHOTO_KEYS)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    return paginated_response([PROGRESS_PHOTO_FIELDS.serialize(photo, page.fields) for photo in photos],
+                              next_cursor)
 
 @app.route("/api/clients/<client_id>/progress-photos", methods=["POST"])
 def upload_progress_photo(client_id):
     """Upload a progress photo."""
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
     
@@ -1157,14 +1358,14 @@ def allowed_file(filename):
 @app.route("/api/clients/<client_id>/workout-history", methods=["GET"])
 def get_workout_history(client_id):
     """Get workout history for a client."""
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
     
     # Debug: Log the client lookup
     app.logger.info(f"Looking up workout history for client_id: {client_id}, resolved to internal ID: {client.id}")
     
-    logs = WorkoutLog.query.filter_by(client_id=client.id).order_by(WorkoutLog.actual_date.desc()).limit(50).all()
+    logs = workout_history_query(client.id).all()
     
     # Debug: Log the number of logs found
     app.logger.info(f"Found {len(logs)} workout logs for client {client.id}")
@@ -1205,6 +1406,7 @@ def test_create_workout_log():
         )
         
         db.session.add(test_log)
+        update_personal_records(client.id, record_workout_sets(test_log))
         db.session.commit()
         
         return jsonify({
@@ -1221,40 +1423,20 @@ def test_create_workout_log():
 @app.route("/api/clients/<client_id>/personal-records", methods=["GET"])
 def get_personal_records(client_id):
     """Get personal records for a client."""
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
     
-    # Calculate personal records from workout logs
-    logs = WorkoutLog.query.filter_by(client_id=client.id).all()
-    personal_records = {}
-    
-    for log in logs:
-        if log.performance_data:
-            try:
-                performance_data = json.loads(log.performance_data)
-                performance_log = performance_data.get('performanceLog', {})
-                
-                for exercise_id, sets in performance_log.items():
-                    if isinstance(sets, list):
-                        for set_data in sets:
-                            if set_data.get('completed') and set_data.get('weight') and set_data.get('reps'):
-                                weight = float(set_data['weight'])
-                                reps = int(set_data['reps'])
-                                
-                                # Calculate 1RM using Epley formula
-                                one_rm = weight * (1 + reps / 30)
-                                
-                                if exercise_id not in personal_records or one_rm > personal_records[exercise_id]['one_rm']:
-                                    personal_records[exercise_id] = {
-                                        'weight': weight,
-                                        'reps': reps,
-                                        'one_rm': round(one_rm, 1),
-                                        'date': log.actual_date.isoformat(),
-                                        'exercise_id': exercise_id
-                                    }
-            except (json.JSONDecodeError, ValueError, KeyError):
-                continue
+    # Read straight from the incrementally maintained best-lift index
+    records = PersonalRecord.query.filter(
+        PersonalRecord.client_id == client.id,
+        PersonalRecord.one_rm > 0
+    ).all()
+
+    personal_records = {
+        record.exercise_id: personal_record_to_dict(record)
+        for record in records
+    }
     
     return jsonify(list(personal_records.values()))
 
@@ -1262,7 +1444,7 @@ def get_personal_records(client_id):
 @app.route("/api/clients/<client_id>/achievements", methods=["GET"])
 def get_achievements(client_id):
     """Get achievements for a client."""
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
     
@@ -1371,17 +1553,13 @@ def unassign_program_from_client(client_id):
         app.logger.warning(f"DB error while unassigning program: {e}")
 
     # Legacy JSON workflow
-    legacy_assignments = _read_legacy_workout_assignments()
-    original_len = len(legacy_assignments)
-    legacy_assignments = [a for a in legacy_assignments if a.get('client_id') != client_id]
-    if len(legacy_assignments) != original_len:
-        import json
-        try:
-            with open(WORKOUT_ASSIGNMENTS_PATH, 'w', encoding='utf-8') as f:
-                json.dump(legacy_assignments, f, indent=4)
+    if not app.config['LEGACY_JSON_FALLBACK']:
+        return jsonify({"message": "No active assignment found."}), 404
+    try:
+        if legacy_assignments.remove(client_id):
             return jsonify({"message": "Program unassigned (legacy JSON)."})
-        except Exception as e:
-            return jsonify({"message": f"Failed to save legacy assignments: {e}"}), 500
+    except Exception as e:
+        return jsonify({"message": f"Failed to save legacy assignments: {e}"}), 500
 
     return jsonify({"message": "No active assignment found."}), 404
 
@@ -1401,8 +1579,12 @@ def alias_get_workout_template(template_id):
 @app.route('/api/programs', methods=['GET'])
 @protected
 def get_programs():
-    programs = Program.query.order_by(Program.name).all()
-    return jsonify([program_to_dict(p) for p in programs])
+    try:
+        page = page_request(request.args, PROGRAM_FIELDS)
+        programs, next_cursor = paginate(Program.query, page, [(Program.name, False), (Program.id, False)])
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    return paginated_response([PROGRAM_FIELDS.serialize(p, page.fields) for p in programs], next_cursor)
 
 @app.route('/api/programs', methods=['POST'])
 @protected
@@ -1468,7 +1650,7 @@ def get_program_stats(client_id, assignment_id):
 @app.route("/api/clients/<client_id>/program/log", methods=["POST"])
 def log_workout(client_id):
     """Logs a completed workout for a client."""
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
     
@@ -1504,19 +1686,73 @@ def log_workout(client_id):
     
     try:
         db.session.add(workout_log)
+        exercise_sets = record_workout_sets(workout_log, data.get('performanceLog', {}))
+        # PB detection reads the index before this workout is folded into it
+        new_pbs = check_for_new_pbs(client.id, exercise_sets)
+        personal_records = update_personal_records(client.id, exercise_sets)
+        db.session.flush()
+        # Built before the commit expires these rows, and published only once it succeeds
+        event = _workout_event(client, workout_log, exercise_sets, personal_records)
         db.session.commit()
         app.logger.info(f"Successfully logged workout with ID: {workout_log.id}")
-        return jsonify({"message": "Workout logged successfully", "log_id": workout_log.id}), 201
+        _flush_workout_session(client.id)
+        add_achievements_to_client(client.id, new_pbs)
+        workout_feed.publish(event)
+        return jsonify({
+            "message": "Workout logged successfully",
+            "log_id": workout_log.id,
+            "new_pbs": [{"title": a.title, "description": a.description} for a in new_pbs]
+        }), 201
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"Error logging workout: {e}")
         return jsonify({"message": "Failed to log workout"}), 500
 
+def _workout_event(client, workout_log, exercise_sets, personal_records):
+    """Compact summary of a logged workout for the trainer room's `workouts_logged` feed."""
+    return {
+        'log_id': workout_log.id,
+        'client_id': client.id,
+        'assignment_id': workout_log.assignment_id,
+        'day_index': workout_log.day_index_completed,
+        'date': workout_log.actual_date.isoformat(),
+        'volume': summarize_volume(exercise_sets),
+        'new_prs': [{
+            'exercise_id': record.exercise_id,
+            'max_weight': record.max_weight,
+            'weight': record.weight,
+            'reps': record.reps,
+            'one_rm': round(record.one_rm, 2) if record.one_rm else None,
+        } for record in personal_records],
+    }
+
 # --- Workout Session Management ---
+def _flush_workout_session(client_id):
+    """Writes out buffered autosaves when a workout completes; failures are logged and retried by the flusher."""
+    try:
+        autosave_buffer.flush(client_id)
+    except Exception as e:
+        app.logger.warning(f"Workout session for {client_id} left for the background flusher: {e}")
+
+def _buffered_save_response(client_id, workout_data=None, patch=None):
+    """
+    Buffers an autosave. Clients may pass `?version=` (any increasing
+    number, e.g. the last returned version + 1); saves that are not newer
+    than the last accepted or stored one are rejected with 409 so
+    reordered requests cannot roll progress back. Saves without a version
+    are always accepted and written.
+    """
+    version = request.args.get('version', type=int)
+    accepted, current_version = autosave_buffer.save(client_id, workout_data=workout_data, patch=patch,
+                                                     version=version)
+    if not accepted:
+        return jsonify({"message": "Stale workout save ignored", "version": current_version}), 409
+    return jsonify({"message": "Workout progress saved", "version": current_version}), 200
+
 @app.route("/api/clients/<client_id>/workout-session/save", methods=["POST"])
 def save_workout_progress(client_id):
-    """Saves in-progress workout data for later resumption."""
-    client = find_client(client_id)
+    """Saves in-progress workout data for later resumption, replacing any saved state."""
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
     
@@ -1525,53 +1761,39 @@ def save_workout_progress(client_id):
         return jsonify({"message": "No data provided"}), 400
 
     try:
-        # Store session data in client's session field or create a separate session table
-        # For now, using a simple approach with a session file per client
-        import os
-        session_dir = os.path.join('backend', 'sessions')
-        os.makedirs(session_dir, exist_ok=True)
-        
-        session_file = os.path.join(session_dir, f'client_{client.id}_session.json')
-        session_data = {
-            'timestamp': datetime.now().isoformat(),
-            'workout_data': data,
-            'client_id': client.id
-        }
-        
-        with open(session_file, 'w') as f:
-            json.dump(session_data, f)
-            
-        return jsonify({"message": "Workout progress saved"}), 200
+        return _buffered_save_response(client.id, workout_data=data)
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"Error saving workout session: {e}")
         return jsonify({"message": "Failed to save workout session"}), 500
 
+@app.route("/api/clients/<client_id>/workout-session", methods=["PATCH"])
+def patch_workout_progress(client_id):
+    """Applies a JSON Merge Patch (RFC 7396) to the saved workout data, so autosaves only send what changed."""
+    client = resolve_client(client_id)
+    if not client:
+        return jsonify({"message": "Client not found!"}), 404
+
+    patch = request.get_json(force=True, silent=True)
+    if not isinstance(patch, dict) or not patch:
+        return jsonify({"message": "Expected a JSON merge patch object"}), 400
+
+    try:
+        return _buffered_save_response(client.id, patch=patch)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error patching workout session: {e}")
+        return jsonify({"message": "Failed to save workout session"}), 500
+
 @app.route("/api/clients/<client_id>/workout-session", methods=["GET"])
 def get_workout_session(client_id):
-    """Retrieves saved workout session data."""
-    client = find_client(client_id)
+    """Retrieves saved workout session data; sessions expire WORKOUT_SESSION_TTL seconds after the last save."""
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
 
     try:
-        import os
-        session_file = os.path.join('backend', 'sessions', f'client_{client.id}_session.json')
-        
-        if not os.path.exists(session_file):
-            return jsonify({"session": None}), 200
-        
-        with open(session_file, 'r') as f:
-            session_data = json.load(f)
-            
-        # Check if session is recent (within 24 hours)
-        from datetime import datetime, timedelta
-        session_time = datetime.fromisoformat(session_data['timestamp'])
-        if datetime.now() - session_time > timedelta(hours=24):
-            # Session too old, delete it
-            os.remove(session_file)
-            return jsonify({"session": None}), 200
-            
-        return jsonify({"session": session_data}), 200
+        return jsonify({"session": autosave_buffer.get(client.id)}), 200
     except Exception as e:
         app.logger.error(f"Error retrieving workout session: {e}")
         return jsonify({"session": None}), 200
@@ -1579,19 +1801,16 @@ def get_workout_session(client_id):
 @app.route("/api/clients/<client_id>/workout-session", methods=["DELETE"])
 def clear_workout_session(client_id):
     """Clears saved workout session data."""
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
 
     try:
-        import os
-        session_file = os.path.join('backend', 'sessions', f'client_{client.id}_session.json')
-        
-        if os.path.exists(session_file):
-            os.remove(session_file)
-            
+        autosave_buffer.discard(client.id)
+        workout_sessions.delete(client.id)
         return jsonify({"message": "Session cleared"}), 200
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"Error clearing workout session: {e}")
         return jsonify({"message": "Failed to clear session"}), 500
 
@@ -1599,28 +1818,19 @@ def clear_workout_session(client_id):
 @app.route("/api/clients/<client_id>/exercise/<exercise_id>/history", methods=["GET"])
 def get_exercise_history(client_id, exercise_id):
     """Gets the exercise history for a specific client and exercise."""
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
 
-    # Get all workout logs for this client
-    logs = WorkoutLog.query.filter_by(client_id=client.id).order_by(WorkoutLog.actual_date.desc()).all()
-    
-    exercise_history = []
-    for log in logs:
-        try:
-            performance_data = json.loads(log.performance_data) if log.performance_data else {}
-            performance_log = performance_data.get('performanceLog', {})
-            
-            if exercise_id in performance_log:
-                sets_data = performance_log[exercise_id]
-                exercise_history.append({
-                    'date': log.actual_date.isoformat(),
-                    'sets': sets_data,
-                    'day_index': log.day_index_completed
-                })
-        except json.JSONDecodeError:
-            continue
+    # Indexed range scan over the per-log entries, newest session first; sets are returned as logged
+    entries = ExerciseLogEntry.query.filter_by(client_id=client.id, exercise_id=exercise_id) \
+        .order_by(ExerciseLogEntry.performed_on.desc()).all()
+
+    exercise_history = [{
+        'date': entry.performed_on.isoformat(),
+        'sets': json.loads(entry.sets),
+        'day_index': entry.day_index
+    } for entry in entries]
     
     return jsonify(exercise_history)
 
@@ -1628,28 +1838,23 @@ def get_exercise_history(client_id, exercise_id):
 @app.route("/api/clients/<client_id>/exercise/<exercise_id>/previous", methods=["GET"])
 def get_previous_exercise_data(client_id, exercise_id):
     """Gets the most recent data for a specific exercise."""
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
 
-    # Get most recent workout log for this client with this exercise
-    logs = WorkoutLog.query.filter_by(client_id=client.id).order_by(WorkoutLog.actual_date.desc()).all()
-    
-    for log in logs:
+    # Best set (highest weight x reps) from the most recent log of this exercise, values as logged
+    entries = ExerciseLogEntry.query.filter_by(client_id=client.id, exercise_id=exercise_id) \
+        .order_by(ExerciseLogEntry.performed_on.desc())
+    for entry in entries:
         try:
-            performance_data = json.loads(log.performance_data) if log.performance_data else {}
-            performance_log = performance_data.get('performanceLog', {})
-            
-            if exercise_id in performance_log:
-                sets_data = performance_log[exercise_id]
-                # Get the best set (highest weight or reps)
-                best_set = max(sets_data, key=lambda s: float(s.get('weight', 0)) * float(s.get('reps', 0)), default={})
-                return jsonify({
-                    'weight': best_set.get('weight', ''),
-                    'reps': best_set.get('reps', ''),
-                    'date': log.actual_date.isoformat()
-                })
-        except (json.JSONDecodeError, ValueError):
+            sets_data = json.loads(entry.sets)
+            best_set = max(sets_data, key=lambda s: float(s.get('weight', 0)) * float(s.get('reps', 0)), default={})
+            return jsonify({
+                'weight': best_set.get('weight', ''),
+                'reps': best_set.get('reps', ''),
+                'date': entry.performed_on.isoformat()
+            })
+        except (ValueError, TypeError, AttributeError):
             continue
     
     return jsonify({'weight': '', 'reps': '', 'date': None})
@@ -1657,18 +1862,126 @@ def get_previous_exercise_data(client_id, exercise_id):
 # --- Message Endpoints ---
 @app.route("/api/clients/<client_id>/messages", methods=["GET"])
 def get_messages(client_id):
-    """Get messages for a client."""
-    client = find_client(client_id)
+    """
+    Get messages for a client. Pages walk back from the newest message
+    (cursor, limit, fields); each page is returned oldest-first so it can
+    be prepended to the conversation as is.
+
+    With `after=<message id or ISO timestamp>` it syncs forward instead:
+    only messages stored after that point, in the order they were stored,
+    with the next page (if any) linked the same way. A reconnecting client
+    passes the last message it holds and fetches just what it missed.
+    The cursor is the message's insert position, not its timestamp, so
+    messages written late by the write-behind queue are not skipped. An id
+    that is not stored (yet) falls back to the read pointer of `reader`
+    ('client' or 'trainer'; the lower of both when omitted), which can
+    resend messages the client has but never skips one.
+    """
+    client = resolve_client(client_id)
+    if not client:
+        return jsonify({"message": "Client not found!"}), 404
+
+    after = request.args.get('after')
+    reader = request.args.get('reader')
+    if reader is not None and reader not in READERS:
+        return jsonify({"message": f"reader must be one of: {', '.join(READERS)}"}), 400
+    query = messages_query(client.id)
+    try:
+        page = page_request(request.args, MESSAGE_FIELDS)
+        if not after:
+            messages, next_cursor = paginate(query, page, MESSAGE_HISTORY_KEYS)
+            messages.reverse()
+        else:
+            if page.cursor is None:
+                anchor = _find_message(client.id, after)
+                if anchor is not None:
+                    page = page._replace(cursor=[anchor.position])
+                else:
+                    try:
+                        query = query.filter(Message.timestamp > datetime.fromisoformat(after))
+                    except ValueError:
+                        page = page._replace(cursor=[read_position(client.id, reader)])
+            messages, next_cursor = paginate(query, page, MESSAGE_SYNC_KEYS)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    return paginated_response([MESSAGE_FIELDS.serialize(message, page.fields) for message in messages], next_cursor)
+
+def _find_message(client_id, message_id):
+    """
+    Looks a message up by id, writing out locally queued messages first if
+    it is not stored yet. Returns None for unknown ids, including messages
+    still queued on another worker.
+    """
+    message = Message.query.filter_by(client_id=client_id, id=message_id).first()
+    if message is None and message_writer.pending():
+        try:
+            message_writer.flush()
+        except Exception as e:
+            app.logger.warning(f"Could not flush queued messages while looking up {message_id}: {e}")
+            return None
+        message = Message.query.filter_by(client_id=client_id, id=message_id).first()
+    return message
+
+@app.route("/api/clients/<client_id>/messages/read", methods=["GET"])
+def get_message_read_state(client_id):
+    """Read pointers and unread counts of both participants in a client's conversation."""
+    client = resolve_client(client_id)
+    if not client:
+        return jsonify({"message": "Client not found!"}), 404
+
+    states = {state.reader: state for state in MessageReadState.query.filter_by(client_id=client.id)}
+    return jsonify({
+        reader: dict(read_state_to_dict(states[reader]) if reader in states else {'reader': reader},
+                     unread=unread_count(client.id, reader))
+        for reader in READERS
+    })
+
+@app.route("/api/clients/<client_id>/messages/read", methods=["PUT"])
+def mark_messages_read(client_id):
+    """
+    Records a read receipt: `reader` ('client' or 'trainer') has read up to
+    `message_id`, or up to the newest message when it is omitted. The
+    receipt is broadcast to the conversation room as `messages_read`.
+    """
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
-    
-    messages = Message.query.filter_by(client_id=client.id).order_by(Message.timestamp.asc()).all()
-    return jsonify([message_to_dict(message) for message in messages])
+
+    data = request.get_json(silent=True) or {}
+    reader = data.get('reader')
+    if reader not in READERS:
+        return jsonify({"message": f"reader must be one of: {', '.join(READERS)}"}), 400
+
+    message = None
+    if data.get('message_id'):
+        message = _find_message(client.id, data['message_id'])
+        if message is None:
+            return jsonify({"message": "Message not found"}), 404
+
+    try:
+        state = mark_read(client.id, reader, message)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error marking messages read: {e}")
+        return jsonify({"message": "Failed to mark messages read"}), 500
+    if state is None:
+        return jsonify({'reader': reader, 'unread': 0})
+
+    receipt = read_state_to_dict(state)
+    socketio.emit('messages_read', receipt, room=f"client_{client.id}")
+    return jsonify(dict(receipt, unread=unread_count(client.id, reader)))
+
+@app.route("/api/messages/unread-counts", methods=["GET"])
+@protected
+def get_unread_counts():
+    """Unread client messages per active client for the trainer inbox, from each conversation's read pointer."""
+    counts = unread_counts('trainer')
+    return jsonify({"total": sum(counts.values()), "clients": counts})
 
 @app.route("/api/clients/<client_id>/messages", methods=["POST"])
 def send_message(client_id):
     """Send a message to/from a client."""
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return jsonify({"message": "Client not found!"}), 404
     
@@ -1680,7 +1993,9 @@ def send_message(client_id):
         message = Message(
             client_id=client.id,
             sender_type=data.get('sender_type', 'client'),
-            text=data['text']
+            text=data['text'],
+            seq=message_writer.next_seq(),
+            position=allocate_positions(1)
         )
         
         db.session.add(message)
@@ -1696,60 +2011,114 @@ def send_message(client_id):
         app.logger.error(f"Error sending message: {e}")
         return jsonify({"message": "Failed to send message"}), 500
 
+# --- Presence ---
+def _announce_presence(client_id, online):
+    """Tells the trainer room that a client came online or went offline."""
+    socketio.emit('presence', {'client_id': client_id, 'online': online,
+                               'at': datetime.utcnow().isoformat()}, room=TRAINER_ROOM)
+
+presence.start(lambda client_id: _announce_presence(client_id, False), logger=app.logger)
+
+@app.route("/api/presence", methods=["GET"])
+@protected
+def get_presence():
+    """Snapshot of the clients with a live socket connection."""
+    online = presence.snapshot()
+    return jsonify({"online": online, "count": len(online), "ttl": presence.ttl})
+
 # --- Socket.IO Event Handlers ---
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection."""
-    print(f"Client connected: {request.sid}")
+    app.logger.debug(f"Socket connected: {request.sid}")
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection."""
-    print(f"Client disconnected: {request.sid}")
+    app.logger.debug(f"Socket disconnected: {request.sid}")
+    client_id = presence.leave(request.sid)
+    if client_id:
+        _announce_presence(client_id, False)
+
+@socketio.on('join_trainer')
+def handle_join_trainer(data):
+    """Join the trainer room to receive job progress, presence and dashboard events."""
+    data = data or {}
+    if data.get('password') != TRAINER_PASSWORD:
+        emit('error', {'message': 'Authentication required!'})
+        return
+    join_room(TRAINER_ROOM)
+    emit('presence_snapshot', {'online': presence.snapshot()})
 
 @socketio.on('join')
 def handle_join(data):
-    """Join a client-specific room for real-time messaging."""
+    """
+    Join a client-specific room for real-time messaging. A client portal
+    joining its own room also marks the client online; trainer sockets
+    (already in the trainer room) join conversations without that.
+    """
     client_id = data.get('client_id')
     if client_id:
         # Normalize client ID for room naming
-        client = find_client(client_id)
+        client = resolve_client(client_id)
         if client:
             room = f"client_{client.id}"
             join_room(room)
-            print(f"Client {request.sid} joined room {room}")
+            app.logger.debug(f"Socket {request.sid} joined room {room}")
+            if TRAINER_ROOM not in rooms() and presence.join(request.sid, client.id):
+                _announce_presence(client.id, True)
         else:
-            print(f"Invalid client_id for join: {client_id}")
+            app.logger.info(f"Invalid client_id for join: {client_id}")
+
+@socketio.on('heartbeat')
+def handle_heartbeat(data=None):
+    """Keeps a client online; portals send it well within PRESENCE_TTL. Acks whether the socket is registered."""
+    return {'online': presence.heartbeat(request.sid), 'ttl': presence.ttl}
 
 @socketio.on('message')
 def handle_message(data):
-    """Handle incoming socket message."""
+    """
+    Handle incoming socket message. The message gets its timestamp and
+    sequence number here and is broadcast straight away; the insert goes
+    through the write-behind queue, and the sender is acked with id and seq
+    only once it is committed. Senders may pass their own `id` and resend
+    under it when no ack arrives: a stored id is not inserted twice, and
+    receivers drop broadcasts whose id they already have.
+    """
     client_id = data.get('client_id')
     sender_type = data.get('sender_type', 'client')
     text = data.get('text', '').strip()
+    message_id = data.get('id')
     
     if not client_id or not text:
         return
+    if message_id is not None and not (isinstance(message_id, str) and MESSAGE_ID_PATTERN.fullmatch(message_id)):
+        return {'error': "'id' must be 1-100 letters, digits, '_' or '-'"}
     
-    client = find_client(client_id)
+    client = resolve_client(client_id)
     if not client:
         return
     
-    try:
-        # Save message to database
-        message = Message(
-            client_id=client.id,
-            sender_type=sender_type,
-            text=text
-        )
-        
-        db.session.add(message)
-        db.session.commit()
-        
-        # Broadcast message to room
-        message_data = message_to_dict(message)
-        socketio.emit('new_message', message_data, room=f"client_{client.id}")
-        
-    except Exception as e:
-        app.logger.error(f"Error handling socket message: {e}")
-        db.session.rollback() 
\ No newline at end of file
+    row = {
+        'id': message_id or f"msg_{uuid.uuid4()}",
+        'client_id': client.id,
+        'sender_type': sender_type,
+        'text': text,
+        'timestamp': datetime.utcnow(),
+        'seq': message_writer.next_seq(),
+    }
+    pending = message_writer.submit(row)
+
+    # Broadcast message to room
+    message_data = message_to_dict(Message(**row))
+    socketio.emit('new_message', message_data, room=f"client_{client.id}")
+
+    # End any read transaction (a client cache miss, the generation check) first: on SQLite its
+    # shared lock would hold off the very commit this waits for
+    db.session.close()
+    stored = pending.wait(app.config['MESSAGE_ACK_TIMEOUT'])
+    if stored is None:
+        return {'id': row['id'], 'error': "Message not stored yet; resend it with the same id"}
+    if not stored:
+        return {'id': row['id'], 'error': pending.error or "Message could not be stored"}
+    return {'id': row['id'], 'seq': pending.seq}
\ No newline at end of file
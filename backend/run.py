@@ -1,5 +1,12 @@
-import sys
 import os
+
+if os.environ.get('SOCKETIO_ASYNC_MODE', 'eventlet') == 'eventlet':
+    # Must run before anything else imports socket/threading; the Socket.IO
+    # message queue client only works over green sockets
+    import eventlet
+    eventlet.monkey_patch()
+
+import sys
 from pathlib import Path
 
 # Ensure project root is on PYTHONPATH
@@ -0,0 +1,290 @@
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, WorkoutSession
+
+try:  # Optional: only needed when WORKOUT_SESSION_BACKEND=redis
+    import redis
+except ImportError:
+    redis = None
+
+DEFAULT_SESSION_TTL = 24 * 60 * 60  # seconds
+SWEEP_INTERVAL = 5 * 60  # seconds between opportunistic expiry sweeps
+MAX_PATCH_RETRIES = 5
+
+
+class SessionConflict(Exception):
+    """Raised when a session kept changing underneath a patch."""
+
+
+def merge_patch(target, patch):
+    """Applies a JSON Merge Patch (RFC 7396): objects merge recursively, null deletes, anything else replaces."""
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def session_to_dict(client_id, workout_data, version, updated_at):
+    return {
+        'client_id': client_id,
+        'workout_data': workout_data,
+        'version': version,
+        'timestamp': updated_at.isoformat()
+    }
+
+
+class WorkoutSessionStore(ABC):
+    """
+    Storage for in-progress workout sessions, keyed by client id.
+    A session expires `ttl` seconds after its last write. Implementations
+    provide get/put/patch/delete/sweep; `put` replaces the workout data,
+    `patch` applies a merge patch to it, and both bump the version. When
+    the caller passes an explicit `version`, the write only happens if it
+    is newer than the stored one; otherwise the stored session is returned
+    unchanged, so out-of-order writes are dropped.
+    """
+
+    def __init__(self, ttl=DEFAULT_SESSION_TTL, sweep_interval=SWEEP_INTERVAL):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+
+    @abstractmethod
+    def get(self, client_id):
+        ...
+
+    @abstractmethod
+    def put(self, client_id, workout_data, version=None):
+        ...
+
+    @abstractmethod
+    def patch(self, client_id, patch, version=None):
+        ...
+
+    @abstractmethod
+    def delete(self, client_id):
+        ...
+
+    def sweep(self):
+        """Removes expired sessions and returns how many were removed."""
+        return 0
+
+    def maybe_sweep(self):
+        """Runs `sweep` if the last one was more than `sweep_interval` seconds ago."""
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            return self.sweep()
+        return 0
+
+
+class MemorySessionStore(WorkoutSessionStore):
+    """
+    Process-local store. Suitable for a single worker and as the fake in
+    tests: pass `clock` to control expiry without sleeping.
+    """
+
+    def __init__(self, ttl=DEFAULT_SESSION_TTL, sweep_interval=SWEEP_INTERVAL, clock=time.time):
+        super().__init__(ttl, sweep_interval)
+        self.clock = clock
+        self._sessions = {}  # client_id -> (json data, version, updated_at, expires_at)
+        self._lock = threading.Lock()
+
+    def _live(self, client_id):
+        entry = self._sessions.get(client_id)
+        if entry and entry[3] <= self.clock():
+            del self._sessions[client_id]
+            return None
+        return entry
+
+    def _write(self, client_id, workout_data, version):
+        updated_at = datetime.utcnow()
+        self._sessions[client_id] = (json.dumps(workout_data), version, updated_at, self.clock() + self.ttl)
+        return session_to_dict(client_id, workout_data, version, updated_at)
+
+    def get(self, client_id):
+        with self._lock:
+            entry = self._live(client_id)
+            if entry is None:
+                return None
+            data, version, updated_at, _ = entry
+            return session_to_dict(client_id, json.loads(data), version, updated_at)
+
+    def _save(self, client_id, build, version):
+        with self._lock:
+            entry = self._live(client_id)
+            current_version = entry[1] if entry else 0
+            if version is not None and version <= current_version:
+                data, _, updated_at, _ = entry
+                return session_to_dict(client_id, json.loads(data), current_version, updated_at)
+            current = json.loads(entry[0]) if entry else {}
+            session = self._write(client_id, build(current), version or current_version + 1)
+        self.maybe_sweep()
+        return session
+
+    def put(self, client_id, workout_data, version=None):
+        return self._save(client_id, lambda current: workout_data, version)
+
+    def patch(self, client_id, patch, version=None):
+        return self._save(client_id, lambda current: merge_patch(current, patch), version)
+
+    def delete(self, client_id):
+        with self._lock:
+            self._sessions.pop(client_id, None)
+
+    def sweep(self):
+        now = self.clock()
+        with self._lock:
+            expired = [client_id for client_id, entry in self._sessions.items() if entry[3] <= now]
+            for client_id in expired:
+                del self._sessions[client_id]
+        return len(expired)
+
+
+class SQLSessionStore(WorkoutSessionStore):
+    """
+    Stores sessions in the `workout_session` table so every worker sees the
+    same state. Writes are a single-row upsert guarded by the version
+    column, so concurrent patches never silently overwrite each other.
+    """
+
+    def get(self, client_id):
+        row = WorkoutSession.query.filter(WorkoutSession.client_id == client_id,
+                                          WorkoutSession.expires_at > datetime.utcnow()).first()
+        if row is None:
+            return None
+        return session_to_dict(client_id, json.loads(row.data or '{}'), row.version, row.updated_at)
+
+    def _save(self, client_id, build, version):
+        """Reads the current row, writes `build(current_data)` if it has not changed meanwhile, retrying otherwise."""
+        for _ in range(MAX_PATCH_RETRIES):
+            now = datetime.utcnow()
+            row = db.session.get(WorkoutSession, client_id, populate_existing=True)
+            live = row is not None and row.expires_at > now
+            if live and version is not None and version <= row.version:
+                return session_to_dict(client_id, json.loads(row.data or '{}'), row.version, row.updated_at)
+            workout_data = build(json.loads(row.data or '{}') if live else {})
+            values = {
+                'data': json.dumps(workout_data),
+                'updated_at': now,
+                'expires_at': now + timedelta(seconds=self.ttl)
+            }
+            try:
+                if row is None:
+                    new_version = version or 1
+                    db.session.add(WorkoutSession(client_id=client_id, version=new_version, **values))
+                    db.session.commit()
+                else:
+                    # An expired row is replaced, so its version only matters for the guard
+                    new_version = version if version is not None and version > row.version else row.version + 1
+                    updated = WorkoutSession.query \
+                        .filter_by(client_id=client_id, version=row.version) \
+                        .update(dict(values, version=new_version), synchronize_session=False)
+                    db.session.commit()
+                    if not updated:
+                        continue
+            except IntegrityError:
+                db.session.rollback()  # Another worker created the row first
+                continue
+            self.maybe_sweep()
+            return session_to_dict(client_id, workout_data, new_version, now)
+        raise SessionConflict(f"Workout session for {client_id} is being updated concurrently")
+
+    def put(self, client_id, workout_data, version=None):
+        return self._save(client_id, lambda current: workout_data, version)
+
+    def patch(self, client_id, patch, version=None):
+        return self._save(client_id, lambda current: merge_patch(current, patch), version)
+
+    def delete(self, client_id):
+        WorkoutSession.query.filter_by(client_id=client_id).delete(synchronize_session=False)
+        db.session.commit()
+
+    def sweep(self):
+        removed = WorkoutSession.query.filter(WorkoutSession.expires_at <= datetime.utcnow()) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+        return removed
+
+
+class RedisSessionStore(WorkoutSessionStore):
+    """
+    Stores each session as a JSON value with a native Redis TTL, so no
+    sweep is needed. Patches use WATCH/MULTI for optimistic concurrency.
+    """
+
+    KEY_PREFIX = "workout_session:"
+
+    def __init__(self, url, ttl=DEFAULT_SESSION_TTL, sweep_interval=SWEEP_INTERVAL):
+        if redis is None:
+            raise RuntimeError("WORKOUT_SESSION_BACKEND=redis requires the 'redis' package")
+        super().__init__(ttl, sweep_interval)
+        self.client = redis.Redis.from_url(url)
+
+    def _key(self, client_id):
+        return f"{self.KEY_PREFIX}{client_id}"
+
+    @staticmethod
+    def _decode(client_id, raw):
+        entry = json.loads(raw)
+        return session_to_dict(client_id, entry['data'], entry['version'],
+                               datetime.fromisoformat(entry['updated_at']))
+
+    def get(self, client_id):
+        raw = self.client.get(self._key(client_id))
+        return self._decode(client_id, raw) if raw else None
+
+    def _save(self, client_id, build, version):
+        key = self._key(client_id)
+        with self.client.pipeline() as pipe:
+            for _ in range(MAX_PATCH_RETRIES):
+                try:
+                    pipe.watch(key)
+                    raw = pipe.get(key)
+                    if raw and version is not None and version <= json.loads(raw)['version']:
+                        pipe.unwatch()
+                        return self._decode(client_id, raw)
+                    current = json.loads(raw) if raw else {'data': {}, 'version': 0}
+                    now = datetime.utcnow()
+                    entry = {'data': build(current['data']), 'version': version or current['version'] + 1,
+                             'updated_at': now.isoformat()}
+                    pipe.multi()
+                    pipe.set(key, json.dumps(entry), ex=self.ttl)
+                    pipe.execute()
+                    return session_to_dict(client_id, entry['data'], entry['version'], now)
+                except redis.WatchError:
+                    continue
+        raise SessionConflict(f"Workout session for {client_id} is being updated concurrently")
+
+    def put(self, client_id, workout_data, version=None):
+        return self._save(client_id, lambda current: workout_data, version)
+
+    def patch(self, client_id, patch, version=None):
+        return self._save(client_id, lambda current: merge_patch(current, patch), version)
+
+    def delete(self, client_id):
+        self.client.delete(self._key(client_id))
+
+
+def create_session_store(config):
+    """Builds the store selected by WORKOUT_SESSION_BACKEND ('sql', 'memory' or 'redis')."""
+    backend = config.get('WORKOUT_SESSION_BACKEND', 'sql')
+    ttl = config.get('WORKOUT_SESSION_TTL', DEFAULT_SESSION_TTL)
+    if backend == 'sql':
+        return SQLSessionStore(ttl)
+    if backend == 'memory':
+        return MemorySessionStore(ttl)
+    if backend == 'redis':
+        return RedisSessionStore(config['WORKOUT_SESSION_REDIS_URL'], ttl)
+    raise ValueError(f"Unknown WORKOUT_SESSION_BACKEND: {backend}")
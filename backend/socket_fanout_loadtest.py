@@ -0,0 +1,291 @@
+"""
+Load test for Socket.IO fan-out across worker processes.
+
+Starts N backend workers sharing one database and one message queue,
+connects listeners to every worker, all joined to the same client room,
+and sends chat messages round-robin through the workers. Every listener
+should see every message, including the ones sent through another
+process. Prints delivery counts and latency percentiles and exits
+non-zero if anything was lost.
+
+    python backend/socket_fanout_loadtest.py --workers 3 --listeners 4 --messages 200
+    python backend/socket_fanout_loadtest.py --queue redis://localhost:6379/0
+
+Without --queue a minimal Redis-protocol pub/sub stand-in is started in
+this process, so no broker needs to be installed. Needs the `redis` and
+`websocket-client` packages.
+"""
+import argparse
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import requests
+import socketio
+
+BACKEND_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BACKEND_DIR.parent
+
+
+class _RESPHandler(socketserver.StreamRequestHandler):
+    """
+    Speaks just enough RESP for pub/sub: HELLO (RESP2 or RESP3), SUBSCRIBE,
+    UNSUBSCRIBE, PUBLISH and PING; anything else gets +OK.
+    """
+
+    def setup(self):
+        super().setup()
+        self.channels = set()
+        self.protocol = 2
+        self.write_lock = threading.Lock()
+
+    def push(self, *items):
+        # RESP3 delivers pub/sub traffic as out-of-band push frames
+        self.send(_array(*items, kind=b'>' if self.protocol == 3 else b'*'))
+
+    def send(self, payload):
+        with self.write_lock:
+            self.wfile.write(payload)
+            self.wfile.flush()
+
+    def read_command(self):
+        header = self.rfile.readline()
+        if not header:
+            return None
+        if not header.startswith(b'*'):
+            return header.split()  # inline command
+        parts = []
+        for _ in range(int(header[1:])):
+            length = int(self.rfile.readline()[1:])
+            parts.append(self.rfile.read(length + 2)[:-2])
+        return parts
+
+    def handle(self):
+        broker = self.server
+        try:
+            while True:
+                command = self.read_command()
+                if command is None:
+                    break
+                name = command[0].upper()
+                if name == b'HELLO':
+                    self.protocol = int(command[1]) if len(command) > 1 else self.protocol
+                    fields = (b'server', b'standin', b'proto', self.protocol)
+                    self.send(_array(*fields, kind=b'%', length=len(fields) // 2) if self.protocol == 3
+                              else _array(*fields))
+                elif name == b'PUBLISH':
+                    self.send(b':%d\r\n' % broker.publish(command[1], command[2]))
+                elif name in (b'SUBSCRIBE', b'UNSUBSCRIBE'):
+                    for channel in command[1:]:
+                        if name == b'SUBSCRIBE':
+                            self.channels.add(channel)
+                            broker.subscribe(channel, self)
+                        else:
+                            self.channels.discard(channel)
+                            broker.unsubscribe(channel, self)
+                        self.push(name.lower(), channel, len(self.channels))
+                elif name == b'PING':
+                    self.send(b'+PONG\r\n')
+                else:
+                    self.send(b'+OK\r\n')
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            for channel in self.channels:
+                broker.unsubscribe(channel, self)
+
+
+def _array(*items, kind=b'*', length=None):
+    out = [kind + b'%d\r\n' % (len(items) if length is None else length)]
+    for item in items:
+        if isinstance(item, int):
+            out.append(b':%d\r\n' % item)
+        else:
+            out.append(b'$%d\r\n%s\r\n' % (len(item), item))
+    return b''.join(out)
+
+
+class StandInBroker(socketserver.ThreadingTCPServer):
+    """An in-process pub/sub broker compatible with redis-py's publish and pubsub."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0):
+        super().__init__(('127.0.0.1', port), _RESPHandler)
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel, handler):
+        with self.lock:
+            self.subscribers.setdefault(channel, set()).add(handler)
+
+    def unsubscribe(self, channel, handler):
+        with self.lock:
+            self.subscribers.get(channel, set()).discard(handler)
+
+    def publish(self, channel, payload):
+        with self.lock:
+            handlers = list(self.subscribers.get(channel, ()))
+        for handler in handlers:
+            try:
+                handler.push(b'message', channel, payload)
+            except OSError:
+                pass
+        return len(handlers)
+
+    @property
+    def url(self):
+        return f"redis://127.0.0.1:{self.server_address[1]}/0"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _prepare_database(database_url):
+    """Creates the schema and one client whose room every listener joins; returns the client id."""
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, str(ROOT_DIR))
+    from backend.app import create_app
+    from backend.models import db, Client
+
+    with create_app().app_context():
+        db.create_all()
+        client = Client(name='Load Test', email=f"loadtest-{uuid.uuid4()}@example.com",
+                        unique_url=str(uuid.uuid4()))
+        db.session.add(client)
+        db.session.commit()
+        return client.id
+
+
+def _start_workers(count, env, log_dir):
+    ports = [_free_port() for _ in range(count)]
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+    workers = []
+    for index, (port, url) in enumerate(zip(ports, urls)):
+        log = open(os.path.join(log_dir, f"worker-{index}.log"), 'w')
+        process = subprocess.Popen([sys.executable, str(BACKEND_DIR / 'run.py')],
+                                   env=dict(env, PORT=str(port), CORS_ALLOWED_ORIGINS=','.join(urls)),
+                                   stdout=log, stderr=subprocess.STDOUT)
+        workers.append((url, process, log))
+    return workers
+
+
+def _wait_ready(url, client_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/api/clients/{client_id}/messages?limit=1", timeout=1).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Worker {url} did not start within {timeout}s")
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(workers=3, listeners=4, messages=200, queue=None, settle=10.0):
+    broker = None
+    if not queue:
+        broker = StandInBroker()
+        threading.Thread(target=broker.serve_forever, daemon=True).start()
+        queue = broker.url
+
+    work_dir = tempfile.mkdtemp(prefix='socket-fanout-')
+    database_url = 'sqlite:///' + os.path.join(work_dir, 'loadtest.db')
+    client_id = _prepare_database(database_url)
+    env = dict(os.environ, DATABASE_URL=database_url, SOCKETIO_MESSAGE_QUEUE=queue,
+               SOCKETIO_TRANSPORTS='websocket', PYTHONUNBUFFERED='1')
+    processes = _start_workers(workers, env, work_dir)
+    sockets = []
+    received = {}  # (listener index, text) -> latency in seconds
+    received_lock = threading.Lock()
+
+    try:
+        for url, _, _ in processes:
+            _wait_ready(url, client_id)
+
+        room_members = []
+        for worker_index, (url, _, _) in enumerate(processes):
+            for _ in range(listeners):
+                listener_index = len(room_members)
+                sio = socketio.Client()
+
+                @sio.on('new_message')
+                def on_message(data, listener_index=listener_index):
+                    sent_at = float(data['text'].rsplit(' ', 1)[1])
+                    with received_lock:
+                        received[(listener_index, data['text'])] = time.time() - sent_at
+
+                sio.connect(url, transports=['websocket'])
+                sio.call('join', {'client_id': client_id}, timeout=10)
+                sockets.append(sio)
+                room_members.append(worker_index)
+
+        senders = []
+        for url, _, _ in processes:
+            sio = socketio.Client()
+            sio.connect(url, transports=['websocket'])
+            senders.append(sio)
+        sockets.extend(senders)
+
+        started = time.time()
+        for n in range(messages):
+            senders[n % workers].emit('message', {
+                'client_id': client_id,
+                'sender_type': 'trainer',
+                'text': f"loadtest {n} {time.time():.6f}",
+            })
+        expected = messages * len(room_members)
+        deadline = time.monotonic() + settle
+        while time.monotonic() < deadline and len(received) < expected:
+            time.sleep(0.05)
+        elapsed = time.time() - started
+
+        latencies = list(received.values())
+        cross_worker = sum(1 for (listener, text) in received
+                           if room_members[listener] != int(text.split(' ')[1]) % workers)
+        print(f"workers={workers} listeners/worker={listeners} messages={messages} queue={queue}")
+        print(f"delivered {len(received)}/{expected} ({cross_worker} across processes) in {elapsed:.2f}s, "
+              f"{len(received) / elapsed:.0f} deliveries/sec")
+        if latencies:
+            print("latency ms: p50={:.1f} p95={:.1f} max={:.1f}".format(
+                _percentile(latencies, 0.5) * 1000, _percentile(latencies, 0.95) * 1000, max(latencies) * 1000))
+        if len(received) < expected:
+            print(f"Lost deliveries; worker logs are in {work_dir}")
+        return len(received) == expected
+    finally:
+        for sio in sockets:
+            sio.disconnect()
+        for _, process, log in processes:
+            process.terminate()
+            process.wait(timeout=10)
+            log.close()
+        if broker is not None:
+            broker.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--listeners', type=int, default=4, help='listening sockets per worker')
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--queue', help='message queue URL; defaults to a built-in Redis-protocol stand-in')
+    parser.add_argument('--settle', type=float, default=10.0, help='seconds to wait for deliveries')
+    args = parser.parse_args()
+    sys.exit(0 if run(args.workers, args.listeners, args.messages, args.queue, args.settle) else 1)
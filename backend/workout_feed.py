@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import deque
+
+
+class WorkoutFeed:
+    """
+    Coalesces workout-logged events for the trainer dashboard.
+
+    `publish()` only queues the event, so logging a workout never waits
+    on the socket layer. A background thread wakes when events arrive,
+    waits `interval` seconds so everyone finishing around the same time
+    shares one emit, and hands up to `max_batch` events at a time to
+    `emit`. Events are best-effort: a failed emit is logged and dropped,
+    and the dashboard can fall back to the history endpoints.
+    """
+
+    def __init__(self, emit, interval=0.25, max_batch=200, logger=None):
+        self.emit = emit
+        self.interval = interval
+        self.max_batch = max_batch
+        self.logger = logger
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def publish(self, event):
+        """Queues one event for the next batch."""
+        with self._lock:
+            self._pending.append(event)
+        self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _take(self):
+        with self._lock:
+            return [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+
+    def flush(self):
+        """Emits everything queued so far. Returns the number of events sent."""
+        sent = 0
+        while True:
+            events = self._take()
+            if not events:
+                return sent
+            try:
+                self.emit(events)
+                sent += len(events)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Failed to publish {len(events)} workout events: {e}")
+
+    def start(self):
+        """Starts the background publisher."""
+        if self._thread is not None:
+            return
+
+        def run():
+            while True:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                time.sleep(self.interval)  # Let the rest of a burst arrive
+                self.flush()
+
+        self._thread = threading.Thread(target=run, name='workout-feed', daemon=True)
+        self._thread.start()